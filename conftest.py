@@ -0,0 +1 @@
+# Makes the twista package importable by the tests in tests/ without installing it
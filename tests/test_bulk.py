@@ -0,0 +1,83 @@
+import csv
+import json
+
+import pytest
+
+from twista import bulk, compression
+
+def user(id, recorded_at, **properties):
+    return dict({
+        'type': 'user', 'id': id, 'screen_name': f"u{ id }", 'name': f"User { id }", 'followers': 1, 'verified': False,
+        'created_at': '2019-01-01T10:00:00+00:00', 'recorded_at': recorded_at
+    }, **properties)
+
+def tweet(id, by, refers_to=None, **properties):
+    t = dict({
+        'type': 'reply' if refers_to else 'status', 'id': id, 'user': by, 'text': f"tweet { id }",
+        'created_at': '2019-03-01T10:00:00+00:00', 'recorded_at': '2019-03-01T10:00:00+00:00',
+        'hashtags': [], 'urls': [], 'mentions': [], 'mentioned_ids': []
+    }, **properties)
+    if refers_to:
+        t['refers_to'] = refers_to
+    return t
+
+@pytest.fixture
+def exported(tmpdir):
+    """Exports chunks of entities (written as NDJSON recordings) with runs of at most run items, returns the CSV rows per file."""
+    def export(*chunks, run=500000):
+        files = []
+        for (i, entities) in enumerate(chunks):
+            f = str(tmpdir.join(f"recording-{ i:04d}.ndjson.gz"))
+            with compression.open(f, 'wt') as out:
+                out.writelines(json.dumps(e) + "\n" for e in entities)
+            files.append(f)
+        directory = tmpdir.join("bulk")
+        counts = bulk.export(files, str(directory), run)
+        tables = {}
+        for f in directory.listdir():
+            with open(str(f), newline='') as rows:
+                tables[f.basename] = list(csv.reader(rows))
+        return (counts, tables)
+    return export
+
+def test_nodes_keep_the_latest_recorded_snapshot(exported):
+    (counts, tables) = exported(
+        [user('1', '2019-03-02T10:00:00+00:00', name="Latest"), user('2', '2019-03-01T10:00:00+00:00')],
+        [user('1', '2019-03-01T10:00:00+00:00', name="Older"), user('1', '2019-03-01T12:00:00+00:00', name="Old")]
+    )
+    [head, *users] = tables['users.csv']
+    name = head.index('name:string')
+
+    assert counts['User'] == 2
+    assert [(u[0], u[name]) for u in users] == [('1', "Latest"), ('2', "User 2")]
+
+def test_files_have_neo4j_admin_headers(exported):
+    (_, tables) = exported([
+        user('1', '2019-03-01T10:00:00+00:00'),
+        tweet('10', '1', hashtags=['Twista'], urls=['https://example.org'])
+    ])
+
+    assert tables['users.csv'][0] == [
+        'id:ID(User)', 'type:string', 'screen_name:string', 'name:string', 'followers:long', 'verified:boolean',
+        'created_at:datetime', 'recorded_at:datetime'
+    ]
+    assert tables['users.csv'][1][5] == 'false'
+    assert tables['tweets.csv'][0][0] == 'id:ID(Tweet)'
+    assert tables['tags.csv'] == [['id:ID(Tag)'], ['TWISTA']]
+    assert tables['urls.csv'] == [['id:ID(Url)'], ['https://example.org']]
+    assert tables['posts.csv'] == [[':START_ID(User)', ':END_ID(Tweet)', ':TYPE'], ['1', '10', 'POSTS']]
+    assert tables['has_tag.csv'] == [[':START_ID(Tweet)', ':END_ID(Tag)', ':TYPE'], ['10', 'TWISTA', 'HAS_TAG']]
+    assert tables['has_url.csv'] == [[':START_ID(Tweet)', ':END_ID(Url)', ':TYPE'], ['10', 'https://example.org', 'HAS_URL']]
+
+def test_relationships_are_joined_with_nodes_across_runs(exported):
+    (counts, tables) = exported(
+        [user('1', '2019-03-01T10:00:00+00:00'), tweet('10', '1'), tweet('11', '9', refers_to='10', mentioned_ids=['1', '8'])],
+        [tweet('12', '1', refers_to='99'), tweet('13', '1', refers_to='11'), tweet('13', '1', refers_to='11')],
+        run=2
+    )
+
+    assert counts['Tweet'] == 4
+    assert tables['posts.csv'][1:] == [['1', '10', 'POSTS'], ['1', '12', 'POSTS'], ['1', '13', 'POSTS']]
+    assert sorted(tables['refers_to.csv'][1:]) == [['11', '10', 'REFERS_TO'], ['13', '11', 'REFERS_TO']]
+    assert tables['mentions.csv'][1:] == [['11', '1', 'MENTIONS']]
+    assert counts['POSTS'] == 3 and counts['REFERS_TO'] == 2 and counts['MENTIONS'] == 1
@@ -0,0 +1,63 @@
+import copy
+import json
+
+import pytest
+
+from twista.dm import TweetObject, normalize
+
+RECORDED_AT = '2019-03-01T10:00:05+00:00'
+
+def account(id, **properties):
+    return dict({
+        'id_str': id, 'name': f"User { id }", 'screen_name': f"u{ id }", 'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+        'location': None, 'description': "Über uns", 'url': None, 'verified': False,
+        'followers_count': 10, 'friends_count': 2, 'listed_count': 0, 'favourites_count': 3, 'statuses_count': 7
+    }, **properties)
+
+def status(id, by, **properties):
+    return dict({
+        'id_str': id, 'user': account(by), 'created_at': 'Fri Mar 01 10:00:00 +0000 2019', 'source': 'web',
+        'retweet_count': 0, 'favorite_count': None, 'lang': 'de', 'text': f"Tweet { id } #Twista",
+        'is_quote_status': False, 'in_reply_to_status_id_str': None,
+        'entities': {
+            'hashtags': [{ 'text': 'Twista' }], 'urls': [{ 'url': 'https://t.co/x' }],
+            'user_mentions': [{ 'screen_name': 'u2', 'id_str': '2' }, { 'screen_name': 'gone', 'id_str': None }]
+        }
+    }, **properties)
+
+quoted = status('1', '1', retweet_count=5, favorite_count=2)
+extended = { 'full_text': "A long tweet", 'entities': { 'hashtags': [], 'urls': [], 'user_mentions': [] } }
+
+PAYLOADS = {
+    'status': status('10', '1'),
+    'extended': status('11', '1', extended_tweet=extended),
+    'reply': status('12', '2', in_reply_to_status_id_str='10'),
+    'quote': status('13', '3', is_quote_status=True, quoted_status_id_str='1', quoted_status=quoted),
+    'quote without status': status('14', '3', is_quote_status=True, quoted_status_id_str='1'),
+    'retweet': status('15', '4', retweeted_status=status('10', '1', retweet_count=1)),
+    'retweet of quote': status('16', '4', is_quote_status=True, retweeted_status=status(
+        '13', '3', is_quote_status=True, quoted_status_id_str='1', quoted_status=quoted
+    )),
+    'verified user': status('17', '5', user=account('5', verified=True, url='https://example.org', location="Lübeck"))
+}
+
+def wrapped(payload):
+    """Records of a status as built by the TweetObject wrappers (before normalize)."""
+    tweet = TweetObject(payload, RECORDED_AT)
+    records = [tweet.status(), tweet.user()]
+    if tweet.is_retweet():
+        records += [tweet.retweet(), tweet.retweet().user()]
+        if tweet.retweet().is_quote() and tweet.retweet().quote():
+            records += [tweet.retweet().quote(), tweet.retweet().quote().user()]
+    if tweet.is_quote() and tweet.quote():
+        records += [tweet.quote(), tweet.quote().user()]
+    return [r.as_dict() for r in records]
+
+@pytest.mark.parametrize('kind', PAYLOADS)
+def test_normalize_is_byte_identical_to_the_wrappers(kind):
+    expected = wrapped(copy.deepcopy(PAYLOADS[kind]))
+    records = normalize(copy.deepcopy(PAYLOADS[kind]), RECORDED_AT)
+
+    for separators in [(',', ':'), None]:
+        assert [json.dumps(r, separators=separators) for r in records] == [json.dumps(r, separators=separators) for r in expected]
+    assert json.dumps(records, indent=2).encode() == json.dumps(expected, indent=2).encode()
@@ -0,0 +1,449 @@
+import json
+
+import pytest
+
+from twista import compression, neo4j
+from twista.manifest import Manifest
+from twista.memory import MemoryGraph
+from twista.seen import Seen
+
+def user(id, **properties):
+    return dict({
+        'type': 'user', 'id': id, 'screen_name': f"u{ id }", 'name': f"User { id }",
+        'created_at': '2019-01-01T10:00:00+00:00', 'recorded_at': '2019-03-01T10:00:00+00:00'
+    }, **properties)
+
+def tweet(id, by, created_at='2019-03-01T10:00:00+00:00', refers_to=None, kind=None, **properties):
+    t = dict({
+        'type': kind or ('reply' if refers_to else 'status'), 'id': id, 'user': by,
+        'created_at': created_at, 'recorded_at': created_at, 'text': f"tweet { id }",
+        'hashtags': [], 'urls': [], 'mentions': [], 'mentioned_ids': []
+    }, **properties)
+    if refers_to:
+        t['refers_to'] = refers_to
+    return t
+
+@pytest.fixture
+def chunks(tmpdir):
+    """Writes chunks of entities (as NDJSON or JSON array) to recording files in order."""
+    written = []
+
+    def write(*chunks, format='ndjson'):
+        files = []
+        for entities in chunks:
+            f = str(tmpdir.join(f"recording-{ len(written):04d}.{ format }.gz"))
+            with compression.open(f, 'wt') as out:
+                if format == 'ndjson':
+                    out.writelines(json.dumps(e) + "\n" for e in entities)
+                else:
+                    json.dump(entities, out)
+            written.append(f)
+            files.append(f)
+        return files
+    return write
+
+@pytest.fixture
+def importer(tmpdir):
+    """Creates importers of a MemoryGraph (all sharing the same seen store and manifest files)."""
+    opened = []
+
+    def create(graph, **kwargs):
+        imp = neo4j.Importer(
+            graph, seen=Seen(graph, str(tmpdir.join("imported.db"))),
+            manifest=Manifest(str(tmpdir.join("imported.log")), str(tmpdir.join("imported.json"))), **kwargs
+        )
+        opened.append(imp)
+        return imp
+    yield create
+    for imp in opened:
+        imp.seen.close()
+        imp.manifest.close()
+
+def run(importer, files, stream=False):
+    neo4j.importing(importer, importer.manifest.pending(files), 0, None, stream)
+
+def cascade(graph, id):
+    t = graph.nodes['Tweet'][id]
+    return (t['root'], t['depth'])
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_references_arriving_before_their_tweets_are_linked(chunks, importer, stream):
+    graph = MemoryGraph()
+    neo4j.create_indexes(graph)
+    files = chunks(
+        [user('1'), tweet('30', '1', refers_to='20')],
+        [tweet('20', '1', refers_to='10')],
+        [tweet('10', '1'), tweet('31', '1', refers_to='30')]
+    )
+    run(importer(graph), files, stream)
+
+    assert graph.relationships['REFERS_TO'] == { ('30', '20'), ('20', '10'), ('31', '30') }
+    assert [cascade(graph, i) for i in ['10', '20', '30', '31']] == [('10', 0), ('10', 1), ('10', 2), ('10', 3)]
+    assert not [t for t in graph.nodes['Tweet'].values() if 'ref' in t]
+
+def test_references_to_missing_tweets_stay_pending(chunks, importer):
+    graph = MemoryGraph()
+    run(importer(graph), chunks([user('1'), tweet('30', '1', refers_to='20')]))
+
+    assert graph.relationships['REFERS_TO'] == set()
+    assert graph.nodes['Tweet']['30']['ref'] == '20'
+    assert cascade(graph, '30') == ('30', 0)
+
+def test_importer_does_not_load_the_recorder():
+    import os
+    import subprocess
+    import sys
+    loaded = subprocess.check_output([
+        sys.executable, '-c', "import sys, twista.neo4j; print(' '.join(sorted(sys.modules)))"
+    ], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), universal_newlines=True).split()
+    assert 'twista.recorder' not in loaded
+    assert 'tweepy' not in loaded
+
+class Interrupted(Exception):
+    pass
+
+class InterruptingGraph(MemoryGraph):
+    """MemoryGraph failing the n-th batch of a statement (once)."""
+
+    def __init__(self, statement, n):
+        super().__init__()
+        self.failing = (statement, n)
+        self.calls = 0
+
+    def execute(self, statement, parameters, undo):
+        if self.failing and statement == self.failing[0]:
+            self.calls += 1
+            if self.calls == self.failing[1]:
+                self.failing = None
+                raise Interrupted()
+        return super().execute(statement, parameters, undo)
+
+def snapshot(graph):
+    return (graph.nodes, graph.relationships, graph.rollups, graph.references)
+
+def conversation(n=12):
+    entities = [user(str(u)) for u in range(3)]
+    entities += [tweet(str(i), str(i % 3), refers_to=str(i - 1) if i % 4 else None, hashtags=[f"tag{ i % 5 }"]) for i in range(n)]
+    return entities
+
+def imported(chunks, importer, files, graph=None):
+    graph = graph or MemoryGraph()
+    imp = importer(graph, batch_sizes={ 'tweets': 4, 'posts': 4, 'refers': 4, 'tags': 4 })
+    run(imp, files)
+    return (graph, imp)
+
+def test_interrupted_import_resumes_after_the_last_batch(chunks, importer, tmpdir):
+    files = chunks(conversation())
+    (expected, _) = imported(chunks, importer, chunks(conversation()))
+    tmpdir.join("imported.db").remove()
+    tmpdir.join("imported.log").remove()
+
+    graph = InterruptingGraph(neo4j.merge_posts, 2)
+    with pytest.raises(Interrupted):
+        imported(chunks, importer, files, graph)
+    (_, resumed) = imported(chunks, importer, files, graph)
+
+    assert [(t['stage'], t['batch']) for t in resumed.timings][0] == ('posts', 1)
+    assert snapshot(graph) == snapshot(expected)
+
+def test_resume_starts_over_if_the_seen_store_changed(chunks, importer, tmpdir):
+    files = chunks(conversation())
+    (expected, _) = imported(chunks, importer, chunks(conversation()))
+    tmpdir.join("imported.db").remove()
+    tmpdir.join("imported.log").remove()
+
+    graph = InterruptingGraph(neo4j.create_tweets, 2)
+    with pytest.raises(Interrupted):
+        imported(chunks, importer, files, graph)
+    # Rebuilt from the graph, the seen store knows the tweets of the first batch (which changes the split of the chunk)
+    tmpdir.join("imported.db").remove()
+    (_, resumed) = imported(chunks, importer, files, graph)
+
+    assert ('new_tweets', 0) in [(t['stage'], t['batch']) for t in resumed.timings]
+    assert set(graph.nodes['Tweet']) == set(expected.nodes['Tweet'])
+    assert snapshot(graph) == snapshot(expected)
+
+def test_import_benchmark_keeps_the_working_directory(tmpdir, monkeypatch):
+    import os
+    from twista import benchmark
+    monkeypatch.chdir(tmpdir)
+    result = benchmark.importing(chunks=2, n=200)
+    assert os.getcwd() == str(tmpdir)
+    assert tmpdir.listdir() == []
+    assert result['nodes'] > 0
+
+def test_follower_keeps_one_pool_of_preparing_processes(chunks, tmpdir, monkeypatch):
+    pools = []
+    create = neo4j.preparers
+
+    def preparers(*args):
+        pools.append(create(*args))
+        return pools[-1]
+
+    polls = []
+
+    def sleep(seconds):
+        polls.append(seconds)
+        if len(polls) == 2:
+            chunks(conversation())
+        if len(polls) == 4:
+            raise KeyboardInterrupt()
+
+    monkeypatch.setattr(neo4j, 'preparers', preparers)
+    monkeypatch.setattr(neo4j.time, 'sleep', sleep)
+    graph = MemoryGraph()
+    chunks([user('9'), tweet('99', '9')])
+    follower = neo4j.Follower(
+        graph, str(tmpdir), prefetch=2, poll=0, settle=0,
+        manifest=str(tmpdir.join("imported.log")), seen=str(tmpdir.join("imported.db"))
+    )
+    follower.run()
+
+    assert len(pools) == 1
+    assert follower.chunks == 2
+    assert '99' in graph.nodes['Tweet'] and '11' in graph.nodes['Tweet']
+
+def mixed():
+    return [
+        user('1'), user('2'),
+        tweet('100', '1', hashtags=['Twista', 'neo4j'], urls=['https://example.org/a'], mentions=['u2'], mentioned_ids=['2']),
+        tweet('101', '2', created_at='2019-03-02T08:00:00+00:00', refers_to='100', kind='retweet', hashtags=['twista']),
+        tweet('102', '2', created_at='2019-03-02T09:00:00+00:00', refers_to='101', mentions=['u1'], mentioned_ids=['1']),
+        user('1', name="Renamed")
+    ]
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_import_stages_write_nodes_relationships_and_rollups(chunks, importer, stream):
+    graph = MemoryGraph()
+    run(importer(graph), chunks(mixed()), stream)
+
+    assert set(graph.nodes['User']) == { '1', '2' }
+    assert graph.nodes['User']['1']['name'] == "Renamed"
+    assert set(graph.nodes['Tweet']) == { '100', '101', '102' }
+    assert set(graph.nodes['Tag']) == { 'TWISTA', 'NEO4J' }
+    assert set(graph.nodes['Url']) == { 'https://example.org/a' }
+    assert graph.relationships['POSTS'] == { ('1', '100'), ('2', '101'), ('2', '102') }
+    assert graph.relationships['REFERS_TO'] == { ('101', '100'), ('102', '101') }
+    assert graph.relationships['MENTIONS'] == { ('100', '2'), ('102', '1') }
+    assert graph.relationships['HAS_TAG'] == { ('100', 'TWISTA'), ('100', 'NEO4J'), ('101', 'TWISTA') }
+    assert graph.relationships['HAS_URL'] == { ('100', 'https://example.org/a') }
+    assert [cascade(graph, i) for i in ['100', '101', '102']] == [('100', 0), ('100', 1), ('100', 2)]
+    assert { d: (n['tweets'], n['posters']) for (d, n) in graph.nodes['Day'].items() } == { '2019-03-01': (1, 1), '2019-03-02': (2, 1) }
+    assert graph.rollups[('USED_ON', 'Tag', 'TWISTA', '2019-03-02')] == { 'n': 1 }
+    assert graph.rollups[('ACTIVE_ON', 'User', '2', '2019-03-01')] == { 'posts': 0, 'mentions': 1 }
+
+@pytest.mark.parametrize('format, stream', [('ndjson', True), ('json', False), ('json', True)])
+def test_import_modes_and_formats_write_the_same_graph(chunks, importer, tmpdir, format, stream):
+    (expected, _) = imported(chunks, importer, chunks(conversation(), mixed()))
+    tmpdir.join("imported.db").remove()
+    tmpdir.join("imported.log").remove()
+
+    graph = MemoryGraph()
+    run(importer(graph), chunks(conversation(), mixed(), format=format), stream)
+
+    assert snapshot(graph) == snapshot(expected)
+
+def raw_rollups(graph):
+    """Rollups counted from the tweets and relationships of the graph, like the raw queries of the navigator."""
+    from collections import Counter
+    day = lambda id: graph.nodes['Tweet'][id]['created_at'][:10]
+    tweets = graph.nodes['Tweet'].values()
+    days = {
+        d: { 'date': d, 'tweets': n, 'posters': len({ u for (u, t) in graph.relationships['POSTS'] if day(t) == d }) }
+        for (d, n) in Counter(t['created_at'][:10] for t in tweets).items()
+    }
+    rollups = {}
+    for ((kind, d), n) in Counter((t['type'], t['created_at'][:10]) for t in tweets).items():
+        rollups[('USED_ON', 'TweetType', kind, d)] = { 'n': n }
+    for ((tag, d), n) in Counter((tag, day(t)) for (t, tag) in graph.relationships['HAS_TAG']).items():
+        rollups[('USED_ON', 'Tag', tag, d)] = { 'n': n }
+    posts = Counter((u, day(t)) for (u, t) in graph.relationships['POSTS'])
+    mentions = Counter((u, day(t)) for (t, u) in graph.relationships['MENTIONS'])
+    for (u, d) in set(posts) | set(mentions):
+        rollups[('ACTIVE_ON', 'User', u, d)] = { 'posts': posts[(u, d)], 'mentions': mentions[(u, d)] }
+    return (days, rollups)
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_rollups_match_raw_counts_when_imported_and_rebuilt(chunks, importer, stream):
+    graph = MemoryGraph()
+    run(importer(graph, batch_sizes={ 'tweets': 4, 'posts': 4, 'tags': 4 }), chunks(conversation(), mixed()), stream)
+    (days, rollups) = raw_rollups(graph)
+
+    assert graph.nodes['Day'] == days
+    assert graph.rollups == rollups
+    assert neo4j.rebuild_rollups(graph) == 2
+    assert graph.nodes['Day'] == days
+    assert graph.rollups == rollups
+
+class FlakyGraph(MemoryGraph):
+    """MemoryGraph failing the first n transactions of a statement with a transient error."""
+
+    def __init__(self, statement, n):
+        super().__init__()
+        self.flaky = (statement, n)
+        self.failures = 0
+
+    def execute(self, statement, parameters, undo):
+        if statement == self.flaky[0] and self.failures < self.flaky[1]:
+            self.failures += 1
+            raise neo4j.TransientError("deadlock")
+        return super().execute(statement, parameters, undo)
+
+def test_transient_errors_are_retried(chunks, importer):
+    graph = FlakyGraph(neo4j.merge_posts, 2)
+    imp = importer(graph, backoff=0)
+    run(imp, chunks(mixed()))
+
+    assert [t['attempts'] for t in imp.timings if t['stage'] == 'posts'] == [3]
+    assert len(graph.relationships['POSTS']) == 3
+
+def test_batches_failing_more_often_than_retries_fail_the_import(chunks, importer):
+    graph = FlakyGraph(neo4j.merge_posts, 3)
+    with pytest.raises(neo4j.TransientError):
+        run(importer(graph, retries=2, backoff=0), chunks(mixed()))
+    assert graph.relationships['POSTS'] == set()
+
+def test_nodes_created_by_someone_else_are_merged(chunks, importer, monkeypatch):
+    graph = MemoryGraph()
+    graph.nodes['User']['1'] = { 'id': '1', 'name': "Existing" }
+    imp = importer(graph)
+    monkeypatch.setattr(imp.seen, 'unknown', lambda label, ids: list(dict.fromkeys(ids)))
+    run(imp, chunks(mixed()))
+
+    assert graph.nodes['User']['1']['name'] == "Renamed"
+    assert set(graph.nodes['User']) == { '1', '2' }
+
+def test_seen_store_of_another_graph_is_rebuilt(chunks, importer, tmpdir):
+    run(importer(MemoryGraph()), chunks([user('1'), tweet('1', '1', hashtags=['A'], urls=['https://a.org'])]))
+    # The database is reset and loaded with more tags and urls than the store knows (e.g. by a bulk load)
+    graph = MemoryGraph()
+    other = neo4j.Importer(
+        graph, seen=Seen(graph, str(tmpdir.join("other.db"))),
+        manifest=Manifest(str(tmpdir.join("other.log")), str(tmpdir.join("other.json")))
+    )
+    run(other, chunks([user('2'), tweet('2', '2', hashtags=['B', 'C'], urls=['https://b.org', 'https://c.org'])]))
+    other.seen.close()
+    other.manifest.close()
+    run(importer(graph), chunks([user('1'), tweet('1', '1', hashtags=['A'], urls=['https://a.org'])]))
+
+    assert ('1', 'A') in graph.relationships['HAS_TAG']
+    assert ('1', 'https://a.org') in graph.relationships['HAS_URL']
+
+def write(tmpdir, name, text):
+    f = str(tmpdir.join(name))
+    with compression.open(f, 'wt') as out:
+        out.write(text)
+    return f
+
+TRICKY = [
+    { 'type': 'status', 'id': '1', 'text': "brackets ] [ and, commas", 'hashtags': [] },
+    { 'type': 'status', 'id': '2', 'text': "escaped \" quotes \\ and }{ braces", 'nested': { 'a': [1, 2, { 'b': None }] } },
+    { 'type': 'user', 'id': '3', 'name': "Ünïcödé 🐦", 'description': "\n\t" }
+]
+
+@pytest.mark.parametrize('block', [1, 2, 7, 64, 1 << 16])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_array_chunks_are_parsed_across_block_boundaries(tmpdir, block, indent):
+    f = write(tmpdir, "recording-0000.json.gz", json.dumps(TRICKY, indent=indent))
+    assert list(neo4j.entities(f, block)) == TRICKY
+
+@pytest.mark.parametrize('text, entities', [
+    ("", []),
+    ("[]", []),
+    (" \n [ \n ] \n", []),
+    ("\n" + "\n\n".join(json.dumps(e) for e in TRICKY) + "\n\n", TRICKY)
+])
+def test_empty_and_ndjson_chunks_are_parsed(tmpdir, text, entities):
+    f = write(tmpdir, "recording-0000.json.gz", text)
+    assert list(neo4j.entities(f, 3)) == entities
+    assert neo4j.read_chunk(f) == entities
+
+@pytest.mark.parametrize('cut', [-20, -1, -len(json.dumps(TRICKY[-1])) - 1])
+def test_truncated_array_chunks_fail(tmpdir, cut):
+    f = write(tmpdir, "recording-0000.json.gz", json.dumps(TRICKY)[:cut])
+    with pytest.raises(json.JSONDecodeError):
+        list(neo4j.entities(f, 8))
+
+def test_rows_match_the_legacy_row_builder():
+    from twista import benchmark
+    legacy = benchmark.legacy_rows(benchmark.chunk(2000, seed=7))
+    rows = neo4j.rows(benchmark.chunk(2000, seed=7))
+
+    for stage in ['users', 'tweets', 'posts', 'refers', 'mentions', 'tag_rels', 'url_rels']:
+        assert rows[stage] == legacy[stage], stage
+    # Tags are identified by the uppercased hashtag (the legacy builder created them as recorded)
+    assert rows['tags'] == list(dict.fromkeys(r['tag'] for r in rows['tag_rels']))
+    assert set(rows['tags']) == { neo4j.tag_id(tag) for tag in legacy['tags'] }
+    assert sorted(rows['urls']) == sorted(legacy['urls'])
+
+def test_rows_strip_relationship_fields_from_tweets():
+    data = mixed()
+    rows = neo4j.rows(data)
+    assert all(not { 'hashtags', 'urls', 'mentions', 'mentioned_ids' } & set(t) for t in rows['tweets'])
+    assert rows['tweets'][0] is data[2]
+
+def test_profile_reports_phases_and_stages_per_chunk(chunks, tmpdir, capsys):
+    files = chunks(conversation(), mixed())
+    profile = str(tmpdir.join("profile.json"))
+    graph = MemoryGraph()
+    importer = neo4j.import_records(
+        graph, files, 0, None, { 'tweets': 4 }, profile=profile,
+        manifest=str(tmpdir.join("imported.log")), seen=str(tmpdir.join("imported.db"))
+    )
+    importer.seen.close()
+    with open(profile) as f:
+        report = json.load(f)
+
+    assert [c['chunk'] for c in report['chunks']] == files
+    for c in report['chunks']:
+        assert { 'decompress', 'parse', 'rows', 'split', 'chunk' } <= set(c['phases'])
+    first = report['chunks'][0]['stages']
+    assert (first['new_tweets']['rows'], first['new_tweets']['batches']) == (12, 3)
+    # Tweets and the Day and TweetType nodes of their rollups
+    assert first['new_tweets']['counters']['nodes_created'] == 12 + 1 + 2
+    # Taggings and the USED_ON relationships of the five tags
+    assert first['tag_rels']['counters']['relationships_created'] == 12 + 5
+    summary = report['summary']['stages']
+    assert summary['posts']['rows'] == sum(c['stages']['posts']['rows'] for c in report['chunks']) == 15
+    assert summary['posts']['retries'] == 0
+    out = capsys.readouterr().out
+    assert "slowest" in out and "new_tweets" in out
+
+def test_timings_have_no_counters_without_profile(chunks, importer):
+    imp = importer(MemoryGraph())
+    run(imp, chunks(mixed()))
+    assert imp.timings and all('counters' not in t for t in imp.timings)
+    assert imp.phases == []
+
+def test_follower_imports_complete_chunks_once(chunks, tmpdir, monkeypatch):
+    import os
+    from twista.compression import PART
+    [settled, partial, fresh] = chunks([user('1'), tweet('1', '1')], [tweet('2', '1')], [tweet('3', '1')])
+    os.rename(partial, partial + PART)
+    tmpdir.join("recording-0003.wal").write("{}\n")
+    for f in [settled, partial + PART]:
+        os.utime(f, (0, 0))
+    graph = MemoryGraph()
+    follower = neo4j.Follower(
+        graph, str(tmpdir), poll=0, settle=60,
+        manifest=str(tmpdir.join("imported.log")), seen=str(tmpdir.join("imported.db"))
+    )
+    polls = []
+
+    def sleep(seconds):
+        polls.append((sorted(graph.nodes['Tweet']), follower.chunks, follower.pending))
+        if len(polls) == 1:
+            os.rename(partial + PART, partial)
+            for f in [partial, fresh]:
+                os.utime(f, (0, 0))
+        if len(polls) == 3:
+            raise KeyboardInterrupt()
+
+    monkeypatch.setattr(neo4j.time, 'sleep', sleep)
+    follower.run()
+
+    assert polls == [(['1'], 1, 0), (['1', '2', '3'], 3, 0), (['1', '2', '3'], 3, 0)]
+    assert follower.max_lag > 0
+    metrics = { name: samples[0][1] for (name, _, _, samples) in follower.metrics() }
+    assert metrics['twista_import_chunks_total'] == 3
+    assert metrics['twista_import_rows_total'] > 0
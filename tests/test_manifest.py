@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from twista.manifest import Manifest
+
+@pytest.fixture
+def checksums(monkeypatch):
+    """Counts the chunks checksummed by manifests."""
+    summed = []
+    checksum = Manifest.checksum
+
+    def counting(self, f):
+        summed.append(f)
+        return checksum(self, f)
+    monkeypatch.setattr(Manifest, 'checksum', counting)
+    return summed
+
+def imported(tmpdir, f):
+    manifest = Manifest(str(tmpdir.join("imported.log")))
+    for chunk in manifest.pending([f]):
+        manifest.begin(chunk, "seen")
+        manifest.done(chunk)
+    manifest.close()
+
+def test_touched_chunks_are_checksummed_once(tmpdir, checksums):
+    f = tmpdir.join("recording-0000.json.gz")
+    f.write("content")
+    imported(tmpdir, str(f))
+    os.utime(str(f), (0, 0))
+
+    for _ in range(3):
+        manifest = Manifest(str(tmpdir.join("imported.log")))
+        assert manifest.pending([str(f)]) == []
+        manifest.close()
+    assert len(checksums) == 2
+
+def test_modified_chunks_are_imported_again(tmpdir, checksums):
+    f = tmpdir.join("recording-0000.json.gz")
+    f.write("content")
+    imported(tmpdir, str(f))
+    f.write("changed")
+    os.utime(str(f), (0, 0))
+
+    manifest = Manifest(str(tmpdir.join("imported.log")))
+    assert manifest.pending([str(f)]) == [str(f)]
+
+def test_restarted_imports_of_unchanged_chunks_keep_their_checksum(tmpdir, checksums):
+    f = str(tmpdir.join("recording-0000.json.gz"))
+    with open(f, 'w') as chunk:
+        chunk.write("content")
+    manifest = Manifest(str(tmpdir.join("imported.log")))
+    manifest.begin(f, "seen")
+    manifest.progress(f, 'users', 0, { 'users': 10 })
+    manifest.close()
+
+    manifest = Manifest(str(tmpdir.join("imported.log")))
+    assert manifest.pending([f]) == [f]
+    assert manifest.begin(f, "changed") == {}
+    assert checksums == [f]
+    assert manifest.state[f]['checksum'] == manifest.checksum(f)
@@ -0,0 +1,30 @@
+import pytest
+
+from twista import neo4j, seen
+from twista.memory import MemoryGraph
+
+def handled(graph):
+    return set(graph.statements) | set(graph.rebuilds) | set(graph.queries)
+
+def test_every_import_stage_has_a_handler():
+    graph = MemoryGraph()
+    for (stage, statement, _, _) in neo4j.STAGES:
+        assert statement in graph.statements, stage
+    for (stage, (_, _, merge)) in neo4j.CREATING.items():
+        assert merge in graph.statements, stage
+
+def test_every_statement_of_the_importer_has_a_handler():
+    graph = MemoryGraph()
+    constants = { k: v for (k, v) in vars(neo4j).items() if isinstance(v, str) and k.islower() and not k.startswith('_') }
+    statements = handled(graph)
+    # Tails are only run as part of the statements they are appended to
+    tails = { k for (k, v) in constants.items() if v not in statements and any(v in s for s in statements) }
+    assert set(constants) - tails - { k for (k, v) in constants.items() if v in statements } == set()
+    assert set(neo4j.SCHEMA) | set(neo4j.FULLTEXT.values()) <= statements
+    assert seen.graph_identity in statements
+    for label in seen.LABELS:
+        assert { seen.count_nodes.format(label), seen.node_ids.format(label) } <= statements
+
+def test_unknown_statements_are_not_supported():
+    with pytest.raises(NotImplementedError):
+        MemoryGraph().run("MATCH (t:Tweet) RETURN t")
@@ -0,0 +1,54 @@
+import threading
+
+from twista.metrics import Metrics, prometheus
+
+METRICS = [
+    ("twista_statuses_total", "counter", "Statuses received", [({}, 30)]),
+    ("twista_entities_total", "counter", "Entities by type", [({'type': 'user'}, 10), ({'type': 'status'}, 20)]),
+    ("twista_writer_queue_depth", "gauge", "Chunks waiting", [({}, 2)])
+]
+
+def test_metrics_are_rendered_in_prometheus_format():
+    assert prometheus(METRICS).splitlines() == [
+        "# HELP twista_statuses_total Statuses received",
+        "# TYPE twista_statuses_total counter",
+        "twista_statuses_total 30",
+        "# HELP twista_entities_total Entities by type",
+        "# TYPE twista_entities_total counter",
+        'twista_entities_total{type="user"} 10',
+        'twista_entities_total{type="status"} 20',
+        "# HELP twista_writer_queue_depth Chunks waiting",
+        "# TYPE twista_writer_queue_depth gauge",
+        "twista_writer_queue_depth 2"
+    ]
+
+def test_status_line_reports_counters_as_rates():
+    metrics = Metrics(lambda: METRICS)
+    assert metrics.status_line(METRICS, 10).endswith("statuses 3.0/s, entities 3.0/s, writer_queue_depth 2")
+    assert metrics.status_line(METRICS, 10).endswith("statuses 0.0/s, entities 0.0/s, writer_queue_depth 2")
+
+def test_stop_waits_for_a_running_export(tmpdir):
+    exporting = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def collect():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            exporting.set()
+            release.wait(5)
+        return [("twista_statuses_total", "counter", "Statuses received", [({}, len(calls))])]
+
+    metrics = Metrics(collect, str(tmpdir.join("metrics.prom")), interval=0.01)
+    metrics.start()
+    assert exporting.wait(5)
+    stopping = threading.Thread(target=metrics.stop)
+    stopping.start()
+    stopping.join(0.2)
+    assert stopping.is_alive()
+    release.set()
+    stopping.join(5)
+
+    assert calls == ["twista-metrics", stopping.name]
+    assert tmpdir.join("metrics.prom").read().endswith("twista_statuses_total 2\n")
+    assert not tmpdir.join("metrics.prom.tmp").exists()
@@ -0,0 +1,185 @@
+import pytest
+from neo4j import Record
+from neo4j.types.graph import Graph
+
+from twista import neo4j
+import twista.navigator as nav
+
+class ScriptedGraph:
+    """Answers navigator queries by the first handler whose marker is part of the statement."""
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.statements = []
+
+    def run(self, statement, **params):
+        self.statements.append(statement)
+        if statement == neo4j.current_generation:
+            return nav.Records([Record([('generation', 1)])])
+        for marker, handler in self.handlers:
+            if marker in statement:
+                return nav.Records([Record(r.items()) for r in handler(**params)])
+        raise AssertionError(f"Unexpected query { statement }")
+
+@pytest.fixture
+def navigator(monkeypatch):
+    def use(handlers):
+        graph = ScriptedGraph(handlers)
+        monkeypatch.setattr(nav, 'graph', graph)
+        monkeypatch.setattr(nav, 'cache', nav.Cache())
+        return nav.app.test_client()
+    return use
+
+def user(result, n, id):
+    """A user node as hydrated by the driver, nodes of different results are never equal."""
+    return result.put_node(n, ['User'], { 'id': id, 'screen_name': f"user{ id }" })
+
+def test_network_nodes_are_unique_across_hops(navigator):
+    retweets = { '1': ['2', '3'], '2': ['1', '3'], '3': ['2'] }
+
+    def hop(uids, **params):
+        result = Graph()
+        return [
+            { 'u': user(result, int(uid), uid), 'rt': user(result, int(rt), rt), 'n': 1 }
+            for uid in uids for rt in retweets[uid]
+        ]
+
+    client = navigator([
+        (":REFERS_TO", hop),
+        ("RETURN u", lambda id, **params: [{ 'u': user(Graph(), int(id), id) }])
+    ])
+    network = client.get('/user/1/network').get_json()
+
+    ids = [n['data']['id'] for n in network['nodes']]
+    assert sorted(ids) == ['1', '2', '3']
+    assert [n['data']['select'] for n in network['nodes'] if n['data']['id'] == '1'] == ['start']
+    assert len(network['edges']) == 5
+
+def test_tag_dashboard_reads_volume_of_whole_days_from_rollups(navigator):
+    from datetime import date
+    queries = []
+
+    def dashboard(id, first, last, edges, **params):
+        queries.append((id, first, last, edges))
+        return [
+            { 'widget': 'behaviour', 'key': 'status', 'n': 4 },
+            { 'widget': 'behaviour', 'key': 'reply', 'n': 2 },
+            { 'widget': 'volume', 'key': date(2019, 3, 2), 'n': 3 },
+            { 'widget': 'volume', 'key': date(2019, 3, 3), 'n': 1 },
+            { 'widget': 'volume:edges', 'key': date(2019, 3, 1), 'n': 2 },
+            { 'widget': 'tags', 'key': 'OTHER', 'n': 5 }
+        ]
+
+    client = navigator([("UNION ALL", dashboard)])
+    response = client.get('/tag/twista/dashboard?begin=2019-03-01T12:00:00&end=2019-03-04T00:00:00')
+    data = response.get_json()
+
+    assert queries == [('twista', '2019-03-02', '2019-03-04', [
+        ['2019-03-01T12:00:00', '2019-03-01T23:59:59.999999999Z'], ['2019-03-04', '2019-03-04T00:00:00']
+    ])]
+    statement = [s for s in nav.graph.statements if "UNION ALL" in s][0]
+    assert "toUpper(tag.id)" not in statement
+    assert data['volume'] == [{ 'x': ['2019-03-01', '2019-03-02', '2019-03-03'], 'y': [2, 3, 1], 'type': 'scatter', 'name': 'posts' }]
+    assert data['behaviour'] == [{ 'labels': ['reply', 'status'], 'values': [2, 4], 'type': 'pie' }]
+    assert "OTHER" in data['tags']
+
+@pytest.mark.parametrize('begin, end, days, edges', [
+    ('2019-03-01', '2019-03-04', ('2019-03-01', '2019-03-04'), [('2019-03-04', '2019-03-04')]),
+    ('2019-03-01T12:00:00', '2019-03-03T06:00:00', ('2019-03-02', '2019-03-03'),
+        [('2019-03-01T12:00:00', '2019-03-01T23:59:59.999999999Z'), ('2019-03-03', '2019-03-03T06:00:00')]),
+    ('2019-03-01T01:00:00+02:00', '2019-03-02', ('2019-03-01', '2019-03-02'),
+        [('2019-03-01T01:00:00+02:00', '2019-02-28T23:59:59.999999999Z'), ('2019-03-02', '2019-03-02')]),
+    ('2019-03-01T12:00:00', '2019-03-01T18:00:00', None, [('2019-03-01T12:00:00', '2019-03-01T18:00:00')])
+])
+def test_rolled_up_splits_whole_days_from_edges(begin, end, days, edges):
+    assert nav.rolled_up(begin, end) == (days, edges)
+
+def test_combined_adds_edges_to_whole_days():
+    counts = nav.combined(('2019-03-01', '2019-03-04'), [('A', 3), (['1', 'u1'], 2)], [('A', 1), ('B', 2), (['1', 'u1'], 1)])
+    assert counts == { 'A': 4, 'B': 2, ('1', 'u1'): 3 }
+
+def test_combined_looks_up_whole_days_of_edge_keys_missing_in_top(navigator):
+    lookups = []
+
+    def lookup(first, last, keys, **params):
+        lookups.append((first, last, keys))
+        return [{ 'key': 'C', 'n': 4 }]
+
+    navigator([("LOOKUP", lookup)])
+    counts = nav.combined(('2019-03-01', '2019-03-04'), [('A', 5), ('B', 3)], [('B', 1), ('C', 2)], "LOOKUP", 2)
+
+    assert lookups == [('2019-03-01', '2019-03-04', ['C'])]
+    assert counts == [('C', 6), ('A', 5)]
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+class Generations:
+    def __init__(self):
+        self.generation = 1
+
+    def run(self, statement, **params):
+        assert statement == neo4j.current_generation
+        return nav.Records([Record([('generation', self.generation)])])
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(nav.time, 'monotonic', clock)
+    return clock
+
+def test_cache_evicts_least_recently_used(clock, monkeypatch):
+    monkeypatch.setattr(nav, 'graph', Generations())
+    cache = nav.Cache(size=2)
+    cache.validate()
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.stats()['evictions'] == 1
+
+def test_cache_serves_expired_entries_only_as_stale(clock, monkeypatch):
+    monkeypatch.setattr(nav, 'graph', Generations())
+    cache = nav.Cache(ttl=10)
+    cache.validate()
+    cache.put('a', 1)
+    clock.now += 5
+    assert cache.get('a') == 1
+    clock.now += 10
+
+    assert cache.get('a') is None
+    assert cache.get('a') is None
+    assert cache.stale('a') == 1
+    assert cache.stats()['expirations'] == 1
+    assert cache.stale('b') is None
+
+def test_cache_is_invalidated_by_a_new_generation(clock, monkeypatch):
+    generations = Generations()
+    monkeypatch.setattr(nav, 'graph', generations)
+    cache = nav.Cache(check=5)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    cache.put('a', 1)
+    generations.generation = 2
+    assert cache.get('a') == 1
+    clock.now += 5
+
+    assert cache.get('a') is None
+    assert cache.stats()['invalidations'] == 2
+    assert cache.stats()['generation'] == 2
+
+def test_cache_keeps_entries_while_the_generation_is_unavailable(clock, monkeypatch):
+    class Down:
+        def run(self, statement, **params):
+            raise nav.Unavailable("down")
+
+    monkeypatch.setattr(nav, 'graph', Down())
+    cache = nav.Cache()
+    cache.put('a', 1)
+    assert cache.get('a') == 1
@@ -0,0 +1,74 @@
+import json
+import os
+import signal
+import threading
+import time
+
+from twista.pipeline import Pipeline
+
+class Collecting:
+    """Stands in for the recorder, keeps the collected records."""
+
+    def __init__(self):
+        self.statuses = 0
+        self.records = []
+
+    def collect(self, records):
+        self.records.extend(records)
+
+    def tweets(self):
+        return [r['id'] for r in self.records if r['type'] != 'user']
+
+def status(id):
+    return json.dumps({
+        'id_str': str(id), 'created_at': 'Wed Oct 10 20:19:24 +0000 2018', 'text': f"status { id }",
+        'source': 'web', 'lang': 'de', 'retweet_count': 0, 'favorite_count': 0,
+        'is_quote_status': False, 'in_reply_to_status_id': None, 'in_reply_to_status_id_str': None,
+        'entities': { 'hashtags': [], 'urls': [], 'user_mentions': [] },
+        'user': {
+            'id_str': '1', 'name': 'User', 'screen_name': 'user', 'created_at': 'Wed Oct 10 20:19:24 +0000 2018',
+            'location': None, 'description': None, 'url': None, 'verified': False, 'followers_count': 0,
+            'friends_count': 0, 'listed_count': 0, 'favourites_count': 0, 'statuses_count': 0
+        }
+    })
+
+def stop(pipeline, timeout=30):
+    stopping = threading.Thread(target=pipeline.stop, daemon=True)
+    stopping.start()
+    stopping.join(timeout)
+    assert not stopping.is_alive(), "pipeline did not stop"
+
+def test_records_are_forwarded_in_arrival_order():
+    recorder = Collecting()
+    pipeline = Pipeline(recorder, workers=3)
+    for i in range(200):
+        pipeline.on_data(status(i))
+    pipeline.on_data('{"limit": {"track": 1}}')
+    stop(pipeline)
+    assert recorder.tweets() == [str(i) for i in range(200)]
+    assert recorder.statuses == 200
+
+def test_crashed_worker_is_replaced():
+    recorder = Collecting()
+    pipeline = Pipeline(recorder, workers=2)
+    os.kill(pipeline.workers[0].pid, signal.SIGKILL)
+    pipeline.workers[0].join()
+    for i in range(50):
+        pipeline.on_data(status(i))
+    stop(pipeline)
+    assert recorder.tweets() == [str(i) for i in range(50)]
+    assert pipeline.restarts == 1
+
+def test_sequence_numbers_of_crashed_workers_are_skipped():
+    recorder = Collecting()
+    pipeline = Pipeline(recorder, workers=1, timeout=0.5)
+    # Payload 0 was taken by a worker that crashed, payloads 1 and 2 are normalized
+    pipeline.seq = 3
+    pipeline.results.put((1, [{ 'type': 'status', 'id': '1' }]))
+    pipeline.results.put((2, [{ 'type': 'status', 'id': '2' }]))
+    deadline = time.monotonic() + 10
+    while len(recorder.records) < 2 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert recorder.tweets() == ['1', '2']
+    assert pipeline.lost == 1
+    stop(pipeline)
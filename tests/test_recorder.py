@@ -0,0 +1,166 @@
+import pytest
+
+from twista import compression
+from twista.recorder import Recorder
+
+@pytest.mark.parametrize('codec, level', [('bz2', 0), ('gzip', 10), ('lzma', -1), ('none', 1), ('zstd', None)])
+def test_invalid_codec_or_level_fails_before_recording(tmpdir, codec, level):
+    with pytest.raises(ValueError):
+        Recorder(10, directory=str(tmpdir), codec=codec, level=level)
+    assert tmpdir.listdir() == []
+
+@pytest.mark.parametrize('codec, level, effective', [('gzip', None, 9), ('bz2', 1, 1), ('lzma', 0, 0), ('none', None, None)])
+def test_level_defaults_to_codec(codec, level, effective):
+    assert compression.level(codec, level) == effective
+
+def test_write_ahead_segment_is_synced_on_a_quiet_stream(tmpdir, monkeypatch):
+    import os
+    import time
+    from twista.recorder import Segment
+
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: (synced.append(fd), fsync(fd)))
+    segment = Segment(str(tmpdir), 'json', 'gzip', None, n=1000, ms=100)
+    segment.append('{"type":"status","id":"1"}\n')
+    deadline = time.monotonic() + 5
+    while not synced and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert synced
+    with open(segment.path) as f:
+        assert f.read().splitlines()[1] == '{"type":"status","id":"1"}'
+    segment.remove()
+    assert tmpdir.listdir() == []
+
+def profile(id, name, followers):
+    return {
+        'twista': '0.3.3', 'type': 'user', 'id': id, 'name': name, 'screen_name': f"u{ id }", 'created_at': '2018-10-10T20:19:24+00:00',
+        'recorded_at': '2018-10-11T10:00:00+00:00', 'location': None, 'description': "", 'url': None, 'verified': False, 'followers': followers
+    }
+
+@pytest.mark.parametrize('format, kept', [('json', ("Renamed", 3)), ('ndjson', ("First", 1))])
+def test_json_chunks_keep_the_latest_and_ndjson_chunks_the_first_snapshot(tmpdir, format, kept):
+    from twista.neo4j import read_chunk
+    from twista.recorder import Snapshots
+
+    recorder = Recorder(10, format, directory=str(tmpdir), snapshots=Snapshots())
+    recorder.collect([profile('1', "First", 1), profile('2', "Other", 2)])
+    recorder.collect([profile('1', "Renamed", 3)])
+    recorder.write()
+    recorder.writer.drain()
+
+    [chunk] = recorder.chunks
+    assert sorted((u['id'], u['name'], u['followers']) for u in read_chunk(chunk)) == [('1',) + kept, ('2', "Other", 2)]
+    # A snapshot dropped from a streamed chunk is recorded with the next chunk, not mistaken for an already recorded one
+    assert recorder.snapshots.changed(profile('1', "Renamed", 3)) == (format == 'ndjson')
+
+@pytest.mark.parametrize('format, kept', [('json', "Renamed"), ('ndjson', "First")])
+def test_recovered_chunks_keep_the_snapshot_of_their_format(tmpdir, format, kept):
+    import json
+    from twista.neo4j import read_chunk
+    from twista.recorder import recover
+
+    with tmpdir.join("recording-2019-03-01T10-00-00.000000.wal").open('w') as wal:
+        wal.write(json.dumps({ 'wal': format, 'codec': 'gzip', 'level': None }) + "\n")
+        for name in ["First", "Renamed"]:
+            wal.write(json.dumps(profile('1', name, 1)) + "\n")
+    [chunk] = recover(str(tmpdir))
+
+    assert [u['name'] for u in read_chunk(chunk)] == [kept]
+
+def test_writer_runs_jobs_in_order_and_drains(capsys):
+    import threading
+    from twista.recorder import Writer
+
+    writer = Writer(depth=1)
+    release = threading.Event()
+    done = []
+
+    def fail():
+        raise IOError("disk full")
+
+    writer.submit(lambda: (release.wait(5), done.append(1)))
+    writer.submit(fail)
+    # The queue holds depth jobs, so the next submit blocks until the writer caught up
+    blocked = threading.Thread(target=writer.submit, args=(lambda: done.append(2),))
+    blocked.start()
+    blocked.join(0.2)
+    assert blocked.is_alive()
+    release.set()
+    blocked.join(5)
+    writer.drain()
+
+    assert done == [1, 2]
+    assert not writer.is_alive()
+    assert writer.stats()['rollovers'] == 2
+    assert writer.stats()['queue_depth'] == 0
+    assert "Writing chunk failed" in capsys.readouterr().out
+
+@pytest.mark.parametrize('format', ['json', 'ndjson'])
+def test_drained_recorders_leave_complete_chunks(tmpdir, format):
+    import os
+    from twista.neo4j import read_chunk
+
+    recorder = Recorder(2, format, directory=str(tmpdir))
+    for i in range(5):
+        recorder.collect([profile(str(i), f"User { i }", i)])
+    recorder.write()
+    recorder.writer.drain()
+
+    assert sorted(f.basename for f in tmpdir.listdir()) == sorted(os.path.basename(f) for f in recorder.chunks)
+    assert [len(read_chunk(f)) for f in recorder.chunks] == [2, 2, 1]
+
+def test_snapshots_skip_unchanged_users_until_refresh(monkeypatch):
+    from twista import recorder
+    from twista.recorder import Snapshots
+    now = [1000.0]
+    monkeypatch.setattr(recorder.time, 'time', lambda: now[0])
+    snapshots = Snapshots(size=10, refresh=60)
+
+    assert snapshots.changed(profile('1', "User", 1))
+    # Counters are not tracked, so only a changed profile is recorded again
+    assert not snapshots.changed(profile('1', "User", 2))
+    assert snapshots.changed(profile('1', "Renamed", 2))
+    now[0] += 61
+    assert snapshots.changed(profile('1', "Renamed", 2))
+    assert snapshots.skipped == 1
+
+def test_snapshots_evict_the_least_recently_seen_user():
+    from twista.recorder import Snapshots
+    snapshots = Snapshots(size=2)
+    for id in ['1', '2', '1', '3']:
+        snapshots.changed(profile(id, "User", 1))
+
+    assert list(snapshots.users) == ['1', '3']
+    assert snapshots.changed(profile('2', "User", 1))
+    assert not snapshots.changed(profile('3', "User", 1))
+
+def test_appends_do_not_wait_for_the_disk(tmpdir, monkeypatch):
+    import os
+    import threading
+    from twista.recorder import Segment
+
+    syncing = threading.Event()
+    release = threading.Event()
+    threads = []
+    fsync = os.fsync
+
+    def slow(fd):
+        threads.append(threading.current_thread().name)
+        syncing.set()
+        release.wait(5)
+        fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', slow)
+    segment = Segment(str(tmpdir), 'json', 'gzip', None, n=2, ms=60000)
+    segment.append('{"type":"status","id":"1"}\n')
+    segment.append('{"type":"status","id":"2"}\n')
+    assert syncing.wait(5)
+    # The disk is busy syncing the first batch, appending the next one goes on
+    for i in range(3, 10):
+        segment.append('{"type":"status","id":"%d"}\n' % i)
+    release.set()
+    segment.remove()
+
+    assert set(threads) == {"twista-wal-sync"}
@@ -0,0 +1,103 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAILING = """
+from twista import serving
+
+def init():
+    raise ConnectionRefusedError("database down")
+
+serving.serve(lambda environ, start_response: [], port=0, workers=2, threads=1, init=init)
+"""
+
+SERVING = """
+from twista import serving
+
+def app(environ, start_response):
+    start_response('200 OK', [])
+    return [b'ok']
+
+serving.serve(app, port=0, workers=2, threads=1)
+"""
+
+def run(script, seconds):
+    process = subprocess.Popen(
+        [sys.executable, '-c', script], cwd=ROOT,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    time.sleep(seconds)
+    process.send_signal(signal.SIGTERM)
+    (out, err) = process.communicate(timeout=10)
+    return (process.returncode, out, err)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="workers are forked")
+def test_failing_init_is_reported_and_restarted_with_delay():
+    (code, out, err) = run(FAILING, 3)
+    assert code == 0
+    assert "ConnectionRefusedError: database down" in err
+    assert "ProcessLookupError" not in err
+    restarts = out.count("restarting it")
+    assert 2 <= restarts <= 8
+    assert "status 256" in out
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="workers are forked")
+def test_stop_terminates_serving_workers():
+    (code, out, err) = run(SERVING, 1)
+    assert code == 0
+    assert "Serving on" in out
+    assert "restarting" not in out
+    assert "Traceback" not in err
+
+def test_requests_beyond_the_backlog_are_rejected():
+    import threading
+    import urllib.error
+    import urllib.request
+    from twista import serving
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def app(environ, start_response):
+        started.set()
+        release.wait(5)
+        start_response('200 OK', [])
+        return [b'ok']
+
+    server = serving.PooledServer('127.0.0.1', 0, app, threads=1, backlog=1)
+    serve = threading.Thread(target=server.serve_forever, daemon=True)
+    serve.start()
+    url = f"http://127.0.0.1:{ server.port }/"
+    statuses = []
+
+    def get():
+        try:
+            with urllib.request.urlopen(url, timeout=10) as response:
+                statuses.append(response.status)
+        except urllib.error.HTTPError as e:
+            statuses.append(e.code)
+
+    running = threading.Thread(target=get)
+    running.start()
+    assert started.wait(5)
+    waiting = threading.Thread(target=get)
+    waiting.start()
+    time.sleep(0.2)
+    get()
+    assert statuses == [503]
+    release.set()
+    for client in [running, waiting]:
+        client.join(10)
+    get()
+    server.shutdown()
+    serve.join()
+    server.server_close()
+
+    assert statuses == [503, 200, 200, 200]
+    assert server.rejected == 1
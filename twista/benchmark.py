@@ -0,0 +1,268 @@
+import copy
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from neo4j.exceptions import CypherError
+from twista import compression, neo4j, serving
+from twista import navigator as nav
+from twista.memory import MemoryGraph
+
+def codecs(sample):
+    """
+    Compresses and decompresses the (decompressed) content of a sample chunk with all codecs at typical levels.
+    Returns a list of results with compression time, decompression time and size.
+    """
+    with compression.open(sample, 'rb') as f:
+        raw = f.read()
+
+    grid = [('none', None), ('gzip', 1), ('gzip', 6), ('gzip', 9), ('bz2', 1), ('bz2', 9), ('lzma', 0), ('lzma', 6), ('lzma', 9)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for (codec, level) in grid:
+            path = os.path.join(tmp, "sample" + compression.extension(codec))
+            start = time.perf_counter()
+            with compression.open(path, 'wb', codec, level) as f:
+                f.write(raw)
+            compressing = time.perf_counter() - start
+            start = time.perf_counter()
+            with compression.open(path, 'rb') as f:
+                f.read()
+            decompressing = time.perf_counter() - start
+            size = os.path.getsize(path)
+            results.append({
+                'codec': codec,
+                'level': level,
+                'compress_seconds': compressing,
+                'decompress_seconds': decompressing,
+                'bytes': size,
+                'ratio': len(raw) / size if size else 0
+            })
+    return results
+
+def chunk(n=50000, seed=42, start=0):
+    """
+    Generates a synthetic chunk of n entities (as recorded) with a mix of users, tweets, retweets and replies.
+    The same seed always generates the same chunk. Tweet ids start at start (users are shared by all chunks).
+    """
+    rnd = random.Random(seed)
+    users = max(1, n // 10)
+    data = []
+    for i in range(n):
+        if i % 10 == 0:
+            data.append({
+                'twista': '0.3.3', 'type': 'user', 'id': str(i // 10), 'name': f"User { i // 10 }", 'screen_name': f"u{ i // 10 }",
+                'created_at': '2018-10-10T20:19:24+00:00', 'recorded_at': '2018-10-11T10:00:00+00:00',
+                'location': None, 'description': "", 'url': None, 'verified': False,
+                'followers': rnd.randint(0, 1000), 'friends': rnd.randint(0, 1000), 'listed': 0, 'favourites': 0, 'statuses': 0
+            })
+            continue
+        mentioned = [str(rnd.randrange(users)) for _ in range(rnd.randint(0, 3))]
+        tweet = {
+            'twista': '0.3.3', 'type': rnd.choice(['status', 'status', 'retweet', 'reply', 'quote']), 'id': str(start + i),
+            'user': str(rnd.randrange(users)), 'created_at': '2018-10-11T10:00:00+00:00', 'recorded_at': '2018-10-11T10:00:00+00:00',
+            'source': 'web', 'retweets': 0, 'favourites': 0, 'lang': 'de',
+            'hashtags': [f"Tag{ rnd.randrange(500) }" for _ in range(rnd.randint(0, 3))],
+            'urls': [f"https://example.org/{ rnd.randrange(5000) }" for _ in range(rnd.randint(0, 2))],
+            'mentions': [f"u{ m }" for m in mentioned], 'mentioned_ids': mentioned,
+            'text': "text " * rnd.randint(1, 20)
+        }
+        if tweet['type'] != 'status':
+            tweet['refers_to'] = str(start + rnd.randrange(max(1, i)))
+        data.append(tweet)
+    return data
+
+def legacy_rows(data):
+    """Row builder of Twista 0.3 (deep copies all tweets and scans them once per statement)."""
+    users = [d for d in data if d['type'] == 'user']
+    tweets = [d for d in data if d['type'] != 'user']
+    imports = copy.deepcopy(tweets)
+    for t in imports:
+        t.pop('mentions', None)
+        t.pop('mentioned_ids', None)
+        t.pop('hashtags', None)
+        t.pop('urls', None)
+
+    return {
+        'users': users,
+        'tweets': imports,
+        'posts': [{ 'user_id': t['user'], 'tweet_id': t['id'] } for t in tweets if 'user' in t],
+        'refers': [{ 'tweet_id': t['id'], 'ref_tweet_id': t['refers_to'] } for t in tweets if 'refers_to' in t],
+        'mentions': [{ 'tweet_id': t['id'], 'mentioned_id': mid } for t in tweets for mid in t['mentioned_ids']],
+        'tags': list(set([tag for t in tweets for tag in t['hashtags']])),
+        'tag_rels': [{'tweet_id': t['id'], 'tag': tag.upper()} for t in tweets for tag in t['hashtags']],
+        'urls': list(set([url for t in tweets for url in t['urls']])),
+        'url_rels': [{'tweet_id': t['id'], 'url': url } for t in tweets for url in t['urls']]
+    }
+
+def rows(n=50000, repeat=3):
+    """
+    Compares the legacy row builder with the single pass row builder of the importer on a synthetic chunk of n entities.
+    Returns a list of results with the best time and the peak of memory allocated while building the rows.
+    """
+    results = []
+    for (name, builder) in [('legacy', legacy_rows), ('single pass', neo4j.rows)]:
+        seconds = []
+        for _ in range(repeat):
+            data = chunk(n)
+            start = time.perf_counter()
+            builder(data)
+            seconds.append(time.perf_counter() - start)
+        data = chunk(n)
+        tracemalloc.start()
+        builder(data)
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results.append({ 'builder': name, 'entities': n, 'seconds': min(seconds), 'rate': n / min(seconds), 'peak': peak / 2 ** 20 })
+    return results
+
+def importing(chunks=5, n=50000, batch_sizes={}, stream=False, prefetch=0):
+    """
+    Imports synthetic chunks of n entities into a MemoryGraph (see twista.memory) with the real importer.
+    Returns the wall time, the time spent in statements (the in-memory database) and the importer with all timings,
+    so that the Python-side overhead of the importer can be told apart from database time.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for c in range(chunks):
+            f = os.path.join(tmp, f"recording-{ c:04d}.ndjson.gz")
+            with compression.open(f, 'wt', 'gzip', 1) as out:
+                for e in chunk(n, seed=c, start=c * n):
+                    out.write(json.dumps(e) + "\n")
+            files.append(f)
+        graph = MemoryGraph()
+        start = time.perf_counter()
+        importer = neo4j.import_records(
+            graph, files, prefetch, None, batch_sizes, 0, None, stream,
+            manifest=os.path.join(tmp, "imported.log"), seen=os.path.join(tmp, "imported.db")
+        )
+        wall = time.perf_counter() - start
+    statements = sum(t['seconds'] for t in importer.timings)
+    return {
+        'entities': chunks * n,
+        'seconds': wall,
+        'statements': statements,
+        'overhead': wall - statements,
+        'nodes': sum(len(nodes) for nodes in graph.nodes.values()),
+        'relationships': sum(len(rels) for rels in graph.relationships.values()),
+        'importer': importer
+    }
+
+def print_table(results, columns):
+    """Prints results (list of dicts) as aligned table with the given (key, header, format) columns."""
+    rows = [[h for (_, h, _) in columns]]
+    rows.extend([[f.format(r[k]) for (k, _, f) in columns] for r in results])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(c.rjust(w) for c, w in zip(row, widths)))
+
+class StubDriver:
+    """
+    Neo4j driver standing in for the database in navigator benchmarks. Every query takes latency seconds,
+    a fraction slow of them slow_latency seconds, and returns no records.
+    Transactions with a timeout are cancelled when it is exceeded, like by Neo4j.
+    """
+
+    def __init__(self, latency=0.02, slow=0.01, slow_latency=2, seed=42):
+        self.latency = latency
+        self.slow = slow
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+
+    def session(self):
+        return StubSession(self)
+
+    def close(self):
+        pass
+
+class StubSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def begin_transaction(self, timeout=None):
+        return StubTransaction(self.driver, timeout)
+
+    def close(self):
+        pass
+
+class StubTransaction:
+    def __init__(self, driver, timeout):
+        self.driver = driver
+        self.timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, statement, parameters=None):
+        seconds = self.driver.slow_latency if self.driver.random.random() < self.driver.slow else self.driver.latency
+        if self.timeout is not None and seconds > self.timeout:
+            time.sleep(self.timeout)
+            raise CypherError.hydrate(message="Transaction timed out", code="Neo.ClientError.Transaction.TransactionTimedOut")
+        time.sleep(seconds)
+        return []
+
+def navigator(clients=(1, 16), requests=200, threads=8, timeout=1, latency=0.02, slow=0.01, slow_latency=2):
+    """
+    Load tests the navigator served by twista.serving against a stub database (see StubDriver) with the cache disabled.
+    Compares serial serving (one thread and one session without timeout, one slow query blocks all others)
+    with pooled serving (threads threads and sessions, queries cancelled after timeout seconds)
+    at each number of concurrent clients, each client sending requests / clients requests to the dashboards.
+    Returns a list of results with p50 and p99 latency, throughput and the number of degraded (not successful) responses.
+    """
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    urls = ['/tweets/dashboard', '/tag/TAG1/dashboard', '/user/1/dashboard', '/tweets/volume', '/tweets/tags']
+    results = []
+    for (mode, n, limit) in [('serial', 1, None), ('pooled', threads, timeout)]:
+        for c in clients:
+            nav.graph = nav.Sessions(StubDriver(latency, slow, slow_latency), n, limit)
+            nav.cache = nav.Cache(size=0)
+            # Every client may wait for a thread, so requests are measured instead of shed
+            server = serving.PooledServer('127.0.0.1', 0, nav.app, n, backlog=c)
+            serve = threading.Thread(target=server.serve_forever, daemon=True)
+            serve.start()
+            latencies = []
+            failed = []
+
+            def client(i):
+                for r in range(requests // c):
+                    url = f"http://127.0.0.1:{ server.port }{ urls[(i + r) % len(urls)] }?begin=2018-10-10&end=2018-10-14T12:00:00"
+                    begin = time.perf_counter()
+                    try:
+                        with urllib.request.urlopen(url) as response:
+                            response.read()
+                    except urllib.error.HTTPError as e:
+                        failed.append(e.code)
+                    latencies.append(time.perf_counter() - begin)
+
+            start = time.perf_counter()
+            workers = [threading.Thread(target=client, args=(i,)) for i in range(c)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            wall = time.perf_counter() - start
+            server.shutdown()
+            serve.join()
+            server.server_close()
+
+            latencies.sort()
+            percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+            results.append({
+                'mode': mode,
+                'clients': c,
+                'requests': len(latencies),
+                'p50': percentile(0.5) * 1000,
+                'p99': percentile(0.99) * 1000,
+                'rate': len(latencies) / wall,
+                'degraded': len(failed)
+            })
+    return results
@@ -0,0 +1,218 @@
+import csv
+import heapq
+import itertools
+import json
+import os
+import tempfile
+from tqdm import tqdm
+from twista import neo4j
+
+# Node files written by the exporter: label -> file
+NODES = {
+    'Tweet': 'tweets.csv',
+    'User': 'users.csv',
+    'Tag': 'tags.csv',
+    'Url': 'urls.csv'
+}
+
+# Relationship files written by the exporter: type -> (start label, end label, file)
+RELATIONSHIPS = {
+    'POSTS': ('User', 'Tweet', 'posts.csv'),
+    'REFERS_TO': ('Tweet', 'Tweet', 'refers_to.csv'),
+    'MENTIONS': ('Tweet', 'User', 'mentions.csv'),
+    'HAS_TAG': ('Tweet', 'Tag', 'has_tag.csv'),
+    'HAS_URL': ('Tweet', 'Url', 'has_url.csv')
+}
+
+# Properties imported as datetime (like import_tweets and import_users do)
+DATETIMES = ['created_at', 'recorded_at']
+
+class Runs:
+    """
+    Sorts an unbounded number of (JSON serializable) items with bounded memory.
+    Items are buffered and spilled as sorted runs to disk; iterating merges all runs.
+    """
+
+    def __init__(self, directory, size=500000, key=tuple, fanin=256):
+        self.directory = directory
+        self.size = size
+        self.key = key
+        self.fanin = fanin
+        self.buffer = []
+        self.files = []
+
+    # Adds an item
+    def add(self, item):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.size:
+            self.spill(sorted(self.buffer, key=self.key))
+            self.buffer = []
+
+    # Writes sorted items as run to disk
+    def spill(self, items):
+        (fd, path) = tempfile.mkstemp(suffix='.run', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            for item in items:
+                f.write(json.dumps(item) + "\n")
+        self.files.append(path)
+
+    # Reads a run from disk
+    def read(self, path):
+        with open(path) as f:
+            for line in f:
+                yield json.loads(line)
+
+    def __iter__(self):
+        """Yields all items in sorted order. Merges runs in several passes if there are more than fanin runs."""
+        while len(self.files) > self.fanin:
+            (merging, self.files) = (self.files[:self.fanin], self.files[self.fanin:])
+            self.spill(heapq.merge(*[self.read(p) for p in merging], key=self.key))
+            for p in merging:
+                os.remove(p)
+        self.buffer.sort(key=self.key)
+        return heapq.merge(*[self.read(p) for p in self.files], iter(self.buffer), key=self.key)
+
+def unique(items):
+    """Skips consecutive duplicates of sorted items."""
+    last = None
+    for item in items:
+        if item != last:
+            yield item
+        last = item
+
+def latest(items):
+    """Yields the last (latest recorded) entity per id of (id, recorded_at, entity) items sorted by id and recorded_at."""
+    for (_, group) in itertools.groupby(items, key=lambda item: item[0]):
+        for item in group:
+            pass
+        yield item[2]
+
+def joined(items, ids):
+    """Yields the items sorted by their first element if it is one of the (sorted) ids."""
+    ids = iter(ids)
+    current = next(ids, None)
+    for item in items:
+        while current is not None and current < item[0]:
+            current = next(ids, None)
+        if current == item[0]:
+            yield item
+
+def identifiers(path):
+    """Reads sorted node ids written by export."""
+    with open(path) as f:
+        for line in f:
+            yield json.loads(line)
+
+def kind(value):
+    """Neo4j import type of a property value."""
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'long'
+    if isinstance(value, float):
+        return 'double'
+    return 'string'
+
+def header(label, properties):
+    """Header of a node file in neo4j-admin import format (the id property is the ID of the label's id space)."""
+    columns = [f"id:ID({ label })"]
+    for (p, t) in properties.items():
+        if p == 'id':
+            continue
+        columns.append(f"{ p }:{ 'datetime' if p in DATETIMES else t }")
+    return columns
+
+def value(v):
+    """Property value as CSV field (null is an empty field)."""
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    return v
+
+def export(records, directory='bulk', run=500000):
+    """
+    Exports recordings as node and relationship CSV files for neo4j-admin import (no database needed).
+    Nodes are deduplicated by id (the latest recorded snapshot wins), relationships are deduplicated and
+    only exported if both nodes exist (like the MATCH clauses of the import statements).
+    Tags are identified by the uppercased hashtag like by the importer (see twista.neo4j.tag_id).
+    Sorting is done in runs of at most run items on disk, so memory is bounded by the run size and the chunk size.
+    Returns the number of exported nodes and relationships per label and type.
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        entities = lambda item: (item[0], item[1])
+        nodes = { label: Runs(tmp, run, key=entities) for label in ['Tweet', 'User'] }
+        properties = { label: { 'id': 'string' } for label in nodes }
+        values = { label: Runs(tmp, run) for label in ['Tag', 'Url'] }
+        # Relationships are sorted by the id of the node that may be missing, then the id of the tweet
+        rels = { t: Runs(tmp, run) for t in RELATIONSHIPS }
+
+        for f in tqdm(records, desc="Reading"):
+            rows = neo4j.rows(neo4j.read_chunk(f))
+            for (label, stage) in [('User', 'users'), ('Tweet', 'tweets')]:
+                for e in rows[stage]:
+                    nodes[label].add([e['id'], e['recorded_at'], e])
+                    for (p, v) in e.items():
+                        if v is not None and properties[label].get(p) in (None, kind(v)):
+                            properties[label][p] = kind(v)
+                        elif v is not None:
+                            properties[label][p] = 'string'
+            for r in rows['posts']:
+                rels['POSTS'].add([r['user_id'], r['tweet_id']])
+            for r in rows['refers']:
+                rels['REFERS_TO'].add([r['ref_tweet_id'], r['tweet_id']])
+            for r in rows['mentions']:
+                rels['MENTIONS'].add([r['mentioned_id'], r['tweet_id']])
+            for r in rows['tag_rels']:
+                rels['HAS_TAG'].add([r['tag'], r['tweet_id']])
+                values['Tag'].add([r['tag']])
+            for r in rows['url_rels']:
+                rels['HAS_URL'].add([r['url'], r['tweet_id']])
+                values['Url'].add([r['url']])
+
+        # Nodes (sorted ids are kept to check the relationships)
+        ids = {}
+        for (label, runs) in nodes.items():
+            ids[label] = os.path.join(tmp, f"{ label }.ids")
+            columns = [p for p in properties[label]]
+            with open(os.path.join(directory, NODES[label]), 'w', newline='') as out, open(ids[label], 'w') as idf:
+                writer = csv.writer(out)
+                writer.writerow(header(label, properties[label]))
+                counts[label] = 0
+                for e in tqdm(latest(runs), desc=f"Writing { label } nodes"):
+                    writer.writerow([value(e.get(p)) for p in columns])
+                    idf.write(json.dumps(e['id']) + "\n")
+                    counts[label] += 1
+
+        for (label, runs) in values.items():
+            with open(os.path.join(directory, NODES[label]), 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow([f"id:ID({ label })"])
+                counts[label] = 0
+                for (v,) in unique(runs):
+                    writer.writerow([v])
+                    counts[label] += 1
+
+        # Relationships
+        checked = { 'POSTS': 'User', 'REFERS_TO': 'Tweet', 'MENTIONS': 'User' }
+        for (t, (start, end, file)) in RELATIONSHIPS.items():
+            items = unique(rels[t])
+            if t in checked:
+                items = joined(items, identifiers(ids[checked[t]]))
+            with open(os.path.join(directory, file), 'w', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow([f":START_ID({ start })", f":END_ID({ end })", ":TYPE"])
+                counts[t] = 0
+                for (node, tweet) in tqdm(items, desc=f"Writing { t } relationships"):
+                    writer.writerow(([node, tweet] if t == 'POSTS' else [tweet, node]) + [t])
+                    counts[t] += 1
+
+    return counts
+
+def command(directory='bulk'):
+    """neo4j-admin import command line for the exported files."""
+    args = [f"--nodes:{ label }={ os.path.join(directory, file) }" for (label, file) in NODES.items()]
+    args += [f"--relationships:{ t }={ os.path.join(directory, file) }" for (t, (_, _, file)) in RELATIONSHIPS.items()]
+    return " ".join(["neo4j/bin/neo4j-admin import --database=graph.db --multiline-fields=true", *args])
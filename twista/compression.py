@@ -0,0 +1,57 @@
+import builtins
+import bz2
+import gzip
+import lzma
+
+# Codec name -> (file extension, magic bytes, default level, valid levels)
+CODECS = {
+    'gzip': ('.gz', b'\x1f\x8b', 9, range(0, 10)),
+    'bz2': ('.bz2', b'BZh', 9, range(1, 10)),
+    'lzma': ('.xz', b'\xfd7zXZ\x00', 6, range(0, 10)),
+    'none': ('', None, None, [None])
+}
+
+# Suffix of chunks still being written (the recorder renames them when complete, importers skip them)
+PART = ".part"
+
+def extension(codec):
+    return CODECS[codec][0]
+
+def level(codec, level=None):
+    """Returns the effective compression level (the codec default if level is None), raises ValueError if invalid."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec { codec }")
+    (_, _, default, levels) = CODECS[codec]
+    if level is None:
+        return default
+    if level not in levels:
+        raise ValueError(f"Level { level } is not supported by codec { codec }")
+    return level
+
+def detect(path):
+    """Detects the codec of a file by its magic bytes (falls back to the file extension)."""
+    with builtins.open(path, 'rb') as f:
+        head = f.read(6)
+    for codec, (_, magic, _, _) in CODECS.items():
+        if magic and head.startswith(magic):
+            return codec
+    for codec, (ext, _, _, _) in CODECS.items():
+        if ext and path.endswith(ext):
+            return codec
+    return 'none'
+
+def open(path, mode='rt', codec=None, compression=None):
+    """
+    Opens a (compressed) chunk file.
+    For reading, the codec is detected if not given. For writing, codec defaults to gzip.
+    """
+    if codec is None:
+        codec = detect(path) if 'r' in mode else 'gzip'
+    text = {'encoding': 'utf-8'} if 't' in mode else {}
+    if codec == 'gzip':
+        return gzip.open(path, mode, compresslevel=level(codec, compression), **text)
+    if codec == 'bz2':
+        return bz2.open(path, mode, compresslevel=level(codec, compression), **text)
+    if codec == 'lzma':
+        return lzma.open(path, mode, preset=level(codec, compression) if 'w' in mode else None, **text)
+    return builtins.open(path, mode, **text)
@@ -1,14 +1,33 @@
 import json
 import datetime
+import functools
 import twista
 from dateutil import parser
 
+TWITTER_DATE_FORMAT = "%a %b %d %H:%M:%S %z %Y"
+
+@functools.lru_cache(maxsize=65536)
+def parse_date(value):
+    """
+    Converts a Twitter created_at timestamp (e.g. 'Wed Oct 10 20:19:24 +0000 2018') into ISO format.
+    Twitter always uses the same fixed format, so dateutil is only used for unexpected input.
+    """
+    try:
+        return datetime.datetime.strptime(value, TWITTER_DATE_FORMAT).isoformat()
+    except ValueError:
+        return parser.parse(value).isoformat()
+
+def now():
+    return datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+
 class TweetObject:
     
-    def __init__(self, json):
+    # All objects derived from one incoming status share the recorded_at timestamp of that status.
+    def __init__(self, json, recorded_at=None):
         self.json = json
-        self.json['created_at'] = parser.parse(self.json['created_at']).isoformat()
-        self.json['recorded_at'] = datetime.datetime.now(tz=datetime.timezone.utc).isoformat()
+        if 'recorded_at' not in self.json:
+            self.json['created_at'] = parse_date(self.json['created_at'])
+        self.json['recorded_at'] = recorded_at or self.json.get('recorded_at') or now()
         
     def id(self):
         return self.json['id_str']
@@ -33,7 +52,7 @@ class TweetObject:
         return self.json['recorded_at']
     
     def user(self):
-        return User(self.json['user'])
+        return User(self.json['user'], self.recorded_at())
         
     def text(self):
         return self.json['text']
@@ -59,13 +78,13 @@ class TweetObject:
     def quote(self):
         if 'quoted_status' not in self.json:
             return None
-        return Status(self.json['quoted_status'])
+        return Status(self.json['quoted_status'], self.recorded_at())
     
     def retweet(self):
-        return Status(self.json['retweeted_status']) if self.is_retweet() else None
+        return Status(self.json['retweeted_status'], self.recorded_at()) if self.is_retweet() else None
     
     def status(self):
-        return Status(self.json)
+        return Status(self.json, self.recorded_at())
     
     def __str__(self):
         return json.dumps(self.json, indent=4)
@@ -177,4 +196,108 @@ class User(TweetObject):
             'listed': self.json['listed_count'],
             'favourites': self.json['favourites_count'],
             'statuses': self.json['statuses_count']
-        }
\ No newline at end of file
+        }
+
+def normalize(json, recorded_at=None):
+    """
+    Single-pass variant of wrapping a status with TweetObject.
+    Walks a raw status once and returns the records of the status, its user and (if present)
+    the retweeted and quoted statuses and their users. Each object is classified only once.
+    The records are identical to the as_dict() results of the Status and User wrappers.
+    """
+    recorded_at = recorded_at or now()
+    records = []
+    nested = status_record(json, recorded_at, records)
+    if nested:
+        quote = status_record(nested, recorded_at, records)
+        if quote and 'retweeted_status' in json:
+            status_record(quote, recorded_at, records)
+    return records
+
+def created_at(json):
+    return json['created_at'] if 'recorded_at' in json else parse_date(json['created_at'])
+
+def status_record(json, recorded_at, records):
+    """
+    Appends the records of a raw status and its user to records.
+    Returns the raw status this status is a retweet of or the raw quoted status
+    (in this precedence) that needs to be recorded as well, otherwise None.
+    """
+    is_retweet = 'retweeted_status' in json
+    is_quote = json['is_quote_status'] and not is_retweet
+    is_reply = json['in_reply_to_status_id_str'] != None
+
+    if 'screen_name' in json:
+        kind = "user"
+    elif not (is_quote or is_reply or is_retweet):
+        kind = "status"
+    elif is_retweet:
+        kind = "retweet"
+    elif is_quote:
+        kind = "quote"
+    else:
+        kind = "reply"
+
+    user = json['user']
+    extended = json.get('extended_tweet')
+    entities = extended['entities'] if extended is not None else json['entities']
+    rts = json['retweet_count']
+    favs = json['favorite_count']
+
+    r = {
+        'twista': twista.VERSION,
+        "type": kind,
+        "id": json['id_str'],
+        "user": user['id_str'],
+        "created_at": created_at(json),
+        "recorded_at": recorded_at,
+        "source": json['source'],
+        "retweets": rts if rts else 0,
+        "favourites": favs if favs else 0,
+        "lang": json['lang'],
+        "hashtags": [e['text'] for e in entities['hashtags']],
+        "urls": [e['url'] for e in entities['urls']],
+        "mentions": [e['screen_name'] for e in entities['user_mentions']],
+        "mentioned_ids": [e['id_str'] for e in entities['user_mentions'] if e['id_str'] is not None]
+    }
+
+    if not is_retweet:
+        r['text'] = extended['full_text'] if extended is not None else json['text']
+
+    if is_quote and 'quoted_status_id_str' in json:
+        r['refers_to'] = json['quoted_status_id_str']
+
+    if is_retweet:
+        r['refers_to'] = json['retweeted_status']['id_str']
+
+    if is_reply:
+        r['refers_to'] = json['in_reply_to_status_id_str']
+
+    records.append(r)
+    records.append(user_record(user, recorded_at))
+
+    if is_retweet:
+        return json['retweeted_status']
+    if is_quote and 'quoted_status' in json:
+        return json['quoted_status']
+    return None
+
+def user_record(json, recorded_at):
+    return {
+        'twista': twista.VERSION,
+        'type': 'user',
+        'id': json['id_str'],
+        'name': json['name'],
+        'screen_name': json['screen_name'],
+        'created_at': created_at(json),
+        'recorded_at': recorded_at,
+        'location': json['location'],
+        'description': json['description'],
+        'url': json['url'],
+        'verified': json['verified'],
+        'followers': json['followers_count'],
+        'friends': json['friends_count'],
+        'listed': json['listed_count'],
+        'favourites': json['favourites_count'],
+        'statuses': json['statuses_count']
+    }
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+class Manifest:
+    """
+    Append-only log of imported chunks (newline delimited JSON, imported.log).
+    Records size, modification time and checksum of every chunk and the last completed stage and batch
+    (with the state of the seen store they refer to), so that an interrupted import resumes where it stopped
+    and modified chunks are imported again.
+    Chunks listed in a legacy imported.json (next to the log by default) are taken as imported.
+    """
+
+    def __init__(self, file='imported.log', legacy=None):
+        self.file = file
+        legacy = legacy or os.path.join(os.path.dirname(file), 'imported.json')
+        self.state = {}
+        self.resumable = {}
+        lines = 0
+        if Path(file).exists():
+            with open(file) as log:
+                for line in log:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    self.state.setdefault(entry['file'], {}).update(entry)
+                    lines += 1
+        self.log = open(file, 'a')
+
+        if not self.state and Path(legacy).exists():
+            with open(legacy) as f:
+                for chunk in json.load(f):
+                    if Path(chunk).exists():
+                        self.append({ 'file': chunk, **self.fingerprint(chunk, True), 'stage': None, 'batch': None, 'offsets': {}, 'done': True })
+        elif lines > 4 * len(self.state) + 1000:
+            self.compact()
+
+    # Size and modification time (and checksum) of a chunk
+    def fingerprint(self, f, checksum=False):
+        stat = os.stat(f)
+        fp = { 'size': stat.st_size, 'mtime': stat.st_mtime }
+        if checksum:
+            fp['checksum'] = self.checksum(f)
+        return fp
+
+    def checksum(self, f):
+        """SHA-1 of the (compressed) content of a chunk."""
+        h = hashlib.sha1()
+        with open(f, 'rb') as content:
+            for block in iter(lambda: content.read(1 << 20), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def append(self, entry):
+        """Appends an entry to the log (and the state)."""
+        self.state.setdefault(entry['file'], {}).update(entry)
+        self.log.write(json.dumps(entry) + "\n")
+        self.log.flush()
+
+    def compact(self):
+        """Rewrites the log with one entry per chunk."""
+        self.log.close()
+        with open(self.file + ".tmp", 'w') as log:
+            for entry in self.state.values():
+                log.write(json.dumps(entry) + "\n")
+        os.replace(self.file + ".tmp", self.file)
+        self.log = open(self.file, 'a')
+
+    def unchanged(self, f, entry):
+        """
+        Checks whether a chunk is unchanged since it was logged (the checksum decides if size and mtime are inconclusive).
+        The new modification time of a chunk whose checksum matches is logged, so it is checksummed only once.
+        """
+        fp = self.fingerprint(f)
+        if fp['size'] != entry.get('size'):
+            return False
+        if fp['mtime'] == entry.get('mtime'):
+            return True
+        if self.checksum(f) != entry.get('checksum'):
+            return False
+        self.append({ 'file': f, **fp })
+        return True
+
+    def pending(self, records):
+        """Returns the chunks still to import: new, interrupted and modified ones."""
+        tbd = []
+        for f in records:
+            entry = self.state.get(f)
+            if entry is None:
+                tbd.append(f)
+            elif not self.unchanged(f, entry):
+                print(f"{ f } was modified since its import, importing it again")
+                tbd.append(f)
+            elif not entry.get('done'):
+                if entry.get('offsets'):
+                    self.resumable[f] = (entry['offsets'], entry.get('seen'))
+                tbd.append(f)
+        return tbd
+
+    def begin(self, f, seen=None):
+        """
+        Starts (or resumes) the import of a chunk. Returns the rows already written per stage (empty for a new import).
+        Offsets are rows of the chunk split by the seen store (see twista.seen), so an interrupted import
+        only resumes if the state of the seen store (seen) is still the same, otherwise the chunk is imported from the start.
+        """
+        if f in self.resumable:
+            (offsets, state) = self.resumable.pop(f)
+            if state is not None and state == seen:
+                return offsets
+            print(f"Seen store changed since the import of { f } was interrupted, importing it from the start")
+        # The logged checksum is still valid if size and mtime did not change (e.g. the chunk is imported again from the start)
+        fp = self.fingerprint(f)
+        entry = self.state.get(f, {})
+        if entry.get('checksum') and (fp['size'], fp['mtime']) == (entry.get('size'), entry.get('mtime')):
+            fp['checksum'] = entry['checksum']
+        else:
+            fp['checksum'] = self.checksum(f)
+        self.append({ 'file': f, **fp, 'seen': seen, 'stage': None, 'batch': None, 'offsets': {}, 'done': False })
+        return {}
+
+    def progress(self, f, stage, batch, offsets):
+        """Logs a completed batch of a stage (offsets are the rows written so far per stage)."""
+        self.append({ 'file': f, 'stage': stage, 'batch': batch, 'offsets': dict(offsets) })
+
+    def done(self, f):
+        """Logs a completely imported chunk."""
+        self.append({ 'file': f, 'done': True })
+
+    def close(self):
+        self.log.close()
@@ -0,0 +1,396 @@
+import collections
+import uuid
+from datetime import datetime
+from neo4j import SummaryCounters
+from neo4j.exceptions import ConstraintError
+from twista import neo4j, seen
+
+class Record(tuple):
+    """Record of a result (like neo4j.Record: indexable, value() returns the first value)."""
+
+    def value(self, i=0):
+        return self[i]
+
+class Summary:
+    """Summary of a result (like neo4j.BoltStatementResultSummary, only counters)."""
+
+    def __init__(self, statistics={}):
+        self.counters = SummaryCounters(statistics)
+
+class Result:
+    """Result of a statement (like neo4j.BoltStatementResult: iterable, single() returns the first record)."""
+
+    def __init__(self, records=[], statistics={}):
+        self.records = [Record(r) for r in records]
+        self.statistics = statistics
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def single(self):
+        return self.records[0] if self.records else None
+
+    def summary(self):
+        return Summary(self.statistics)
+
+class Transaction:
+    """Explicit transaction of a MemoryGraph. Statements are applied when run and undone on rollback."""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.undo = []
+        self.finished = False
+
+    def run(self, statement, **parameters):
+        return self.graph.execute(statement, parameters, self.undo)
+
+    def commit(self):
+        self.finished = True
+
+    def rollback(self):
+        self.finished = True
+        for undo in reversed(self.undo):
+            undo()
+
+    def closed(self):
+        return self.finished
+
+class MemoryGraph:
+    """
+    In-process stand-in for a Neo4j session (run, begin_transaction, sync, close) for benchmarks and tests.
+    Implements the semantics of the import statements of twista.neo4j with dicts:
+    nodes are merged by id, relationships by their endpoints (and only if both exist, references to missing tweets are
+    kept pending until the tweet is created), creating an existing node raises a ConstraintError. Created tweets and relationships are rolled up per day (Day and TweetType nodes,
+    rollups holds the counters of ACTIVE_ON and USED_ON). Results provide summary counters. Schema statements are accepted and ignored.
+    Statements are recognized by the constants of twista.neo4j and twista.seen, others raise NotImplementedError.
+    """
+
+    def __init__(self):
+        self.nodes = { 'Tweet': {}, 'User': {}, 'Tag': {}, 'Url': {}, 'Day': {}, 'TweetType': {} }
+        self.relationships = { 'POSTS': set(), 'REFERS_TO': set(), 'MENTIONS': set(), 'HAS_TAG': set(), 'HAS_URL': set() }
+        # Counters of the rollup relationships: (type, start label, start id, day) -> properties
+        self.rollups = {}
+        # Referenced tweet of a tweet and the other tweets of a cascade (root id -> ids)
+        self.references = {}
+        self.cascades = {}
+        self.generation = 0
+        self.identity = uuid.uuid4().hex
+        self.indexes = set()
+        # Import statements: statement -> (operation, arguments)
+        self.statements = {
+            neo4j.import_tweets: (self.merge, 'Tweet', self.created_tweet),
+            neo4j.create_tweets: (self.create, 'Tweet', self.created_tweet),
+            neo4j.import_users: (self.merge, 'User', None),
+            neo4j.create_users: (self.create, 'User', None),
+            neo4j.merge_posts: (self.relate, 'POSTS', 'User', 'user_id', 'Tweet', 'tweet_id', self.posted),
+            neo4j.merge_refers: (self.refer,),
+            neo4j.link_waiting: (self.link,),
+            neo4j.merge_mentions: (self.relate, 'MENTIONS', 'Tweet', 'tweet_id', 'User', 'mentioned_id', self.mentioned),
+            neo4j.create_tags: (self.merge_values, 'Tag', None),
+            neo4j.create_new_tags: (self.create_values, 'Tag', None),
+            neo4j.merge_tags: (self.relate, 'HAS_TAG', 'Tweet', 'tweet_id', 'Tag', 'tag', self.tagged),
+            neo4j.create_urls: (self.merge_values, 'Url', None),
+            neo4j.create_new_urls: (self.create_values, 'Url', None),
+            neo4j.merge_urls: (self.relate, 'HAS_URL', 'Tweet', 'tweet_id', 'Url', 'url', None)
+        }
+        # Rollup rebuild statements (per day): statement -> relationships rolled up (None for tweets)
+        self.rebuilds = {
+            neo4j.rebuild_tweets: (None, self.tweeted),
+            neo4j.rebuild_posts: ('POSTS', self.posted),
+            neo4j.rebuild_mentions: ('MENTIONS', self.mentioned),
+            neo4j.rebuild_tags: ('HAS_TAG', self.tagged)
+        }
+        # Other statements of twista.neo4j and twista.seen: statement -> function of its parameters returning a Result
+        self.queries = {
+            neo4j.bump_generation: self.bump,
+            neo4j.current_generation: self.current,
+            neo4j.set_cascades: self.set_cascades,
+            neo4j.delete_days: self.delete_days,
+            neo4j.delete_tweet_types: self.delete_tweet_types,
+            neo4j.tweet_days: self.tweet_days,
+            neo4j.fulltext_indexes: lambda: Result([[sorted(self.indexes)]]),
+            seen.graph_identity: lambda: Result([[self.identity]])
+        }
+        for statement in neo4j.SCHEMA:
+            self.queries[statement] = Result
+        for (name, statement) in neo4j.FULLTEXT.items():
+            self.queries[statement] = lambda name=name: self.fulltext(name)
+        for label in seen.LABELS:
+            self.queries[seen.count_nodes.format(label)] = lambda label=label: Result([[len(self.nodes[label])]])
+            self.queries[seen.node_ids.format(label)] = lambda label=label: Result([[i] for i in self.nodes[label]])
+
+    def run(self, statement, **parameters):
+        """Runs a statement in an auto-commit transaction."""
+        if statement in self.statements:
+            tx = self.begin_transaction()
+            try:
+                result = tx.run(statement, **parameters)
+            except Exception:
+                tx.rollback()
+                raise
+            tx.commit()
+            return result
+        if statement in self.rebuilds:
+            return self.rebuild(statement, parameters['day'])
+        if statement in self.queries:
+            return self.queries[statement](**parameters)
+        raise NotImplementedError(f"Statement not supported by MemoryGraph: { statement.strip() }")
+
+    def bump(self):
+        self.generation += 1
+        return Result()
+
+    def current(self):
+        return Result([[self.generation]] if self.generation else [])
+
+    def set_cascades(self, day):
+        for (i, t) in list(self.nodes['Tweet'].items()):
+            if self.day(t) == day:
+                (root, depth) = self.top(i)
+                if root is not None:
+                    self.move(i, root, depth, [])
+        return Result()
+
+    def delete_days(self, n):
+        days = list(self.nodes['Day'])[:n]
+        for day in days:
+            del self.nodes['Day'][day]
+        self.rollups = { k: v for (k, v) in self.rollups.items() if k[3] not in days }
+        return Result([[len(days)]])
+
+    def delete_tweet_types(self):
+        self.nodes['TweetType'] = {}
+        self.rollups = { k: v for (k, v) in self.rollups.items() if k[1] != 'TweetType' }
+        return Result()
+
+    def fulltext(self, name):
+        self.indexes.add(name)
+        return Result()
+
+    def tweet_days(self):
+        return Result([[d] for d in sorted(set(filter(None, map(self.day, self.nodes['Tweet'].values()))))])
+
+    def begin_transaction(self):
+        return Transaction(self)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+    def execute(self, statement, parameters, undo):
+        """Applies an import statement to its json rows. Appends how to undo the changes to undo, returns a Result with counters."""
+        if statement not in self.statements:
+            raise NotImplementedError(f"Statement not supported by MemoryGraph: { statement.strip() }")
+        (operation, *arguments) = self.statements[statement]
+        statistics = collections.Counter()
+        operation(*arguments, parameters['json'], undo, statistics)
+        return Result(statistics=statistics)
+
+    # MERGE (n:label{id: row.id}) SET n+=row (rolling up created nodes)
+    def merge(self, label, rollup, rows, undo, statistics):
+        nodes = self.nodes[label]
+        created = {}
+        for row in rows:
+            i = row['id']
+            if i in nodes:
+                undo.append(lambda i=i, old=dict(nodes[i]): nodes.__setitem__(i, old))
+            else:
+                undo.append(lambda i=i: nodes.pop(i))
+                nodes[i] = {}
+                created[i] = None
+                statistics['nodes-created'] += 1
+                statistics['labels-added'] += 1
+            nodes[i].update(row)
+            statistics['properties-set'] += len(row)
+        if rollup:
+            for i in created:
+                rollup(nodes[i], undo, statistics)
+
+    # CREATE (n:label) SET n=row (violating the uniqueness constraint if the id exists)
+    def create(self, label, rollup, rows, undo, statistics):
+        nodes = self.nodes[label]
+        for row in rows:
+            if row['id'] in nodes:
+                raise ConstraintError(f"Node({ row['id'] }) already exists with label `{ label }` and property `id`")
+            nodes[row['id']] = dict(row)
+            undo.append(lambda i=row['id']: nodes.pop(i))
+            statistics['nodes-created'] += 1
+            statistics['labels-added'] += 1
+            statistics['properties-set'] += len(row)
+            if rollup:
+                rollup(nodes[row['id']], undo, statistics)
+
+    # MERGE (n:label{id: value})
+    def merge_values(self, label, rollup, values, undo, statistics):
+        self.merge(label, rollup, [{ 'id': v } for v in values], undo, statistics)
+
+    # CREATE (n:label{id: value})
+    def create_values(self, label, rollup, values, undo, statistics):
+        self.create(label, rollup, [{ 'id': v } for v in values], undo, statistics)
+
+    # MATCH (a:source{id: row[a]}) MATCH (b:target{id: row[b]}) MERGE (a) -[:type]-> (b) (rolling up created relationships)
+    def relate(self, kind, source, a, target, b, rollup, rows, undo, statistics):
+        rels = self.relationships[kind]
+        (sources, targets) = (self.nodes[source], self.nodes[target])
+        for row in rows:
+            rel = (row[a], row[b])
+            if rel[0] in sources and rel[1] in targets and rel not in rels:
+                rels.add(rel)
+                undo.append(lambda rel=rel: rels.discard(rel))
+                statistics['relationships-created'] += 1
+                if rollup:
+                    rollup(rel, undo, statistics)
+
+    # A created tweet is the root of its own cascade (and rolled up)
+    def created_tweet(self, tweet, undo, statistics):
+        tweet['root'] = tweet['id']
+        tweet['depth'] = 0
+        self.tweeted(tweet, undo, statistics)
+
+    # Top of the reference chain of a tweet and its distance (None for a cycle)
+    def top(self, i):
+        (top, depth, visited) = (i, 0, { i })
+        while top in self.references:
+            top = self.references[top]
+            depth += 1
+            if top in visited:
+                return (None, None)
+            visited.add(top)
+        return (top, depth)
+
+    # Sets the cascade root and depth of a tweet
+    def move(self, i, root, depth, undo):
+        tweet = self.nodes['Tweet'][i]
+        (old, before) = (tweet.get('root'), tweet.get('depth'))
+        if old is not None and old != i:
+            self.cascades[old].discard(i)
+            if not self.cascades[old]:
+                del self.cascades[old]
+        if root != i:
+            self.cascades.setdefault(root, set()).add(i)
+        (tweet['root'], tweet['depth']) = (root, depth)
+        undo.append(lambda: self.move(i, old, before, []) if old is not None else (self.move(i, i, 0, []), tweet.pop('root'), tweet.pop('depth')))
+
+    # A created REFERS_TO relationship moves the cascade of the referring tweet (its root) below the top of its new chain
+    def referred(self, rel, undo, statistics):
+        (t, r) = rel
+        self.references[t] = r
+        undo.append(lambda: self.references.pop(t))
+        (top, depth) = self.top(t)
+        if top is None:
+            return
+        tweets = self.nodes['Tweet']
+        members = list(self.cascades.get(t, ()))
+        if tweets[t].get('root') == t:
+            members.append(t)
+        for s in members:
+            self.move(s, top, tweets[s]['depth'] + depth, undo)
+            statistics['properties-set'] += 2
+
+    # MERGE (t) -[:REFERS_TO]-> (r), or SET t.ref while r does not exist (see link)
+    def refer(self, rows, undo, statistics):
+        tweets = self.nodes['Tweet']
+        for row in rows:
+            (t, r) = (row['tweet_id'], row['ref_tweet_id'])
+            if t in tweets and r not in tweets:
+                tweet = tweets[t]
+                undo.append(lambda tweet=tweet, old=tweet.get('ref'): tweet.__setitem__('ref', old) if old else tweet.pop('ref'))
+                tweet['ref'] = r
+                statistics['properties-set'] += 1
+        self.relate('REFERS_TO', 'Tweet', 'tweet_id', 'Tweet', 'ref_tweet_id', self.referred, rows, undo, statistics)
+
+    # MATCH (t:Tweet{ref: id}) REMOVE t.ref MERGE (t) -[:REFERS_TO]-> (r:Tweet{id: id}) for created tweets
+    def link(self, ids, undo, statistics):
+        tweets = self.nodes['Tweet']
+        ids = set(i for i in ids if i in tweets)
+        rows = []
+        for (i, tweet) in tweets.items():
+            if tweet.get('ref') in ids:
+                undo.append(lambda tweet=tweet, ref=tweet['ref']: tweet.__setitem__('ref', ref))
+                rows.append({ 'tweet_id': i, 'ref_tweet_id': tweet.pop('ref') })
+                statistics['properties-set'] += 1
+        self.relate('REFERS_TO', 'Tweet', 'tweet_id', 'Tweet', 'ref_tweet_id', self.referred, rows, undo, statistics)
+
+    # Day of a tweet (date(t.created_at), None without created_at)
+    def day(self, tweet):
+        if tweet.get('created_at') is None:
+            return None
+        return datetime.fromisoformat(tweet['created_at']).date().isoformat()
+
+    # MERGE (n:label{...}) of a rollup node
+    def node(self, label, key, properties, undo, statistics):
+        nodes = self.nodes[label]
+        if key not in nodes:
+            nodes[key] = dict(properties)
+            undo.append(lambda: nodes.pop(key))
+            statistics['nodes-created'] += 1
+            statistics['labels-added'] += 1
+
+    # Adds n to a counter of a node or rollup relationship (the relationship is created with defaults if missing)
+    def increment(self, table, key, defaults, counter, n, undo, statistics):
+        if key not in table:
+            table[key] = dict(defaults)
+            undo.append(lambda: table.pop(key))
+            statistics['relationships-created'] += 1
+        table[key][counter] += n
+        undo.append(lambda: table[key].__setitem__(counter, table[key][counter] - n))
+        statistics['properties-set'] += 1
+
+    # Day node of a date
+    def dated(self, day, undo, statistics):
+        self.node('Day', day, { 'date': day, 'tweets': 0, 'posters': 0 }, undo, statistics)
+
+    # Rollup of a created tweet: tweets of the day and (:TweetType) -[:USED_ON]-> (:Day)
+    def tweeted(self, tweet, undo, statistics):
+        day = self.day(tweet)
+        if day is None:
+            return
+        self.dated(day, undo, statistics)
+        self.increment(self.nodes['Day'], day, {}, 'tweets', 1, undo, statistics)
+        self.node('TweetType', tweet['type'], { 'id': tweet['type'] }, undo, statistics)
+        self.increment(self.rollups, ('USED_ON', 'TweetType', tweet['type'], day), { 'n': 0 }, 'n', 1, undo, statistics)
+
+    # Rollup of a created POSTS relationship: (:User) -[:ACTIVE_ON{posts}]-> (:Day) and the posters of the day
+    def posted(self, rel, undo, statistics):
+        (user, tweet) = rel
+        day = self.day(self.nodes['Tweet'][tweet])
+        if day is None:
+            return
+        self.dated(day, undo, statistics)
+        key = ('ACTIVE_ON', 'User', user, day)
+        if not self.rollups.get(key, {}).get('posts'):
+            self.increment(self.nodes['Day'], day, {}, 'posters', 1, undo, statistics)
+        self.increment(self.rollups, key, { 'posts': 0, 'mentions': 0 }, 'posts', 1, undo, statistics)
+
+    # Rollup of a created MENTIONS relationship: (:User) -[:ACTIVE_ON{mentions}]-> (:Day)
+    def mentioned(self, rel, undo, statistics):
+        (tweet, user) = rel
+        day = self.day(self.nodes['Tweet'][tweet])
+        if day is None:
+            return
+        self.dated(day, undo, statistics)
+        self.increment(self.rollups, ('ACTIVE_ON', 'User', user, day), { 'posts': 0, 'mentions': 0 }, 'mentions', 1, undo, statistics)
+
+    # Rollup of a created HAS_TAG relationship: (:Tag) -[:USED_ON]-> (:Day)
+    def tagged(self, rel, undo, statistics):
+        (tweet, tag) = rel
+        day = self.day(self.nodes['Tweet'][tweet])
+        if day is None:
+            return
+        self.dated(day, undo, statistics)
+        self.increment(self.rollups, ('USED_ON', 'Tag', tag, day), { 'n': 0 }, 'n', 1, undo, statistics)
+
+    # Rolls up the tweets (or relationships of a kind) of a day again
+    def rebuild(self, statement, day):
+        (kind, rollup) = self.rebuilds[statement]
+        statistics = collections.Counter()
+        if kind is None:
+            items = [t for t in self.nodes['Tweet'].values() if self.day(t) == day]
+        else:
+            tweet = 1 if kind == 'POSTS' else 0
+            items = [rel for rel in self.relationships[kind] if self.day(self.nodes['Tweet'][rel[tweet]]) == day]
+        for item in items:
+            rollup(item, [], statistics)
+        return Result(statistics=statistics)
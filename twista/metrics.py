@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+import datetime
+from termcolor import colored
+
+class Metrics(threading.Thread):
+    """
+    Low overhead metrics surface.
+    The observed components only maintain plain counters. Once per interval the metrics thread collects them
+    (via the collect callback), rewrites a metrics file in Prometheus text format and prints an optional status line.
+
+    collect() has to return a list of (name, type, help, samples) tuples,
+    where samples is a list of (labels, value) pairs and labels is a dict.
+    """
+
+    def __init__(self, collect, file=None, interval=10, status=False):
+        super().__init__(name="twista-metrics", daemon=True)
+        self.collect = collect
+        self.file = file
+        self.interval = interval
+        self.status = status
+        self.previous = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        last = time.time()
+        while not self.stopped.wait(self.interval):
+            now = time.time()
+            self.export(now - last)
+            last = now
+
+    # Stops the thread and exports a last time (after a running export finished, so both never write the file at once)
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.export(0)
+
+    def export(self, elapsed):
+        metrics = self.collect()
+        if self.file:
+            write(self.file, prometheus(metrics))
+        if self.status and elapsed > 0:
+            print(colored(self.status_line(metrics, elapsed), "green"), flush=True)
+
+    # Summarizes all metrics in one line, counters are reported as rates since the last line.
+    def status_line(self, metrics, elapsed):
+        values = []
+        for (name, kind, _, samples) in metrics:
+            total = sum(v for _, v in samples)
+            short = name.replace("twista_", "").replace("_total", "")
+            if kind == 'counter':
+                rate = (total - self.previous.get(name, 0)) / elapsed
+                self.previous[name] = total
+                values.append(f"{ short } { rate:.1f}/s")
+            else:
+                values.append(f"{ short } { total:.3g}")
+        t = datetime.datetime.now().strftime("%H:%M:%S")
+        return f"[{ t }] " + ", ".join(values)
+
+def prometheus(metrics):
+    """Renders metrics in the Prometheus text exposition format."""
+    lines = []
+    for (name, kind, help, samples) in metrics:
+        lines.append(f"# HELP { name } { help }")
+        lines.append(f"# TYPE { name } { kind }")
+        for (labels, value) in samples:
+            ls = ",".join(f'{ k }="{ v }"' for k, v in sorted(labels.items()))
+            lines.append(f"{ name }{{{ ls }}} { value }" if ls else f"{ name } { value }")
+    return "\n".join(lines) + "\n"
+
+# Replaces the file atomically, so that scrapers never see a partially written file.
+def write(file, content):
+    tmp = f"{ file }.tmp"
+    with open(tmp, 'w') as f:
+        f.write(content)
+    os.replace(tmp, file)
@@ -1,13 +1,18 @@
-from flask import Flask, escape, request, Response, render_template, redirect, url_for, jsonify
-from py2neo import Graph
-from collections import Counter
+from flask import Flask, escape, request, Response, render_template, redirect, url_for, jsonify, g, has_request_context
+from neo4j import GraphDatabase
+from neo4j.exceptions import CypherError, ServiceUnavailable, ConnectionExpired
+from collections import Counter, OrderedDict
 from datetime import datetime as dt
-from datetime import timedelta
+from datetime import timedelta, timezone
 import json
 import os
 from dateutil import parser, relativedelta
 import random as rand
 import string
+import functools
+import threading
+import time
+from twista import neo4j, serving
 
 templates = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'templates')
 statics = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'static')
@@ -15,6 +20,233 @@ app = Flask("Twista navigator", template_folder=templates, static_folder=statics
 app.jinja_options['extensions'].append('jinja2.ext.do')
 graph = None
 
+class Unavailable(Exception):
+    """A query could not be answered within the budget of its request (timed out, cancelled or no free session)."""
+    pass
+
+class Records(list):
+    """Records of a query, fetched completely (the part of the py2neo cursor used by the navigator)."""
+
+    def evaluate(self):
+        return self[0][0] if self else None
+
+    def data(self):
+        return [dict(r.items()) for r in self]
+
+class Sessions:
+    """
+    Bounded pool of at most size Neo4j sessions, one per concurrently running query, used as graph of the navigator.
+    Every query runs in a transaction with a timeout of the budget left to its request (see budget),
+    so Neo4j cancels runaway queries. Waiting for a free session counts against the budget as well.
+    Queries exceeding the budget raise Unavailable.
+    """
+
+    def __init__(self, driver, size=8, timeout=10):
+        self.driver = driver
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.timeouts = 0
+        self.busy = 0
+
+    def remaining(self):
+        """Seconds left of the budget of the current request (the default timeout outside of requests, None for no limit)."""
+        if has_request_context() and g.get('deadline') is not None:
+            return g.deadline - time.monotonic()
+        return self.timeout or None
+
+    def run(self, statement, **params):
+        left = self.remaining()
+        if left is not None and left <= 0:
+            raise Unavailable("Budget of the request exceeded")
+        if not self.slots.acquire(timeout=left):
+            with self.lock:
+                self.busy += 1
+            raise Unavailable("No free database session")
+        try:
+            with self.lock:
+                session = self.idle.pop() if self.idle else self.driver.session()
+                self.queries += 1
+            try:
+                left = self.remaining()
+                with session.begin_transaction(timeout=max(left, 0.001) if left is not None else None) as tx:
+                    return Records(tx.run(statement, params))
+            except CypherError as e:
+                if e.title not in ('TransactionTimedOut', 'Terminated'):
+                    raise
+                with self.lock:
+                    self.timeouts += 1
+                raise Unavailable("Query cancelled after exceeding the budget of the request") from e
+            except (ServiceUnavailable, ConnectionExpired) as e:
+                session.close()
+                session = None
+                raise Unavailable("Database unavailable") from e
+            finally:
+                if session is not None:
+                    with self.lock:
+                        self.idle.append(session)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        with self.lock:
+            for session in self.idle:
+                session.close()
+            self.idle = []
+        self.driver.close()
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'timeout': self.timeout,
+            'idle': len(self.idle),
+            'queries': self.queries,
+            'timeouts': self.timeouts,
+            'busy': self.busy
+        }
+
+def budget(seconds):
+    """Raises the budget of all queries of a route to at least seconds (for routes known to run long queries)."""
+    def decorator(route):
+        @functools.wraps(route)
+        def limited(*args, **kwargs):
+            if g.get('deadline') is not None:
+                g.deadline = max(g.deadline, time.monotonic() + seconds)
+            return route(*args, **kwargs)
+        return limited
+    return decorator
+
+class Cache:
+    """
+    LRU cache of navigator responses with at most size entries, each valid for ttl seconds (None for no expiry).
+    The graph only changes by imports, so all entries are dropped when its import generation changes
+    (see twista.neo4j.bump_generation), which is checked at most every check seconds.
+    Expired entries are kept until evicted, to answer requests whose queries exceed their budget (see stale).
+    """
+
+    def __init__(self, size=1024, ttl=None, check=5):
+        self.size = size
+        self.ttl = ttl
+        self.check = check
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.degraded = 0
+
+    def validate(self):
+        """Drops all entries if the import generation of the graph changed."""
+        now = time.monotonic()
+        if self.checked is not None and now - self.checked < self.check:
+            return
+        self.checked = now
+        try:
+            generation = graph.run(neo4j.current_generation).evaluate()
+        except Unavailable:
+            return
+        with self.lock:
+            if generation != self.generation:
+                if self.entries:
+                    self.invalidations += 1
+                self.entries.clear()
+                self.generation = generation
+
+    def get(self, key):
+        """Returns the cached response of a key (None if missing or expired)."""
+        self.validate()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] is not None and entry[0] < time.monotonic():
+                if entry[0] > 0:
+                    self.entries[key] = (0, entry[1])
+                    self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def stale(self, key):
+        """Returns the cached response of a key even if expired (None if missing)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.degraded += 1
+            return entry[1]
+
+    def put(self, key, response):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl if self.ttl else None, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'ttl': self.ttl,
+            'generation': self.generation,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'degraded': self.degraded
+        }
+
+cache = Cache()
+
+def cached(route):
+    """
+    Caches the responses of a route (see Cache), keyed on its path (with the path parameters),
+    the normalized begin and end of the filter and all other query parameters. Only successful responses are cached.
+    If the route is unavailable (see Sessions), an expired response is served instead if there is one.
+    """
+    @functools.wraps(route)
+    def caching(*args, **kwargs):
+        (begin, end) = filter(request.args)
+        try:
+            (begin, end) = (utc(begin).isoformat(), utc(end).isoformat())
+        except (ValueError, OverflowError):
+            pass
+        others = tuple(sorted((k, v) for (k, v) in request.args.items(multi=True) if k not in ('begin', 'end')))
+        key = (request.path, begin, end, others)
+        hit = cache.get(key)
+        if hit is not None:
+            (body, status, headers) = hit
+            return Response(body, status=status, headers=headers)
+        try:
+            response = app.make_response(route(*args, **kwargs))
+        except Unavailable:
+            stale = cache.stale(key)
+            if stale is None:
+                raise
+            (body, status, headers) = stale
+            return Response(body, status=status, headers=headers + [('Warning', '110 - "Response is Stale"')])
+        if response.status_code == 200:
+            cache.put(key, (response.get_data(), response.status_code, list(response.headers)))
+        return response
+    return caching
+
 @app.template_filter()
 def render_tweet(tweet, of={}, ctx=[]):
     return render_template('tweet_snippet.html', tweet=tweet, user=of, ctx=ctx)
@@ -60,37 +292,210 @@ def filter(args):
         end = dt.now().strftime("%Y-%m-%d")
     return (begin, end)
 
+def utc(value):
+    """Parses a filter value as UTC datetime (like datetime() in Cypher, without a timezone it is UTC)."""
+    d = parser.parse(value)
+    return d.replace(tzinfo=timezone.utc) if d.tzinfo is None else d.astimezone(timezone.utc)
+
+def rolled_up(begin, end):
+    """
+    Splits the range of a filter into the whole days read from the daily rollups (first inclusive, last exclusive)
+    and the partial days at its edges read from the tweets (inclusive ranges, like all date filters).
+    Returns ((first, last) or None, [(begin, end), ...]).
+    """
+    (b, e) = (utc(begin), utc(end))
+    first = b.date() if b == dt(b.year, b.month, b.day, tzinfo=timezone.utc) else b.date() + timedelta(days=1)
+    last = e.date()
+    if first >= last:
+        return (None, [(begin, end)])
+    edges = []
+    if b.date() < first:
+        edges.append((begin, f"{ first - timedelta(days=1) }T23:59:59.999999999Z"))
+    edges.append((str(last), end))
+    return ((str(first), str(last)), edges)
+
+def keyed(value):
+    """Record value as key (lists, e.g. of user id and screen name, are not hashable)."""
+    return tuple(value) if isinstance(value, list) else value
+
+def combined(days, rollup, edge, lookup=None, n=None, **params):
+    """
+    Combines the (key, n) records of the whole days (rollup) and of the edges of a date range (see counted and top).
+    With a lookup query, the rollup records are the top n keys only and the counts of the whole days
+    for the keys of the edges not among them are looked up (parameter keys), so the top n keys are exact.
+    """
+    counts = Counter()
+    for (k, c) in rollup:
+        counts[keyed(k)] += c
+    edges = Counter()
+    for (k, c) in edge:
+        edges[keyed(k)] += c
+    if lookup is None:
+        counts.update(edges)
+        return +counts
+    missing = [k for k in edges if k not in counts]
+    if days and missing:
+        keys = [list(k) if isinstance(k, tuple) else k for k in missing]
+        for r in graph.run(lookup, first=days[0], last=days[1], keys=keys, **params):
+            counts[keyed(r[0])] += r[1]
+    counts.update(edges)
+    return (+counts).most_common(n)
+
+def counted(rollup, raw, begin, end, **params):
+    """
+    Counts n per key of (key, n) records in a date range.
+    Whole days are counted by the rollup query (with parameters first and last),
+    the edges of the range by the raw query (with parameters begin and end).
+    """
+    (days, edges) = rolled_up(begin, end)
+    whole = graph.run(rollup, first=days[0], last=days[1], **params) if days else []
+    edge = [r for (b, e) in edges for r in graph.run(raw, begin=b, end=e, **params)]
+    return combined(days, ((r[0], r[1]) for r in whole), ((r[0], r[1]) for r in edge))
+
+def top(rollup, lookup, raw, begin, end, n=50, **params):
+    """
+    Most frequent keys of (key, n) records in a date range (like counted).
+    The rollup query returns the top n keys of the whole days, the lookup query the counts of the whole days
+    for the keys of the edges not among them (parameter keys), so the result is exact.
+    """
+    (days, edges) = rolled_up(begin, end)
+    whole = graph.run(rollup, first=days[0], last=days[1], n=n, **params) if days else []
+    edge = [r for (b, e) in edges for r in graph.run(raw, begin=b, end=e, **params)]
+    return combined(days, ((r[0], r[1]) for r in whole), ((r[0], r[1]) for r in edge), lookup, n, **params)
+
+def widgets(query, begin, end, **params):
+    """
+    Runs the query of a dashboard, a UNION ALL of aggregations returning widget, key and n, in a date range.
+    Aggregations of the rollups get the parameters first and last (an empty range without whole days),
+    aggregations of the tweets the parameters begin and end and those of the edges the list of edge ranges (edges).
+    Returns the days (like rolled_up) and the (key, n) records per widget in order.
+    """
+    (days, edges) = rolled_up(begin, end)
+    (first, last) = days or ("1970-01-01", "1970-01-01")
+    records = {}
+    for r in graph.run(query, begin=begin, end=end, first=first, last=last, edges=[list(e) for e in edges], **params):
+        records.setdefault(r['widget'], []).append((keyed(r['key']), r['n']))
+    return (days, records)
+
+def series(counts, name):
+    """Scatter plot of counts per date."""
+    points = sorted(counts.items())
+    return {
+        'x': [str(d) for d, n in points],
+        'y': [n for d, n in points],
+        'type': 'scatter',
+        'name': name
+    }
+
+def pie(counts):
+    """Pie chart of (key, n) records."""
+    return {
+        'labels': [k for k, n in counts],
+        'values': [n for k, n in counts],
+        'type': 'pie'
+    }
+
+def tag_chips(tags):
+    """Chips linking (tag, n) records to their tags."""
+    return " ".join([link(chip("#" + tag, data=n), f"/tag/{ tag }", classes=['filtered']) for tag, n in tags])
+
+def user_chips(users):
+    """Chips linking ((id, screen name), n) records to their users."""
+    return " ".join([link(chip("@" + name, data=n), f"/user/{ uid }", classes=['filtered']) for (uid, name), n in users])
+
+def punchcard(counts):
+    """Heatmap of counts per (weekday, hour)."""
+    weekdays = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+    hours = range(24)
+    return {
+        'x': [f"{h}h" for h in hours],
+        'y': weekdays,
+        'z': [[counts.get((d, h), 0) for h in hours] for d in range(1, 8)],
+        'colorscale': [
+            ['0.0', '#3F51B600'],
+            ['0.1', '#3F51B611'],
+            ['0.2', '#3F51B622'],
+            ['0.3', '#3F51B633'],
+            ['0.4', '#3F51B644'],
+            ['0.5', '#3F51B655'],
+            ['0.6', '#3F51B677'],
+            ['0.7', '#3F51B699'],
+            ['0.8', '#3F51B6BB'],
+            ['0.9', '#3F51B6DD'],
+            ['1.0', '#3F51B6FF']
+        ],
+        'type': 'heatmap'
+    }
+
+# Counts of the whole days for the keys of edges (see top)
+lookup_tags = """
+    UNWIND { keys } AS key
+    MATCH (tag:Tag{id: key}) -[u:USED_ON]-> (d:Day)
+    WHERE d.date >= date({ first }) AND d.date < date({ last })
+    RETURN tag.id AS tag, sum(u.n) AS n
+    """
+
+lookup_posts = """
+    UNWIND { keys } AS key
+    MATCH (u:User{id: key[0]}) -[a:ACTIVE_ON]-> (d:Day)
+    WHERE d.date >= date({ first }) AND d.date < date({ last })
+    RETURN [u.id, u.screen_name] AS user, sum(a.posts) AS n
+    """
+
+lookup_mentions = """
+    UNWIND { keys } AS key
+    MATCH (u:User{id: key[0]}) -[a:ACTIVE_ON]-> (d:Day)
+    WHERE d.date >= date({ first }) AND d.date < date({ last })
+    RETURN [u.id, u.screen_name] AS user, sum(a.mentions) AS n
+    """
+
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(cache.stats())
+
+@app.route('/sessions/stats')
+def sessions_stats():
+    return jsonify(graph.stats())
+
+@app.before_request
+def deadline():
+    timeout = getattr(graph, 'timeout', None)
+    g.deadline = time.monotonic() + timeout if timeout else None
+
+@app.errorhandler(Unavailable)
+def unavailable(error):
+    return jsonify({ 'error': str(error) }), 503, { 'Retry-After': '10' }
+
 @app.route('/tag/<id>')
 def tag(id):
     (begin, end) = filter(request.args)    
     return render_template('tag.html', tag=id)
 
 @app.route('/tag/<id>/volume')
+@cached
 def tag_activity(id):
     (begin, end) = filter(request.args)    
 
-    volume = [(r['date'], r['n']) for r in graph.run("""
-        MATCH (tag:Tag) <-[:HAS_TAG]- (t:Tweet)
-        WHERE toUpper(tag.id) = toUpper({ id }) AND
-              t.created_at >= datetime({ begin }) AND
+    # Tags are identified by the uppercased hashtag (see twista.neo4j.tag_id)
+    volume = counted("""
+        MATCH (tag:Tag{id: toUpper({ id })}) -[u:USED_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN d.date AS date, u.n AS n
+        """, """
+        MATCH (tag:Tag{id: toUpper({ id })}) <-[:HAS_TAG]- (t:Tweet)
+        WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN date(t.created_at) AS date, count(t) AS n
-        ORDER BY date
-        """, id=id, begin=begin, end=end)]
+        """, begin, end, id=id)
 
-    return jsonify([{
-            'x': [str(d) for d, n in volume],
-            'y': [n for d, n in volume],
-            'type': 'scatter',
-            'name': 'posts'
-        }
-    ])
+    return jsonify([series(volume, 'posts')])
 
 @app.route('/tag/<id>/behaviour')
+@cached
 def tag_behaviour(id):
     (begin, end) = filter(request.args)    
 
@@ -103,14 +508,10 @@ def tag_behaviour(id):
         ORDER BY type
         """, id=id, begin=begin, end=end)]
 
-    return jsonify([{
-            'labels': [t for t, n in volume],
-            'values': [n for d, n in volume],
-            'type': 'pie'
-        }
-    ])
+    return jsonify([pie(volume)])
 
 @app.route('/tag/<id>/tags')
+@cached
 def tag_correlated_tags(id):
     (begin, end) = filter(request.args)    
 
@@ -125,11 +526,52 @@ def tag_correlated_tags(id):
         LIMIT 50
         """, id=id, begin=begin, end=end)]
 
-    return " ".join(
-        [link(chip("#" + tag, data=n), f"/tag/{tag}", classes=['filtered']) for tag, n in tags]
-    )
+    return tag_chips(tags)
+
+@app.route('/tag/<id>/dashboard')
+@cached
+def tag_dashboard(id):
+    """
+    All widgets of the tag page (behaviour, volume and correlated tags) by one query.
+    The volume of whole days is read from the rollups, its tweets are only scanned for the types and correlated tags.
+    """
+    (begin, end) = filter(request.args)
+
+    # Tags are identified by the uppercased hashtag (see twista.neo4j.tag_id), so the tag is looked up by its id
+    (days, records) = widgets("""
+        MATCH (tag:Tag{id: toUpper({ id })}) <-[:HAS_TAG]- (t:Tweet)
+        WHERE t.created_at >= datetime({ begin }) AND
+              t.created_at <= datetime({ end })
+        RETURN 'behaviour' AS widget, t.type AS key, count(t) AS n
+        UNION ALL
+        MATCH (tag:Tag{id: toUpper({ id })}) -[u:USED_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN 'volume' AS widget, d.date AS key, u.n AS n
+        UNION ALL
+        UNWIND { edges } AS edge
+        MATCH (tag:Tag{id: toUpper({ id })}) <-[:HAS_TAG]- (t:Tweet)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'volume:edges' AS widget, date(t.created_at) AS key, count(t) AS n
+        UNION ALL
+        MATCH (tag:Tag{id: toUpper({ id })}) <-[:HAS_TAG]- (t:Tweet) -[:HAS_TAG]-> (other:Tag)
+        WHERE t.created_at >= datetime({ begin }) AND
+              t.created_at <= datetime({ end }) AND
+              tag <> other
+        RETURN 'tags' AS widget, toUpper(other.id) AS key, count(other) AS n
+        ORDER BY n DESCENDING
+        LIMIT 50
+        """, begin, end, id=id)
+
+    volume = combined(days, records.get('volume', []), records.get('volume:edges', []))
+
+    return jsonify({
+        'behaviour': [pie(sorted(records.get('behaviour', [])))],
+        'volume': [series(volume, 'posts')],
+        'tags': tag_chips(records.get('tags', []))
+    })
 
 @app.route('/tag/<id>/mentioned_users')
+@cached
 def tag_correlated_users(id):
     (begin, end) = filter(request.args)    
 
@@ -148,6 +590,7 @@ def tag_correlated_users(id):
     )
 
 @app.route('/tag/<id>/posting_users')
+@cached
 def tag_posting_users(id):
     (begin, end) = filter(request.args)    
 
@@ -166,6 +609,7 @@ def tag_posting_users(id):
     )
 
 @app.route('/tweet/<id>')
+@cached
 def tweet(id):
     (begin, end) = filter(request.args)    
 
@@ -188,14 +632,17 @@ def tweet(id):
     )
 
 @app.route('/tweet/<id>/interactions')
+@cached
 def tweet_interactions(id):
     (begin, end) = filter(request.args)    
 
     tweet = graph.run("MATCH (t:Tweet{id: { id }}) RETURN t", id=id).evaluate()
 
     volume = [(r['date'], r['hour'], r['n']) for r in graph.run("""
-        MATCH (:Tweet{id: { id }}) -[:REFERS_TO*]- (t:Tweet)
-        WHERE t.created_at >= datetime({ begin }) AND
+        MATCH (x:Tweet{id: { id }})
+        MATCH (t:Tweet{root: x.root})
+        WHERE t <> x AND
+              t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN date(t.created_at) AS date, t.created_at.hour AS hour, count(t) AS n
         ORDER BY date, hour
@@ -216,12 +663,15 @@ def tweet_interactions(id):
     }])
 
 @app.route('/tweet/<id>/interaction-types')
+@cached
 def tweet_interaction_types(id):
     (begin, end) = filter(request.args)    
 
     volume = [(r['type'], r['n']) for r in graph.run("""
-        MATCH (:Tweet{id: { id }}) -[:REFERS_TO*]- (t:Tweet)
-        WHERE t.created_at >= datetime({ begin }) AND
+        MATCH (x:Tweet{id: { id }})
+        MATCH (t:Tweet{root: x.root})
+        WHERE t <> x AND
+              t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN t.type AS type, count(t) AS n
         ORDER BY type
@@ -234,12 +684,15 @@ def tweet_interaction_types(id):
     }])
 
 @app.route('/tweet/<id>/tags')
+@cached
 def tweet_tags(id):
     (begin, end) = filter(request.args)    
 
     tags = [(r['tag'], r['n']) for r in graph.run("""
-        MATCH (:Tweet{id: { id }}) -[:REFERS_TO*]- (t:Tweet) -[:HAS_TAG]-> (tag:Tag)
-        WHERE t.created_at >= datetime({ begin }) AND
+        MATCH (x:Tweet{id: { id }})
+        MATCH (t:Tweet{root: x.root}) -[:HAS_TAG]-> (tag:Tag)
+        WHERE t <> x AND
+              t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN tag.id AS tag, count(tag) AS n
         ORDER BY n DESCENDING
@@ -251,12 +704,15 @@ def tweet_tags(id):
     )
 
 @app.route('/tweet/<id>/users')
+@cached
 def tweet_users(id):
     (begin, end) = filter(request.args)    
 
     users = [(r['user'], r['n']) for r in graph.run("""
-        MATCH (:Tweet{id: { id }}) -[:REFERS_TO*]- (t:Tweet) <-[:POSTS]- (u:User)
-        WHERE t.created_at >= datetime({ begin }) AND
+        MATCH (x:Tweet{id: { id }})
+        MATCH (t:Tweet{root: x.root}) <-[:POSTS]- (u:User)
+        WHERE t <> x AND
+              t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN u AS user, count(u) AS n
         ORDER BY n DESCENDING
@@ -268,12 +724,15 @@ def tweet_users(id):
     )
 
 @app.route('/tweet/<id>/tweets')
+@cached
 def tweet_related_tweets(id):
     (begin, end) = filter(request.args)    
 
     tweets = [{ 'tweet': r['t'], 'user': r['u'] } for r in graph.run("""
-        MATCH (:Tweet{id: { id }}) -[:REFERS_TO*]- (t:Tweet) <-[:POSTS]- (u:User)
-        WHERE t.created_at >= datetime({ begin }) AND
+        MATCH (x:Tweet{id: { id }})
+        MATCH (t:Tweet{root: x.root}) <-[:POSTS]- (u:User)
+        WHERE t <> x AND
+              t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN t, u
         ORDER BY t.created_at DESCENDING
@@ -282,11 +741,13 @@ def tweet_related_tweets(id):
     return tweetlist(tweets)
 
 @app.route('/user/<id>')
+@cached
 def user_as_html(id):
     result = graph.run("MATCH (u:User{id: {id}}) RETURN u", id=id).evaluate()
     return render_template('user.html', user=result)
 
 @app.route('/user/<id>/behaviour')
+@cached
 def user_behaviour(id):
     (begin, end) = filter(request.args)    
 
@@ -296,60 +757,58 @@ def user_behaviour(id):
         RETURN t.type AS type, count(t) AS n
         """, id=id, begin=begin, end=end)]
 
-    return jsonify([{
-        'labels': [t for t, n in result],
-        'values': [n for t, n in result],
-        'type': 'pie'
-    }])
+    return jsonify([pie(result)])
 
 @app.route('/user/<id>/activity')
+@cached
 def user_activity(id):
     (begin, end) = filter(request.args)    
 
-    posts = [(r['date'], r['n']) for r in graph.run("""
+    posts = counted("""
+        MATCH (u:User{id: {id}}) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({first}) AND d.date < date({last})
+        RETURN d.date AS date, a.posts AS n
+        """, """
         MATCH (u:User{id: {id}}) -[:POSTS]-> (t:Tweet)
         WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end})
         RETURN date(t.created_at) AS date, count(t) AS n
-        ORDER BY date
-        """, id=id, begin=begin, end=end)]
+        """, begin, end, id=id)
 
-    reactions = [(r['date'], r['n']) for r in graph.run("""
-        MATCH (u:User{id: {id}}) -[:POSTS]-> (:Tweet) <-[:REFERS_TO*]- (o:Tweet)
-        WHERE o.created_at >= datetime({begin}) AND o.created_at <= datetime({end})
+    # Reactions are transitive (not rolled up): cascades of roots are looked up by their root id, others are traversed
+    reactions = Counter()
+    for r in graph.run("""
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (p:Tweet{depth: 0})
+        MATCH (o:Tweet{root: p.id})
+        WHERE o <> p AND o.created_at >= datetime({begin}) AND o.created_at <= datetime({end})
         RETURN date(o.created_at) AS date, count(o) AS n
-        ORDER BY date
-        """, id=id, begin=begin, end=end)]
+        """, id=id, begin=begin, end=end):
+        reactions[r['date']] += r['n']
+    for r in graph.run("""
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (p:Tweet) <-[:REFERS_TO*]- (o:Tweet)
+        WHERE p.depth > 0 AND o.created_at >= datetime({begin}) AND o.created_at <= datetime({end})
+        RETURN date(o.created_at) AS date, count(o) AS n
+        """, id=id, begin=begin, end=end):
+        reactions[r['date']] += r['n']
 
-    mentions = [(r['date'], r['n']) for r in graph.run("""
+    mentions = counted("""
+        MATCH (u:User{id: {id}}) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({first}) AND d.date < date({last})
+        RETURN d.date AS date, a.mentions AS n
+        """, """
         MATCH (u:User{id: {id}}) <-[:MENTIONS]- (t:Tweet)
         WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end})
         RETURN date(t.created_at) AS date, count(t) AS n
-        ORDER BY date
-        """, id=id, begin=begin, end=end)]
+        """, begin, end, id=id)
 
-    return jsonify([{
-        'x': [str(t) for t, n in posts],
-        'y': [n for t, n in posts],
-        'name': 'posts',
-        'type': 'scatter'
-    }, {
-        'x': [str(t) for t, n in reactions],
-        'y': [n for t, n in reactions],
-        'name': 'reactions',
-        'type': 'scatter'
-    }, {
-        'x': [str(t) for t, n in mentions],
-        'y': [n for t, n in mentions],
-        'name': 'mentions',
-        'type': 'scatter'
-    }])
+    return jsonify([series(posts, 'posts'), series(reactions, 'reactions'), series(mentions, 'mentions')])
 
 @app.route('/user/<id>/interactors')
+@cached
 def user_interactors(id):
     (begin, end) = filter(request.args)    
     action = request.args.get("type", default="retweet")
 
-    result = " ".join([link(chip("@" + r['user']['screen_name'], data=r['n']), f"/user/{ r['user']['id'] }", classes=['filtered']) for r in graph.run("""
+    return user_chips([((r['user']['id'], r['user']['screen_name']), r['n']) for r in graph.run("""
         MATCH (u:User{id: {id}}) -[:POSTS]-> (:Tweet) <-[:REFERS_TO]- (t:Tweet{type: {action}}) <-[:POSTS]- (user:User)
         WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end}) AND user <> u
         RETURN user, count(user) AS n
@@ -357,13 +816,12 @@ def user_interactors(id):
         LIMIT 50
         """, id=id, begin=begin, end=end, action=action)])
 
-    return result
-
 @app.route('/user/<id>/tags')
+@cached
 def user_tags(id):
     (begin, end) = filter(request.args)    
 
-    result = " ".join([link(chip("#" + r['tag'], data=r['n']), f"/tag/{ r['tag'] }", classes=['filtered']) for r in graph.run("""
+    return tag_chips([(r['tag'], r['n']) for r in graph.run("""
         MATCH (u:User{id: {id}}) -[:POSTS]-> (t:Tweet) -[:HAS_TAG]-> (tag:Tag)
         WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end})
         RETURN tag.id AS tag, count(tag) AS n
@@ -371,9 +829,8 @@ def user_tags(id):
         LIMIT 50
         """, id=id, begin=begin, end=end)])
 
-    return result
-
 @app.route('/user/<id>/contents')
+@cached
 def user_posts(id):
     of = request.args.get("of")
 
@@ -389,6 +846,7 @@ def user_posts(id):
     return tweetlist(tweets)
 
 @app.route('/user/<id>/info')
+@cached
 def user_info(id):
     (begin, end) = filter(request.args)    
 
@@ -396,43 +854,86 @@ def user_info(id):
     return render_template('user_info.html', user=user)
 
 @app.route('/user/<id>/punchcard')
+@cached
 def user_punchcard(id):
     (begin, end) = filter(request.args)
 
-    pc = { d: { h: 0 for h in range(24) } for d in range(1, 8) }
-    for r in graph.run("""
+    pc = { (r['day'], r['hour']): r['n'] for r in graph.run("""
         MATCH (u:User{id: {id}}) -[:POSTS]-> (t:Tweet)
         WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end})
         RETURN t.created_at.weekday AS day, t.created_at.hour AS hour, count(t) AS n
-        """, id=id, begin=begin, end=end):
-        pc[r['day']][r['hour']] = r['n']
+        """, id=id, begin=begin, end=end) }
 
-    weekdays =['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-    hours = range(24)
+    return jsonify([punchcard(pc)])
 
-    data = [{
-        'x': [f"{h}h" for h in hours],
-        'y': weekdays,
-        'z': [[pc[d][h] for h in hours] for d in range(1, 8)],
-        'colorscale': [
-            ['0.0', '#3F51B600'],
-            ['0.1', '#3F51B611'],
-            ['0.2', '#3F51B622'],
-            ['0.3', '#3F51B633'],
-            ['0.4', '#3F51B644'],
-            ['0.5', '#3F51B655'],
-            ['0.6', '#3F51B677'],
-            ['0.7', '#3F51B699'],
-            ['0.8', '#3F51B6BB'],
-            ['0.9', '#3F51B6DD'],
-            ['1.0', '#3F51B6FF']
-        ],
-        'type': 'heatmap'
-    }]
+@app.route('/user/<id>/dashboard')
+@cached
+def user_dashboard(id):
+    """
+    All widgets of the user page except the network (behaviour, tags, retweeters, quoters, activity and punchcard)
+    by one query. Posts are scanned once for behaviour, activity and punchcard.
+    """
+    (begin, end) = filter(request.args)
 
-    return jsonify(data)
+    (days, records) = widgets("""
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (t:Tweet)
+        WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end})
+        RETURN 'posts' AS widget, [date(t.created_at), t.type, t.created_at.weekday, t.created_at.hour] AS key, count(t) AS n
+        UNION ALL
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (t:Tweet) -[:HAS_TAG]-> (tag:Tag)
+        WHERE t.created_at >= datetime({begin}) AND t.created_at <= datetime({end})
+        RETURN 'tags' AS widget, tag.id AS key, count(tag) AS n
+        ORDER BY n DESCENDING
+        LIMIT 50
+        UNION ALL
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (:Tweet) <-[:REFERS_TO]- (t:Tweet) <-[:POSTS]- (user:User)
+        WHERE t.type IN ['retweet', 'quote'] AND
+              t.created_at >= datetime({begin}) AND t.created_at <= datetime({end}) AND user <> u
+        WITH t.type AS type, user, count(user) AS n
+        ORDER BY n DESCENDING
+        WITH type, collect([user.id, user.screen_name, n])[..50] AS users
+        UNWIND users AS user
+        RETURN type AS widget, user[..2] AS key, user[2] AS n
+        UNION ALL
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (p:Tweet{depth: 0})
+        MATCH (o:Tweet{root: p.id})
+        WHERE o <> p AND o.created_at >= datetime({begin}) AND o.created_at <= datetime({end})
+        RETURN 'reactions' AS widget, date(o.created_at) AS key, count(o) AS n
+        UNION ALL
+        MATCH (u:User{id: {id}}) -[:POSTS]-> (p:Tweet) <-[:REFERS_TO*]- (o:Tweet)
+        WHERE p.depth > 0 AND o.created_at >= datetime({begin}) AND o.created_at <= datetime({end})
+        RETURN 'reactions' AS widget, date(o.created_at) AS key, count(o) AS n
+        UNION ALL
+        MATCH (u:User{id: {id}}) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({first}) AND d.date < date({last})
+        RETURN 'mentions' AS widget, d.date AS key, a.mentions AS n
+        UNION ALL
+        UNWIND {edges} AS edge
+        MATCH (u:User{id: {id}}) <-[:MENTIONS]- (t:Tweet)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'mentions:edges' AS widget, date(t.created_at) AS key, count(t) AS n
+        """, begin, end, id=id)
+
+    (posts, behaviour, pc) = (Counter(), Counter(), Counter())
+    for ((date, kind, day, hour), n) in records.get('posts', []):
+        posts[date] += n
+        behaviour[kind] += n
+        pc[(day, hour)] += n
+    reactions = combined(days, records.get('reactions', []), [])
+    mentions = combined(days, records.get('mentions', []), records.get('mentions:edges', []))
+
+    return jsonify({
+        'behaviour': [pie(sorted(behaviour.items()))],
+        'tags': tag_chips(records.get('tags', [])),
+        'retweeters': user_chips(records.get('retweet', [])),
+        'quoters': user_chips(records.get('quote', [])),
+        'activity': [series(posts, 'posts'), series(reactions, 'reactions'), series(mentions, 'mentions')],
+        'punchcard': [punchcard(pc)]
+    })
 
 @app.route('/user/<id>/network')
+@cached
+@budget(30)
 def user_network(id):
     (begin, end) = filter(request.args)    
 
@@ -456,11 +957,12 @@ def user_network(id):
         process = new - scanned
         scanned = scanned.union(new)
 
-    nodes = [u for u, _, _ in retweeters]
-    nodes.extend([rt for _, rt, _ in retweeters])
+    # Nodes of the driver are only equal within one result, so users are unique by their ids (every hop is a query)
+    nodes = { u['id']: u for u, _, _ in retweeters }
+    nodes.update({ rt['id']: rt for _, rt, _ in retweeters })
     mark = lambda n: 'start' if (n['id'] == user['id']) else 'follow'
     network = { 
-        'nodes': [{ 'data': { 'id': u['id'], 'screen_name': "@" + u['screen_name'], 'select': mark(u) }} for u in set(nodes)], 
+        'nodes': [{ 'data': { 'id': u['id'], 'screen_name': "@" + u['screen_name'], 'select': mark(u) }} for u in nodes.values()], 
         'edges': [{ 'data': { 'source': u['id'], 'target': rt['id'], 'directed': True, 'qty': n }} for u, rt, n in retweeters] 
     }
 
@@ -468,105 +970,204 @@ def user_network(id):
     # return render_template('network.js', user=user, elements=json.dumps(network))
 
 @app.route('/tweets/volume')
+@cached
 def tweets_volume():
     (begin, end) = filter(request.args)    
 
-    tweets = [(r['date'], r['n']) for r in graph.run("""
+    tweets = counted("""
+        MATCH (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN d.date AS date, d.tweets AS n
+        """, """
         MATCH (t:Tweet)
         WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN date(t.created_at) AS date, count(t) AS n
-        """, begin=begin, end=end)]
-
-    users = [(r['date'], r['n']) for r in graph.run("""
+        """, begin, end)
+
+    # Edges are partial days (not whole ones), so unique users of a day are counted by one query
+    users = counted("""
+        MATCH (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN d.date AS date, d.posters AS n
+        """, """
         MATCH (t:Tweet) <-[:POSTS]- (u:User)
         WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN date(t.created_at) AS date, count(distinct(u)) AS n
-        """, begin=begin, end=end)]
-
-    return jsonify([
-        {
-            'x': [str(d) for d, n in tweets],
-            'y': [n for d, n in tweets],
-            'type': 'scatter',
-            'name': 'postings'
-        }, {
-            'x': [str(d) for d, n in users],
-            'y': [n for d, n in users],
-            'type': 'scatter',
-            'name': 'active unique users'
-        }
-    ])
+        """, begin, end)
+
+    return jsonify([series(tweets, 'postings'), series(users, 'active unique users')])
 
 @app.route('/tweets/tags')
+@cached
 def tweets_tags_volume():
     (begin, end) = filter(request.args)    
 
-    volume = [(r['tag'], r['n']) for r in graph.run("""
+    volume = top("""
+        MATCH (tag:Tag) -[u:USED_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN tag.id AS tag, sum(u.n) AS n
+        ORDER BY n DESCENDING
+        LIMIT { n }
+        """, lookup_tags, """
         MATCH (t:Tweet) -[:HAS_TAG]-> (tag:Tag)
         WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN tag.id AS tag, count(tag) AS n
-        ORDER BY n DESCENDING
-        LIMIT 50
-        """, begin=begin, end=end)]
+        """, begin, end)
 
-    return " ".join(
-        [link(chip("#" + tag, data=n), f"/tag/{tag}", classes=["filtered"]) for tag, n in volume]
-    )
+    return tag_chips(volume)
 
 @app.route('/tweets/posting-users')
+@cached
 def tweets_most_posting_users():
     (begin, end) = filter(request.args)    
 
-    volume = [(r['u'], r['n']) for r in graph.run("""
+    volume = top("""
+        MATCH (u:User) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        WITH u, sum(a.posts) AS n
+        WHERE n > 0
+        RETURN [u.id, u.screen_name] AS user, n
+        ORDER BY n DESCENDING
+        LIMIT { n }
+        """, lookup_posts, """
         MATCH (t:Tweet) <-[:POSTS]- (u:User)
         WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
-        RETURN u, count(t) AS n
-        ORDER BY n DESCENDING
-        LIMIT 50
-        """, begin=begin, end=end)]
+        RETURN [u.id, u.screen_name] AS user, count(t) AS n
+        """, begin, end)
 
-    return " ".join(
-        [link(chip("@" + usr['screen_name'], data=n), f"/user/{usr['id']}", classes=["filtered"]) for usr, n in volume]
-    )
+    return user_chips(volume)
 
 @app.route('/tweets/mentioned-users')
+@cached
 def tweets_most_mentioned_users():
     (begin, end) = filter(request.args)    
 
-    volume = [(r['u'], r['n']) for r in graph.run("""
+    volume = top("""
+        MATCH (u:User) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        WITH u, sum(a.mentions) AS n
+        WHERE n > 0
+        RETURN [u.id, u.screen_name] AS user, n
+        ORDER BY n DESCENDING
+        LIMIT { n }
+        """, lookup_mentions, """
         MATCH (t:Tweet) -[:MENTIONS]-> (u:User)
         WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
-        RETURN u, count(t) AS n
-        ORDER BY n DESCENDING
-        LIMIT 50
-        """, begin=begin, end=end)]
+        RETURN [u.id, u.screen_name] AS user, count(t) AS n
+        """, begin, end)
 
-    return " ".join(
-        [link(chip("@" + usr['screen_name'], data=n), f"/user/{usr['id']}", classes=["filtered"]) for usr, n in volume]
-    )
+    return user_chips(volume)
 
 @app.route('/tweets/types')
+@cached
 def tweets_type_volume():
     (begin, end) = filter(request.args)    
 
-    volume = [(r['type'], r['n']) for r in graph.run("""
+    volume = counted("""
+        MATCH (k:TweetType) -[u:USED_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN k.id AS type, u.n AS n
+        """, """
         MATCH (t:Tweet)
         WHERE t.created_at >= datetime({ begin }) AND
               t.created_at <= datetime({ end })
         RETURN t.type AS type, count(t) AS n
-        ORDER BY type
-        """, begin=begin, end=end)]
+        """, begin, end)
 
-    return jsonify([{
-        'labels': [t for t, n in volume],
-        'values': [n for t, n in volume],
-        'type': 'pie'
-    }])
+    return jsonify([pie(sorted(volume.items()))])
+
+@app.route('/tweets/dashboard')
+@cached
+def tweets_dashboard():
+    """
+    All widgets of the index page (volume, types, tags, posting and mentioned users) by one query.
+    Whole days are read from the rollups, the tweets of the edges are scanned once.
+    """
+    (begin, end) = filter(request.args)
+    n = 50
+
+    (days, records) = widgets("""
+        MATCH (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN 'tweets' AS widget, d.date AS key, d.tweets AS n
+        UNION ALL
+        MATCH (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN 'posters' AS widget, d.date AS key, d.posters AS n
+        UNION ALL
+        MATCH (k:TweetType) -[u:USED_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN 'types' AS widget, k.id AS key, sum(u.n) AS n
+        UNION ALL
+        MATCH (tag:Tag) -[u:USED_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        RETURN 'tags' AS widget, tag.id AS key, sum(u.n) AS n
+        ORDER BY n DESCENDING
+        LIMIT { n }
+        UNION ALL
+        MATCH (u:User) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        WITH u, sum(a.posts) AS n
+        WHERE n > 0
+        RETURN 'posting' AS widget, [u.id, u.screen_name] AS key, n
+        ORDER BY n DESCENDING
+        LIMIT { n }
+        UNION ALL
+        MATCH (u:User) -[a:ACTIVE_ON]-> (d:Day)
+        WHERE d.date >= date({ first }) AND d.date < date({ last })
+        WITH u, sum(a.mentions) AS n
+        WHERE n > 0
+        RETURN 'mentioned' AS widget, [u.id, u.screen_name] AS key, n
+        ORDER BY n DESCENDING
+        LIMIT { n }
+        UNION ALL
+        UNWIND { edges } AS edge
+        MATCH (t:Tweet)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'tweets:edges' AS widget, [date(t.created_at), t.type] AS key, count(t) AS n
+        UNION ALL
+        UNWIND { edges } AS edge
+        MATCH (t:Tweet) <-[:POSTS]- (u:User)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'posters:edges' AS widget, date(t.created_at) AS key, count(distinct(u)) AS n
+        UNION ALL
+        UNWIND { edges } AS edge
+        MATCH (t:Tweet) -[:HAS_TAG]-> (tag:Tag)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'tags:edges' AS widget, tag.id AS key, count(tag) AS n
+        UNION ALL
+        UNWIND { edges } AS edge
+        MATCH (t:Tweet) <-[:POSTS]- (u:User)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'posting:edges' AS widget, [u.id, u.screen_name] AS key, count(t) AS n
+        UNION ALL
+        UNWIND { edges } AS edge
+        MATCH (t:Tweet) -[:MENTIONS]-> (u:User)
+        WHERE t.created_at >= datetime(edge[0]) AND t.created_at <= datetime(edge[1])
+        RETURN 'mentioned:edges' AS widget, [u.id, u.screen_name] AS key, count(t) AS n
+        """, begin, end, n=n)
+
+    (tweets, types) = (Counter(), Counter())
+    for ((date, kind), c) in records.get('tweets:edges', []):
+        tweets[date] += c
+        types[kind] += c
+    tweets = combined(days, records.get('tweets', []), tweets.items())
+    types = combined(days, records.get('types', []), types.items())
+    users = combined(days, records.get('posters', []), records.get('posters:edges', []))
+    edge = lambda widget: records.get(f"{ widget }:edges", [])
+
+    return jsonify({
+        'volume': [series(tweets, 'postings'), series(users, 'active unique users')],
+        'types': [pie(sorted(types.items()))],
+        'tags': tag_chips(combined(days, records.get('tags', []), edge('tags'), lookup_tags, n)),
+        'posting': user_chips(combined(days, records.get('posting', []), edge('posting'), lookup_posts, n)),
+        'mentioned': user_chips(combined(days, records.get('mentioned', []), edge('mentioned'), lookup_mentions, n))
+    })
 
 @app.route('/search')
 def search():
@@ -582,6 +1183,7 @@ def search_tweets():
     return f"Searching for '{search}' in tweets works basically"
 
 @app.route('/search/user')
+@cached
 def search_users():
     search = request.args.get("searchterm", default="")
 
@@ -597,6 +1199,7 @@ def search_users():
 
 
 @app.route('/retweets/')
+@cached
 def get_retweets():
     (begin, end) = filter(request.args)    
     sid = request.args.get("source")
@@ -612,6 +1215,7 @@ def get_retweets():
     return render_template('tweet_list.html', tweets=result)
 
 @app.route('/stats/postings')
+@cached
 def stats_for_postings():
     (begin, end) = filter(request.args)    
 
@@ -628,10 +1232,37 @@ def stats_for_postings():
     return jsonify({ f: n / N * 100 for f, n in r.items() })
     
 
-def start(settings):
+def connect(settings, pool=8, timeout=10):
+    """Connects the navigator to Neo4j by a bounded pool of sessions (see Sessions)."""
     global graph
-    url = settings['neo4j_url']
-    usr = settings['neo4j_usr']
-    pwd = settings['neo4j_pwd']
-    graph = Graph(url, auth=(usr, pwd))
-    app.run()
\ No newline at end of file
+    driver = GraphDatabase.driver(
+        settings['neo4j_url'],
+        auth=(settings['neo4j_usr'], settings['neo4j_pwd']),
+        max_connection_pool_size=pool,
+        connection_acquisition_timeout=timeout or 60
+    )
+    graph = Sessions(driver, pool, timeout)
+
+def start(settings, host=None, port=None, workers=None, threads=None, pool=None, timeout=None, debug=False):
+    """
+    Starts the navigator. Arguments not given are taken from the settings (navigator_host, navigator_port, navigator_workers,
+    navigator_threads, navigator_pool and navigator_timeout) or their defaults.
+    Serves by workers processes of threads threads (see twista.serving, navigator_backlog requests wait for a thread
+    at most, 4 per thread by default), each worker with its own cache and a pool of
+    (by default) one session per thread. Queries of a request are cancelled after timeout seconds (0 for no limit).
+    With debug, the development server of Flask is used instead.
+    """
+    global cache
+    option = lambda value, key, default: value if value is not None else settings.get(key, default)
+    host = option(host, 'navigator_host', '127.0.0.1')
+    port = option(port, 'navigator_port', 5000)
+    workers = option(workers, 'navigator_workers', 1)
+    threads = option(threads, 'navigator_threads', 8)
+    pool = option(pool, 'navigator_pool', threads)
+    timeout = option(timeout, 'navigator_timeout', 10)
+    cache = Cache(settings.get('navigator_cache_size', 1024), settings.get('navigator_cache_ttl'))
+    if debug:
+        connect(settings, pool, timeout)
+        app.run(host, port, debug=True)
+        return
+    serving.serve(app, host, port, workers, threads, lambda: connect(settings, pool, timeout), settings.get('navigator_backlog'))
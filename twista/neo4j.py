@@ -1,7 +1,9 @@
 from tqdm import tqdm
-import gzip
+import glob
 import json
-import copy
+import re
+import collections
+import itertools
 import os
 import sys
 import time
@@ -10,13 +12,79 @@ import click
 import urllib
 import tarfile
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from neo4j import SessionExpired
+from neo4j.exceptions import TransientError, ServiceUnavailable
+from neo4j.exceptions import ConstraintError
+from twista import compression
+from twista.compression import PART
+from twista.seen import Seen
+from twista.manifest import Manifest
+from twista.metrics import Metrics
 
+# Daily rollups of the navigator, maintained for created tweets and relationships only.
+# Each rollup statement continues an import statement with rows of the day (a date) and the number n of created items
+# (tweets without created_at are not rolled up, like the date filters of the navigator skip them).
+rollup_tweets = """
+    WITH * WHERE day IS NOT NULL
+    MERGE (d:Day{date: day})
+    ON CREATE SET d.tweets = 0, d.posters = 0
+    SET d.tweets = d.tweets + n
+    MERGE (k:TweetType{id: type})
+    MERGE (k) -[u:USED_ON]-> (d)
+    ON CREATE SET u.n = 0
+    SET u.n = u.n + n
+    """
+
+rollup_posts = """
+    WITH * WHERE day IS NOT NULL
+    MERGE (d:Day{date: day})
+    ON CREATE SET d.tweets = 0, d.posters = 0
+    MERGE (u) -[a:ACTIVE_ON]-> (d)
+    ON CREATE SET a.posts = 0, a.mentions = 0
+    FOREACH (_ IN CASE WHEN a.posts = 0 THEN [1] ELSE [] END | SET d.posters = d.posters + 1)
+    SET a.posts = a.posts + n
+    """
+
+rollup_mentions = """
+    WITH * WHERE day IS NOT NULL
+    MERGE (d:Day{date: day})
+    ON CREATE SET d.tweets = 0, d.posters = 0
+    MERGE (u) -[a:ACTIVE_ON]-> (d)
+    ON CREATE SET a.posts = 0, a.mentions = 0
+    SET a.mentions = a.mentions + n
+    """
+
+rollup_tags = """
+    WITH * WHERE day IS NOT NULL
+    MERGE (d:Day{date: day})
+    ON CREATE SET d.tweets = 0, d.posters = 0
+    MERGE (r) -[u:USED_ON]-> (d)
+    ON CREATE SET u.n = 0
+    SET u.n = u.n + n
+    """
+
+# Nodes and relationships merged by the import statements are marked as new on creation (and only those are rolled up).
+# WITH DISTINCT counts an item once, even if several rows of a batch merge it.
+# Tweets are created as root of their own cascade (root id and depth, see merge_refers).
 import_tweets = """
     WITH {json} as data
     UNWIND data AS row
     MERGE (r:Tweet{id: row.id}) 
+    ON CREATE SET r.new = true, r.root = row.id, r.depth = 0
     SET r+=row, r.created_at=datetime(row.created_at), r.recorded_at=datetime(row.recorded_at)
-    """
+    WITH DISTINCT r WHERE r.new
+    REMOVE r.new
+    WITH date(r.created_at) AS day, r.type AS type, count(r) AS n
+    """ + rollup_tweets
+
+create_tweets = """
+    WITH {json} as data
+    UNWIND data AS row
+    CREATE (r:Tweet)
+    SET r=row, r.created_at=datetime(row.created_at), r.recorded_at=datetime(row.recorded_at), r.root=row.id, r.depth=0
+    WITH date(r.created_at) AS day, r.type AS type, count(r) AS n
+    """ + rollup_tweets
 
 import_users = """
     WITH {json} as data
@@ -25,29 +93,75 @@ import_users = """
     SET r+=row, r.created_at=datetime(row.created_at), r.recorded_at=datetime(row.recorded_at)
     """
 
+create_users = """
+    WITH {json} as data
+    UNWIND data AS row
+    CREATE (r:User)
+    SET r=row, r.created_at=datetime(row.created_at), r.recorded_at=datetime(row.recorded_at)
+    """
+
 merge_posts = """
     WITH {json} as data
     UNWIND data AS row
     MATCH (t:Tweet{id: row.tweet_id})
     MATCH (u:User{id: row.user_id})
-    MERGE (u) -[:POSTS]-> (t)
+    MERGE (u) -[p:POSTS]-> (t)
+    ON CREATE SET p.new = true
+    WITH DISTINCT p, u, t WHERE p.new
+    REMOVE p.new
+    WITH u, date(t.created_at) AS day, count(p) AS n
+    """ + rollup_posts
+
+# A tweet refers to at most one tweet, so cascades are trees and a tweet gaining its reference was the root of its cascade.
+# Its cascade is moved below the top of its new reference chain (which is followed upwards).
+move_cascades = """
+    WITH t
+    MATCH path = (t) -[:REFERS_TO*]-> (root:Tweet)
+    WHERE NOT (root) -[:REFERS_TO]-> ()
+    WITH t.id AS old, root.id AS top, length(path) AS distance
+    MATCH (s:Tweet{root: old})
+    SET s.root = top, s.depth = s.depth + distance
     """
 
+# References to tweets not imported yet are kept as pending (t.ref) and linked once the referenced tweet is created
+# (see link_waiting), so references may arrive in any order across chunks.
 merge_refers = """
     WITH {json} as data
     UNWIND data AS row
     MATCH (t:Tweet{id: row.tweet_id})
-    MATCH (r:Tweet{id: row.ref_tweet_id})
-    MERGE (t) -[:REFERS_TO]-> (r)
-    """
+    OPTIONAL MATCH (r:Tweet{id: row.ref_tweet_id})
+    FOREACH (_ IN CASE WHEN r IS NULL THEN [1] ELSE [] END | SET t.ref = row.ref_tweet_id)
+    WITH t, r WHERE r IS NOT NULL
+    MERGE (t) -[x:REFERS_TO]-> (r)
+    ON CREATE SET x.new = true
+    WITH DISTINCT x, t WHERE x.new
+    REMOVE x.new
+    """ + move_cascades
+
+# Links the tweets waiting for the given (created) tweet ids to them
+link_waiting = """
+    WITH {json} AS data
+    UNWIND data AS ref
+    MATCH (r:Tweet{id: ref})
+    MATCH (t:Tweet{ref: ref})
+    REMOVE t.ref
+    MERGE (t) -[x:REFERS_TO]-> (r)
+    ON CREATE SET x.new = true
+    WITH DISTINCT x, t WHERE x.new
+    REMOVE x.new
+    """ + move_cascades
 
 merge_mentions = """
     WITH {json} AS data
     UNWIND data AS row
     MATCH (t:Tweet{id: row.tweet_id})
     MATCH (u:User{id: row.mentioned_id})
-    MERGE (t) -[:MENTIONS]-> (u)
-    """
+    MERGE (t) -[m:MENTIONS]-> (u)
+    ON CREATE SET m.new = true
+    WITH DISTINCT m, u, t WHERE m.new
+    REMOVE m.new
+    WITH u, date(t.created_at) AS day, count(m) AS n
+    """ + rollup_mentions
 
 create_tags = """
     WITH {json} AS data
@@ -55,13 +169,23 @@ create_tags = """
     MERGE (t:Tag{id:tag})
     """
 
+create_new_tags = """
+    WITH {json} AS data
+    UNWIND data as tag
+    CREATE (t:Tag{id:tag})
+    """
+
 merge_tags = """
     WITH {json} AS data
     UNWIND data as row
     MATCH (t:Tweet{id: row.tweet_id})
     MATCH (r:Tag{id: row.tag})
-    MERGE (t) -[:HAS_TAG]-> (r)
-    """
+    MERGE (t) -[h:HAS_TAG]-> (r)
+    ON CREATE SET h.new = true
+    WITH DISTINCT h, r, t WHERE h.new
+    REMOVE h.new
+    WITH r, date(t.created_at) AS day, count(h) AS n
+    """ + rollup_tags
 
 create_urls = """
     WITH {json} AS data
@@ -69,6 +193,12 @@ create_urls = """
     MERGE (t:Url{id:url})
     """
 
+create_new_urls = """
+    WITH {json} AS data
+    UNWIND data as url
+    CREATE (t:Url{id:url})
+    """
+
 merge_urls = """
     WITH {json} AS data
     UNWIND data as row
@@ -77,97 +207,738 @@ merge_urls = """
     MERGE (t) -[:HAS_URL]-> (u)
     """
 
-def import_records(graph, records):
+# Rebuild of the daily rollups from the tweets of a day
+rebuild_tweets = """
+    MATCH (r:Tweet)
+    WHERE r.created_at >= datetime({day}) AND r.created_at < datetime({day}) + duration('P1D')
+    WITH date(r.created_at) AS day, r.type AS type, count(r) AS n
+    """ + rollup_tweets
+
+rebuild_posts = """
+    MATCH (u:User) -[p:POSTS]-> (t:Tweet)
+    WHERE t.created_at >= datetime({day}) AND t.created_at < datetime({day}) + duration('P1D')
+    WITH u, date(t.created_at) AS day, count(p) AS n
+    """ + rollup_posts
 
-    # Generate indexes (if not exist)
-    graph.run("CREATE CONSTRAINT ON (r:Tweet) ASSERT r.id IS UNIQUE")
-    graph.run("CREATE INDEX ON :Tweet(created_at)")
-    graph.run("CREATE INDEX ON :Tweet(type)")
-    graph.run("CREATE CONSTRAINT ON (r:User) ASSERT r.id IS UNIQUE")
-    graph.run("CREATE INDEX ON :User(created_at)")
-    graph.run("CREATE INDEX ON :User(screen_name)")
-    graph.run("CREATE CONSTRAINT ON (t:Tag) ASSERT t.id IS UNIQUE")
-    graph.run("CREATE CONSTRAINT ON (u:Url) ASSERT u.id IS UNIQUE")
+rebuild_mentions = """
+    MATCH (t:Tweet) -[m:MENTIONS]-> (u:User)
+    WHERE t.created_at >= datetime({day}) AND t.created_at < datetime({day}) + duration('P1D')
+    WITH u, date(t.created_at) AS day, count(m) AS n
+    """ + rollup_mentions
+
+rebuild_tags = """
+    MATCH (t:Tweet) -[h:HAS_TAG]-> (r:Tag)
+    WHERE t.created_at >= datetime({day}) AND t.created_at < datetime({day}) + duration('P1D')
+    WITH r, date(t.created_at) AS day, count(h) AS n
+    """ + rollup_tags
+
+# Rebuild of the cascade root ids and depths of the tweets of a day
+set_cascades = """
+    MATCH (t:Tweet)
+    WHERE t.created_at >= datetime({day}) AND t.created_at < datetime({day}) + duration('P1D')
+    MATCH path = (t) -[:REFERS_TO*0..]-> (root:Tweet)
+    WHERE NOT (root) -[:REFERS_TO]-> ()
+    SET t.root = root.id, t.depth = length(path)
+    """
+
+# Generation of the graph, counted up whenever an import changed it (e.g. to invalidate caches of the navigator)
+bump_generation = """
+    MERGE (g:Generation{id: 'import'})
+    ON CREATE SET g.n = 0
+    SET g.n = g.n + 1
+    """
+
+current_generation = "MATCH (g:Generation{id: 'import'}) RETURN g.n"
+
+delete_days = """
+    MATCH (d:Day)
+    WITH d LIMIT {n}
+    DETACH DELETE d
+    RETURN count(d)
+    """
+
+delete_tweet_types = "MATCH (k:TweetType) DETACH DELETE k"
+
+tweet_days = """
+    MATCH (t:Tweet)
+    WHERE exists(t.created_at)
+    RETURN DISTINCT toString(date(t.created_at)) AS day
+    ORDER BY day
+    """
+
+def read_chunk(f):
+    """
+    Reads all entities of a recorded chunk.
+    Handles both, JSON array chunks (*.json.gz) and newline delimited chunks (*.ndjson.gz).
+    The compression codec is detected by magic bytes (see twista.compression).
+    """
+    return list(entities(f))
+
+# Whitespace and separators between the entities of a JSON array chunk
+SEPARATORS = re.compile(r'[\s,]*')
+
+def entities(f, block=1 << 16):
+    """
+    Yields the entities of a recorded chunk one by one.
+    JSON array chunks are decoded incrementally (block by block with raw_decode),
+    so neither the decompressed text nor all entities of a chunk are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with compression.open(f, "rt") as chunk:
+        head = chunk.read(1)
+        while head.isspace():
+            head = chunk.read(1)
+        if not head:
+            return
+        if head != '[':
+            for line in itertools.chain([head + chunk.readline()], chunk):
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        (buffer, pos, eof) = ("", 0, False)
+        while True:
+            pos = SEPARATORS.match(buffer, pos).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("Incomplete entity", buffer, pos)
+                (entity, pos) = decoder.raw_decode(buffer, pos)
+                yield entity
+            except json.JSONDecodeError:
+                # The closing bracket is missing at the end of a truncated chunk
+                if eof:
+                    raise
+                more = chunk.read(block)
+                eof = not more
+                (buffer, pos) = (buffer[pos:] + more, 0)
+
+def import_records(graph, records, prefetch=2, workers=None, batch_sizes={}, retries=3, timings=None, stream=False, profile=None, manifest='imported.log', seen='imported.db'):
+    """
+    Imports recorded chunks into the graph. Returns the Importer (with the timings of all batches).
+    With profile (a file) the time of all phases and stages per chunk and the result counters are written to it as JSON.
+    manifest and seen are the files of the import log (see twista.manifest) and the seen store (see twista.seen).
+    The import statements maintain the daily rollups of the navigator for created tweets and relationships (see rebuild_rollups)
+    and the cascade (root id and depth) of every tweet (see rebuild_cascades).
+    graph is a session providing run(statement, **parameters), begin_transaction() (whose transactions
+    provide run, commit, rollback and closed) and sync(), like a neo4j driver session or twista.memory.MemoryGraph.
+    """
+    create_indexes(graph)
+
+    # Import recordings (tweets and users)
+    manifest = Manifest(manifest)
+    importer = Importer(graph, batch_sizes, retries, seen=Seen(graph, seen), manifest=manifest, profile=bool(profile))
+    importing(importer, manifest.pending(sorted(set(records))), prefetch, workers, stream)
+    importer.seen.close()
+    manifest.close()
+
+    importer.summary()
+    if timings:
+        importer.write_timings(timings)
+    if profile:
+        importer.write_profile(profile)
+        importer.print_profile()
+    return importer
+
+# Constraints and indexes of the graph (see create_indexes)
+SCHEMA = [
+    "CREATE CONSTRAINT ON (r:Tweet) ASSERT r.id IS UNIQUE",
+    "CREATE INDEX ON :Tweet(created_at)",
+    "CREATE INDEX ON :Tweet(type)",
+    "CREATE INDEX ON :Tweet(root)",
+    "CREATE INDEX ON :Tweet(ref)",
+    "CREATE CONSTRAINT ON (r:User) ASSERT r.id IS UNIQUE",
+    "CREATE INDEX ON :User(created_at)",
+    "CREATE INDEX ON :User(screen_name)",
+    "CREATE CONSTRAINT ON (t:Tag) ASSERT t.id IS UNIQUE",
+    "CREATE CONSTRAINT ON (u:Url) ASSERT u.id IS UNIQUE",
+    "CREATE CONSTRAINT ON (d:Day) ASSERT d.date IS UNIQUE",
+    "CREATE CONSTRAINT ON (k:TweetType) ASSERT k.id IS UNIQUE"
+]
+
+fulltext_indexes = "CALL db.indexes() YIELD indexName AS i, type AS t WHERE t = 'node_fulltext' RETURN collect(i)"
+
+# Fulltext indexes of the graph: name -> statement creating it
+FULLTEXT = {
+    'tweets': "CALL db.index.fulltext.createNodeIndex('tweets', ['Tweet'], ['text'])",
+    'users': "CALL db.index.fulltext.createNodeIndex('users', ['User'], ['name', 'screen_name', 'description', 'location'])"
+}
+
+def create_indexes(graph):
+    """Creates the constraints and indexes of the graph (if not exist)."""
+    for statement in SCHEMA:
+        graph.run(statement)
     graph.sync()
 
-    q = "CALL db.indexes() YIELD indexName AS i, type AS t WHERE t = 'node_fulltext' RETURN collect(i)"
-    existing = graph.run(q).single().value()
-    if 'tweets' not in existing:
-        graph.run("CALL db.index.fulltext.createNodeIndex('tweets', ['Tweet'], ['text'])")
-        print("Created fulltext index for tweets")
-    if 'users' not in existing:
-        graph.run("CALL db.index.fulltext.createNodeIndex('users', ['User'], ['name', 'screen_name', 'description', 'location'])")
-        print("Created fulltext index for users")
+    existing = graph.run(fulltext_indexes).single().value()
+    for (name, statement) in FULLTEXT.items():
+        if name not in existing:
+            graph.run(statement)
+            print(f"Created fulltext index for { name }")
     graph.sync()
 
-    # Import recordings (tweets and users)
-    seen_tags = set()
-    seen_urls = set()
-    imported = [];
-    if Path('imported.json').exists():
-        with open('imported.json') as f:
-            imported = json.load(f)
-    
-    tbd = sorted(list(set(records) - set(imported)))
-    p = tqdm(tbd, desc="Importing", file=sys.stdout)
-    for f in p:
-
-        with gzip.open(f, "rb") as chunk:
-            data = json.loads(chunk.read().decode("utf-8"))
-            
-            # Import users
-            users = [d for d in data if d['type'] == 'user']
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(users)} users)")
-            graph.run(import_users, json=users)
-            
-            # Import tweets
-            tweets = [d for d in data if d['type'] != 'user']
-            imports = copy.deepcopy(tweets)
-            for t in imports:
-                t.pop('mentions', None)
-                t.pop('mentioned_ids', None)
-                t.pop('hashtags', None)
-                t.pop('urls', None)
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(tweets)} tweets)")
-            graph.run(import_tweets, json=imports)
-            graph.sync()
-            
-            # Generate post relations
-            posts = [{ 'user_id': t['user'], 'tweet_id': t['id'] } for t in tweets if 'user' in t]
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(posts)} posts)")
-            graph.run(merge_posts, json=posts)
-
-            # Generate refers_to relations
-            refers = [{ 'tweet_id': t['id'], 'ref_tweet_id': t['refers_to'] } for t in tweets if 'refers_to' in t]
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(refers)} referings)")
-            graph.run(merge_refers, json=refers)
-
-            # Generate mention relations
-            mentions = [{ 'tweet_id': t['id'], 'mentioned_id': mid } for t in tweets for mid in t['mentioned_ids']]
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(mentions)} mentions)")
-            graph.run(merge_mentions, json=mentions)
-
-            # Generate tag relations
-            tags = set([tag for t in tweets for tag in t['hashtags']]) - seen_tags
-            seen_tags = seen_tags.union(tags)
-            tag_rels = [{'tweet_id': t['id'], 'tag': tag.upper()} for t in tweets for tag in t['hashtags']]
-            p.set_description(f"Processing {p.n}/{p.total} (merge {len(tags)} new tags)")            
-            graph.run(create_tags, json=list(tags))
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(tag_rels)} taggings)")            
-            graph.run(merge_tags, json=tag_rels)
-
-            # Generate url relations
-            urls = set([url for t in tweets for url in t['urls']]) - seen_urls
-            seen_urls = seen_urls.union(urls)
-            url_rels = [{'tweet_id': t['id'], 'url': url } for t in tweets for url in t['urls']]
-            p.set_description(f"Processing {p.n}/{p.total} (merge {len(urls)} new urls)")            
-            graph.run(create_urls, json=list(urls))
-            p.set_description(f"Processing {p.n}/{p.total} (merging {len(url_rels)} url refers)")            
-            graph.run(merge_urls, json=url_rels)
-        
-        imported.append(f)
-        with open('imported.json', 'w') as f:
-            json.dump(imported, f, indent=3)
+def rebuild_rollups(graph, batch=10):
+    """
+    Rebuilds the daily rollups of the navigator from the tweets in the graph, one transaction per day and statement.
+    Needed once for graphs loaded by neo4j-admin (see twista.bulk) or imported before rollups were maintained.
+    Do not import at the same time.
+    """
+    create_indexes(graph)
+    while graph.run(delete_days, n=batch).single().value():
+        pass
+    graph.run(delete_tweet_types)
+    days = [r[0] for r in graph.run(tweet_days)]
+    for day in tqdm(days, desc="Rebuilding rollups", file=sys.stdout):
+        for statement in [rebuild_tweets, rebuild_posts, rebuild_mentions, rebuild_tags]:
+            graph.run(statement, day=day)
+    graph.run(bump_generation)
+    graph.sync()
+    return len(days)
+
+def rebuild_cascades(graph):
+    """
+    Sets the cascade root id and depth of all tweets in the graph, one transaction per day.
+    Needed once for graphs loaded by neo4j-admin (see twista.bulk) or imported before cascades were maintained.
+    Do not import at the same time.
+    """
+    create_indexes(graph)
+    days = [r[0] for r in graph.run(tweet_days)]
+    for day in tqdm(days, desc="Rebuilding cascades", file=sys.stdout):
+        graph.run(set_cascades, day=day)
+    graph.run(bump_generation)
+    graph.sync()
+    return len(days)
+
+def importing(importer, files, prefetch=2, workers=None, stream=False, imported=None, pool=None):
+    """Imports chunk files with an importer (calls imported(f) after each chunk, see prefetching for pool)."""
+    p = tqdm(total=len(files), desc="Importing", file=sys.stdout)
+    if stream:
+        for f in files:
+            importer.stream(f, p)
+            p.update()
+            if imported:
+                imported(f)
+    else:
+        for (f, rows) in prefetching(files, prefetch, workers, importer.profile, pool):
+            importer.apply(f, rows, p)
+            p.update()
+            if imported:
+                imported(f)
+    p.close()
+
+class Follower:
+    """
+    Imports the chunks of a live recording directory as soon as they are complete, until interrupted.
+    Chunks still being written (.part files) and chunks modified less than settle seconds ago are skipped.
+    The graph session, the seen store, the manifest and the pool preparing chunks ahead are kept open across chunks.
+    Reports the lag from writing a chunk to having it imported (see twista.metrics).
+    """
+
+    def __init__(self, graph, directory, prefetch=0, workers=None, batch_sizes={}, retries=3, stream=False, poll=5, settle=10, manifest='imported.log', seen='imported.db'):
+        self.graph = graph
+        self.directory = directory
+        self.prefetch = prefetch
+        self.workers = workers
+        self.stream = stream
+        self.poll = poll
+        self.settle = settle
+        self.manifest = Manifest(manifest)
+        self.importer = Importer(graph, batch_sizes, retries, seen=Seen(graph, seen), manifest=self.manifest)
+        self.chunks = 0
+        self.pending = 0
+        self.lag = 0
+        self.max_lag = 0
+
+    def completed(self):
+        """Returns the complete chunk files of the directory in order."""
+        now = time.time()
+        files = []
+        for f in sorted(glob.glob(os.path.join(self.directory, "recording-*"))):
+            if f.endswith((PART, ".tmp", ".wal")):
+                continue
+            if now - os.stat(f).st_mtime < self.settle:
+                continue
+            files.append(f)
+        return files
+
+    def imported(self, f):
+        self.chunks += 1
+        self.pending -= 1
+        self.lag = time.time() - os.stat(f).st_mtime
+        self.max_lag = max(self.lag, self.max_lag)
+
+    def run(self):
+        # One pool of preparing processes for all polls
+        pool = preparers(self.prefetch, self.workers) if self.prefetch and not self.stream else None
+        try:
+            while True:
+                tbd = self.manifest.pending(self.completed())
+                self.pending = len(tbd)
+                if tbd:
+                    importing(self.importer, tbd, self.prefetch, self.workers, self.stream, self.imported, pool)
+                time.sleep(self.poll)
+        except KeyboardInterrupt:
+            print("Stopped following")
+        finally:
+            if pool:
+                pool.shutdown()
+            self.importer.seen.close()
+            self.manifest.close()
+
+    def metrics(self):
+        rows = sum(t['rows'] for t in self.importer.timings)
+        return [
+            ("twista_import_chunks_total", "counter", "Chunks imported", [({}, self.chunks)]),
+            ("twista_import_rows_total", "counter", "Rows written by import statements", [({}, rows)]),
+            ("twista_import_pending_chunks", "gauge", "Complete chunks waiting for import", [({}, self.pending)]),
+            ("twista_import_lag_seconds", "gauge", "Lag from writing the last chunk to having it imported", [({}, self.lag)]),
+            ("twista_import_max_lag_seconds", "gauge", "Maximum lag from writing a chunk to having it imported", [({}, self.max_lag)])
+        ]
+
+def follow(graph, directory, prefetch=0, workers=None, batch_sizes={}, retries=3, stream=False, poll=5, settle=10, metrics=None, interval=10, status=False, manifest='imported.log', seen='imported.db'):
+    """Follows a live recording directory and imports its chunks as they are completed (see Follower)."""
+    create_indexes(graph)
+    follower = Follower(graph, directory, prefetch, workers, batch_sizes, retries, stream, poll, settle, manifest, seen)
+    monitor = Metrics(follower.metrics, metrics, interval, status)
+    monitor.start()
+    try:
+        follower.run()
+    finally:
+        monitor.stop()
+
+def preparers(prefetch=2, workers=None):
+    """Process pool preparing chunks ahead (workers processes, by default the prefetch depth, at most the number of CPUs)."""
+    return ProcessPoolExecutor(max_workers=workers or min(prefetch, os.cpu_count() or 1))
+
+def prefetching(files, prefetch=2, workers=None, profile=False, pool=None):
+    """
+    Yields (file, rows) of the files in order.
+    A process pool prepares the rows of the next prefetch chunks while the current chunk is applied.
+    At most prefetch + 1 prepared chunks are held in memory (the chunk being applied and those prepared ahead).
+    The pool is created for the files unless given (see preparers). With prefetch=0 chunks are prepared one by one in-process.
+    """
+    if not prefetch:
+        for f in files:
+            yield (f, prepare(f, profile))
+        return
+    if pool is None:
+        with preparers(prefetch, workers) as pool:
+            yield from prefetching(files, prefetch, workers, profile, pool)
+        return
+
+    pending = collections.deque()
+    todo = iter(files)
+    for f in itertools.islice(todo, prefetch):
+        pending.append((f, pool.submit(prepare, f, profile)))
+    while pending:
+        (f, future) = pending.popleft()
+        rows = future.result()
+        for g in itertools.islice(todo, 1):
+            pending.append((g, pool.submit(prepare, g, profile)))
+        yield (f, rows)
+
+def prepare(f, profile=False):
+    """
+    Reads a chunk and prepares the rows of all import statements.
+    Profiling adds the seconds spent to decompress, parse and build the rows as rows['profile'].
+    Decompression is timed in a separate pass, so parse is the time of reading the chunk minus decompression.
+    """
+    if not profile:
+        return rows(entities(f))
+
+    start = time.perf_counter()
+    with compression.open(f, 'rb') as chunk:
+        while chunk.read(1 << 20):
+            pass
+    decompress = time.perf_counter() - start
+    start = time.perf_counter()
+    data = list(entities(f))
+    parse = max(time.perf_counter() - start - decompress, 0)
+    start = time.perf_counter()
+    prepared = rows(data)
+    prepared['profile'] = { 'decompress': decompress, 'parse': parse, 'rows': time.perf_counter() - start }
+    return prepared
+
+def tag_id(hashtag):
+    """Id of the Tag node of a hashtag (hashtags are case insensitive, so all spellings share the uppercased tag)."""
+    return hashtag.upper()
+
+def rows(data):
+    """
+    Builds the rows of all import statements in one pass over the entities of a chunk.
+    Tweets are stripped of their mentions, hashtags and urls in place (the chunk is consumed).
+    """
+    users, tweets, posts, refers, mentions, tag_rels, url_rels = [], [], [], [], [], [], []
+    tags, urls = {}, {}
+    for d in data:
+        if d['type'] == 'user':
+            users.append(d)
+            continue
+        tid = d['id']
+        d.pop('mentions', None)
+        if 'user' in d:
+            posts.append({ 'user_id': d['user'], 'tweet_id': tid })
+        if 'refers_to' in d:
+            refers.append({ 'tweet_id': tid, 'ref_tweet_id': d['refers_to'] })
+        for mid in d.pop('mentioned_ids', ()):
+            mentions.append({ 'tweet_id': tid, 'mentioned_id': mid })
+        for tag in map(tag_id, d.pop('hashtags', ())):
+            tags[tag] = None
+            tag_rels.append({ 'tweet_id': tid, 'tag': tag })
+        for url in d.pop('urls', ()):
+            urls[url] = None
+            url_rels.append({ 'tweet_id': tid, 'url': url })
+        tweets.append(d)
+
+    return {
+        'users': users,
+        'tweets': tweets,
+        'posts': posts,
+        'refers': refers,
+        'mentions': mentions,
+        'tags': list(tags),
+        'tag_rels': tag_rels,
+        'urls': list(urls),
+        'url_rels': url_rels
+    }
+
+# Import stages in order of application: (rows, statement, description, batch size key)
+STAGES = [
+    ('new_users', create_users, "creating {} new users", 'users'),
+    ('users', import_users, "merging {} users", 'users'),
+    ('new_tweets', create_tweets, "creating {} new tweets", 'tweets'),
+    ('tweets', import_tweets, "merging {} tweets", 'tweets'),
+    ('posts', merge_posts, "merging {} posts", 'posts'),
+    ('refers', merge_refers, "merging {} referings", 'refers'),
+    ('waiting', link_waiting, "linking {} new tweets to waiting referings", 'refers'),
+    ('mentions', merge_mentions, "merging {} mentions", 'mentions'),
+    ('tags', create_new_tags, "creating {} new tags", 'tags'),
+    ('tag_rels', merge_tags, "merging {} taggings", 'tags'),
+    ('urls', create_new_urls, "creating {} new urls", 'urls'),
+    ('url_rels', merge_urls, "merging {} url refers", 'urls')
+]
+
+# Position and batch size key of stages
+STAGE_INDEX = { stage: n for (n, (stage, _, _, _)) in enumerate(STAGES) }
+STAGE_KEYS = { stage: key for (stage, _, _, key) in STAGES }
+
+# Stages creating nodes not seen before: stage -> (label, id of a row, merge statement used if the node exists nevertheless)
+CREATING = {
+    'new_users': ('User', lambda row: row['id'], import_users),
+    'new_tweets': ('Tweet', lambda row: row['id'], import_tweets),
+    'tags': ('Tag', lambda tag: tag, create_tags),
+    'urls': ('Url', lambda url: url, create_urls)
+}
+
+# Default rows per transaction and statement type
+BATCH_SIZES = {
+    'users': 5000,
+    'tweets': 5000,
+    'posts': 10000,
+    'refers': 10000,
+    'mentions': 10000,
+    'tags': 10000,
+    'urls': 10000
+}
+
+# Errors worth a retry (the transaction is rolled back and rerun)
+TRANSIENT = (TransientError, ServiceUnavailable, SessionExpired)
+
+class Importer:
+    """
+    Applies prepared chunks to the graph.
+    Each statement is sent in sub-batches, every batch in its own explicit transaction.
+    Batches failing with transient errors are retried (with exponential backoff) up to retries times.
+    Nodes not in the seen store (see twista.seen) are created instead of merged, known tags and urls are skipped.
+    Completed batches are logged to the manifest (see twista.manifest), an interrupted chunk resumes after the last one
+    (unless the seen store changed in between, see Manifest.begin).
+    The generation of the graph is counted up after every chunk.
+    """
+
+    def __init__(self, graph, batch_sizes={}, retries=3, backoff=1.0, seen=None, manifest=None, profile=False):
+        self.graph = graph
+        self.batch_sizes = dict(BATCH_SIZES, **batch_sizes)
+        self.retries = retries
+        self.backoff = backoff
+        self.seen = seen
+        self.manifest = manifest
+        self.profile = profile
+        self.timings = []
+        self.phases = []
+
+    def split(self, rows):
+        """Splits users and tweets of prepared rows into new (first snapshot of unseen ids) and known ones, drops known tags and urls."""
+        for (stage, label) in [('users', 'User'), ('tweets', 'Tweet')]:
+            unknown = set(self.seen.unknown(label, [e['id'] for e in rows[stage]]))
+            (created, merged) = ([], [])
+            for e in rows[stage]:
+                if e['id'] in unknown:
+                    unknown.discard(e['id'])
+                    created.append(e)
+                else:
+                    merged.append(e)
+            rows['new_' + stage] = created
+            rows[stage] = merged
+        # Only tweets not imported before can have tweets waiting for them (see link_waiting)
+        rows['waiting'] = [e['id'] for e in rows['new_tweets']]
+        rows['tags'] = self.seen.unknown('Tag', rows['tags'])
+        rows['urls'] = self.seen.unknown('Url', rows['urls'])
+        return rows
+
+    def apply(self, f, rows, p):
+        """
+        Applies the prepared rows of a chunk stage by stage.
+        Created ids are added to the seen store once the chunk is complete, so a resumed chunk is split the same way.
+        Resuming skips rows by offset, so batch sizes may change in between.
+        """
+        begin = time.perf_counter()
+        for (phase, seconds) in rows.pop('profile', {}).items():
+            self.phase(f, phase, seconds)
+        offsets = self.manifest.begin(f, self.seen.state()) if self.manifest else {}
+        created = collections.defaultdict(list)
+        start = time.perf_counter()
+        rows = self.split(rows)
+        self.phase(f, 'split', time.perf_counter() - start)
+        for (stage, statement, description, key) in STAGES:
+            data = rows[stage]
+            size = self.batch_sizes[key]
+            for (i, start) in enumerate(range(0, len(data), size)):
+                batch = data[start:start + size]
+                if stage in CREATING:
+                    (label, identify, _) = CREATING[stage]
+                    created[label].extend(identify(row) for row in batch)
+                if start + len(batch) <= offsets.get(stage, 0):
+                    continue
+                p.set_description(f"Processing {p.n}/{p.total} ({ description.format(len(data)) }, batch { i + 1 })")
+                self.write(f, stage, i, batch)
+                offsets[stage] = start + len(batch)
+                if self.manifest:
+                    self.manifest.progress(f, stage, i, offsets)
+
+        for (label, ids) in created.items():
+            self.seen.add(label, ids)
+        if self.manifest:
+            self.manifest.done(f)
+        self.graph.run(bump_generation)
+        self.phase(f, 'chunk', time.perf_counter() - begin)
+
+    def stream(self, f, p):
+        """
+        Applies a chunk in two passes over its entities, without preparing all rows of the chunk at once.
+        The first pass writes users, tweets, tags and urls, the second one their relationships.
+        Rows are written whenever a batch is full, so memory is bounded by the batch sizes (and the ids of the chunk).
+        """
+        begin = time.perf_counter()
+        offsets = self.manifest.begin(f, self.seen.state()) if self.manifest else {}
+        created = collections.defaultdict(list)
+        # Ids created in this chunk (further snapshots are merged) and tags and urls of this chunk
+        chunk = { 'User': set(), 'Tweet': set(), 'Tag': set(), 'Url': set() }
+        buffers = { stage: [] for (stage, _, _, _) in STAGES }
+        pending = { 'users': [], 'tweets': [] }
+        counts = collections.Counter()
+        batches = collections.Counter()
+
+        def flush(stage):
+            if stage in ('users', 'tweets'):
+                flush('new_' + stage)
+            if buffers[stage]:
+                p.set_description(f"Processing {p.n}/{p.total} (streaming { stage }, batch { batches[stage] + 1 })")
+                self.write(f, stage, batches[stage], buffers[stage])
+                offsets[stage] = counts[stage]
+                if self.manifest:
+                    self.manifest.progress(f, stage, batches[stage], offsets)
+                batches[stage] += 1
+                buffers[stage] = []
+
+        def emit(stage, row):
+            counts[stage] += 1
+            if stage in CREATING:
+                (label, identify, _) = CREATING[stage]
+                created[label].append(identify(row))
+            if counts[stage] > offsets.get(stage, 0):
+                buffers[stage].append(row)
+                if len(buffers[stage]) >= self.batch_sizes[STAGE_KEYS[stage]]:
+                    flush(stage)
+
+        def split(stage, label):
+            unknown = set(self.seen.unknown(label, [e['id'] for e in pending[stage] if e['id'] not in chunk[label]]))
+            for e in pending[stage]:
+                if e['id'] in unknown and e['id'] not in chunk[label]:
+                    chunk[label].add(e['id'])
+                    emit('new_' + stage, e)
+                else:
+                    emit(stage, e)
+            pending[stage] = []
+
+        def node(stage, label, e):
+            pending[stage].append(e)
+            if len(pending[stage]) >= self.batch_sizes[stage]:
+                split(stage, label)
+
+        def value(stage, label, v):
+            if v not in chunk[label]:
+                chunk[label].add(v)
+                if self.seen.unknown(label, [v]):
+                    emit(stage, v)
+
+        # Nodes
+        for d in entities(f):
+            if d['type'] == 'user':
+                node('users', 'User', d)
+                continue
+            for tag in d.pop('hashtags', ()):
+                value('tags', 'Tag', tag_id(tag))
+            for url in d.pop('urls', ()):
+                value('urls', 'Url', url)
+            d.pop('mentions', None)
+            d.pop('mentioned_ids', None)
+            node('tweets', 'Tweet', d)
+        split('users', 'User')
+        split('tweets', 'Tweet')
+        for stage in ['users', 'tweets', 'tags', 'urls']:
+            flush(stage)
+
+        # Relationships
+        for d in entities(f):
+            if d['type'] == 'user':
+                continue
+            tid = d['id']
+            if 'user' in d:
+                emit('posts', { 'user_id': d['user'], 'tweet_id': tid })
+            if 'refers_to' in d:
+                emit('refers', { 'tweet_id': tid, 'ref_tweet_id': d['refers_to'] })
+            for mid in d.get('mentioned_ids', ()):
+                emit('mentions', { 'tweet_id': tid, 'mentioned_id': mid })
+            for tag in d.get('hashtags', ()):
+                emit('tag_rels', { 'tweet_id': tid, 'tag': tag_id(tag) })
+            for url in d.get('urls', ()):
+                emit('url_rels', { 'tweet_id': tid, 'url': url })
+        for i in created['Tweet']:
+            emit('waiting', i)
+        for stage in ['posts', 'refers', 'waiting', 'mentions', 'tag_rels', 'url_rels']:
+            flush(stage)
+
+        for (label, ids) in created.items():
+            self.seen.add(label, ids)
+        if self.manifest:
+            self.manifest.done(f)
+        self.graph.run(bump_generation)
+        self.phase(f, 'chunk', time.perf_counter() - begin)
+
+    def write(self, f, stage, i, batch):
+        """Writes the i-th batch of a stage (nodes not seen before are created, falling back to merging them)."""
+        (_, statement, _, _) = STAGES[STAGE_INDEX[stage]]
+        if stage in CREATING:
+            try:
+                (seconds, attempts, counters) = self.run(statement, batch)
+            except ConstraintError:
+                # Written by someone else (or before an interruption), so fall back to merging
+                (seconds, attempts, counters) = self.run(CREATING[stage][2], batch)
+        else:
+            (seconds, attempts, counters) = self.run(statement, batch)
+        timing = { 'chunk': f, 'stage': stage, 'batch': i, 'rows': len(batch), 'seconds': seconds, 'attempts': attempts }
+        if self.profile:
+            timing['counters'] = counters
+        self.timings.append(timing)
+
+    def phase(self, f, phase, seconds):
+        """Records the seconds of a phase of a chunk (only when profiling)."""
+        if self.profile:
+            self.phases.append({ 'chunk': f, 'phase': phase, 'seconds': seconds })
+
+    def run(self, statement, batch):
+        """
+        Runs a statement for a batch of rows in an explicit transaction. Returns (seconds, attempts, counters).
+        The result counters are only fetched when profiling (otherwise they are empty).
+        """
+        for attempt in itertools.count(1):
+            start = time.time()
+            tx = self.graph.begin_transaction()
+            try:
+                result = tx.run(statement, json=batch)
+                counters = dict(vars(result.summary().counters)) if self.profile else {}
+                tx.commit()
+                return (time.time() - start, attempt, counters)
+            except TRANSIENT as ex:
+                if not tx.closed():
+                    tx.rollback()
+                if attempt > self.retries:
+                    raise
+                delay = self.backoff * 2 ** (attempt - 1)
+                print(f"Transient error ({ ex }), retrying batch in { delay }s")
+                time.sleep(delay)
+            except Exception:
+                if not tx.closed():
+                    tx.rollback()
+                raise
+
+    def summary(self):
+        """Prints the rows per second of all stages."""
+        if not self.timings:
+            return
+        print(f"{'stage':>10} {'batches':>8} {'rows':>10} {'seconds':>9} {'rows/s':>10} {'retries':>8}")
+        for (stage, _, _, _) in STAGES:
+            ts = [t for t in self.timings if t['stage'] == stage]
+            rows = sum(t['rows'] for t in ts)
+            seconds = sum(t['seconds'] for t in ts)
+            retries = sum(t['attempts'] - 1 for t in ts)
+            rate = rows / seconds if seconds else 0
+            print(f"{stage:>10} {len(ts):>8} {rows:>10} {seconds:>9.2f} {rate:>10.0f} {retries:>8}")
+
+    def write_timings(self, file):
+        """Writes the timings of all batches as CSV."""
+        with open(file, 'w') as f:
+            f.write("chunk,stage,batch,rows,seconds,attempts\n")
+            for t in self.timings:
+                f.write(f"{t['chunk']},{t['stage']},{t['batch']},{t['rows']},{t['seconds']:.6f},{t['attempts']}\n")
+
+    def stages(self, timings):
+        """Aggregates batch timings per stage (seconds, rows, batches, rows/s, retries and summed counters)."""
+        stages = {}
+        for t in timings:
+            s = stages.setdefault(t['stage'], { 'seconds': 0, 'rows': 0, 'batches': 0, 'retries': 0, 'counters': collections.Counter() })
+            s['seconds'] += t['seconds']
+            s['rows'] += t['rows']
+            s['batches'] += 1
+            s['retries'] += t['attempts'] - 1
+            s['counters'].update(t.get('counters', {}))
+        for s in stages.values():
+            s['rows_per_second'] = s['rows'] / s['seconds'] if s['seconds'] else 0
+            s['counters'] = dict(s['counters'])
+        return stages
+
+    def report(self):
+        """Profile of the import: phases and stages per chunk and in total."""
+        chunks = []
+        for f in dict.fromkeys([t['chunk'] for t in self.timings] + [p['chunk'] for p in self.phases]):
+            phases = collections.Counter()
+            for p in self.phases:
+                if p['chunk'] == f:
+                    phases[p['phase']] += p['seconds']
+            chunks.append({ 'chunk': f, 'phases': dict(phases), 'stages': self.stages([t for t in self.timings if t['chunk'] == f]) })
+        phases = collections.Counter()
+        for p in self.phases:
+            phases[p['phase']] += p['seconds']
+        return { 'chunks': chunks, 'summary': { 'phases': dict(phases), 'stages': self.stages(self.timings) } }
+
+    def write_profile(self, file):
+        """Writes the profile of the import as JSON."""
+        with open(file, 'w') as f:
+            json.dump(self.report(), f, indent=3)
+
+    def print_profile(self, top=10):
+        """Prints the slowest phases and stages of the import (chunk is the time of applying chunks, without prefetched phases)."""
+        summary = self.report()['summary']
+        total = summary['phases'].get('chunk', 0) + sum(summary['phases'].get(p, 0) for p in ['decompress', 'parse', 'rows'])
+        slowest = [(p, 'phase', s, None) for (p, s) in summary['phases'].items() if p != 'chunk']
+        slowest += [(stage, 'statement', s['seconds'], s['rows']) for (stage, s) in summary['stages'].items()]
+        slowest.sort(key=lambda x: -x[2])
+        print(f"{'slowest':>10} {'kind':>9} {'seconds':>9} {'share':>6} {'rows':>10} {'rows/s':>10}")
+        for (name, kind, seconds, rows) in slowest[:top]:
+            share = f"{ 100 * seconds / total:.0f}%" if total else "-"
+            rate = f"{ rows / seconds:.0f}" if rows and seconds else "-"
+            print(f"{name:>10} {kind:>9} {seconds:>9.2f} {share:>6} {rows if rows is not None else '-':>10} {rate:>10}")
 
 def install_neo4j(config):
     if not Path('neo4j').exists():
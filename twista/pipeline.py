@@ -0,0 +1,158 @@
+import json
+import queue
+import threading
+import multiprocessing
+import time
+import tweepy
+from twista.dm import normalize, now
+
+def normalizing(raw, results):
+    """
+    Worker process: decodes raw stream payloads and normalizes statuses with twista.dm.
+    Non-status messages (delete, limit, warning, ...) are forwarded as None to keep the sequence complete.
+    """
+    while True:
+        item = raw.get()
+        if item is None:
+            results.put((None, None))
+            return
+        (seq, recorded_at, data) = item
+        records = None
+        try:
+            status = json.loads(data)
+            if 'in_reply_to_status_id' in status:
+                records = normalize(status, recorded_at)
+        except Exception as ex:
+            print(f"Skipping payload that could not be normalized: { ex }")
+        results.put((seq, records))
+
+
+def context():
+    """
+    Multiprocessing context of the workers. Workers are started by a fork server (a single-threaded process),
+    because the recorder process runs threads (writer, collector, metrics) whose locks a forked worker would inherit.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+
+class Pipeline(tweepy.StreamListener):
+    """
+    Listener that only pushes raw payloads into a bounded queue.
+    A pool of worker processes normalizes them and a collector thread forwards the records
+    in arrival order to the recorder (so chunk contents do not depend on the number of workers).
+
+    If the workers fall behind, the backpressure policy decides:
+    'block' blocks the stream until the queue has space again, 'drop' drops the newest payloads (and counts them).
+
+    Crashed workers are replaced. The payloads they held never arrive, so the collector skips sequence numbers
+    missing for more than timeout seconds while later ones are waiting (and counts them as lost).
+    """
+
+    def __init__(self, recorder, workers=2, depth=10000, policy='block', timeout=10):
+        super().__init__()
+        self.recorder = recorder
+        self.policy = policy
+        self.timeout = timeout
+        self.context = context()
+        self.raw = self.context.Queue(maxsize=depth)
+        self.results = self.context.Queue(maxsize=depth)
+        self.seq = 0
+        self.dropped = 0
+        self.lost = 0
+        self.restarts = 0
+        self.workers = [self.worker(i) for i in range(workers)]
+        self.collector = threading.Thread(target=self.collect, name="twista-collector", daemon=True)
+        self.collector.start()
+
+    # Starts the i-th worker process
+    def worker(self, i):
+        w = self.context.Process(target=normalizing, args=(self.raw, self.results), name=f"twista-worker-{ i }", daemon=True)
+        w.start()
+        return w
+
+    def on_data(self, raw_data):
+        item = (self.seq, now(), raw_data)
+        if self.policy == 'drop':
+            try:
+                self.raw.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+                return True
+        else:
+            self.raw.put(item)
+        self.seq += 1
+        return True
+
+    def on_error(self, status_code):
+        return self.recorder.on_error(status_code)
+
+    # Replaces crashed workers (workers exit with status 0 only when stopped).
+    def revive(self):
+        for (i, w) in enumerate(self.workers):
+            if w.exitcode:
+                print(f"Worker { w.name } died with exit code { w.exitcode }, restarting it")
+                self.workers[i] = self.worker(i)
+                self.restarts += 1
+
+    # Hands the records of a payload over to the recorder (None for non-status messages).
+    def forward(self, records):
+        if records is not None:
+            self.recorder.statuses += 1
+            self.recorder.collect(records)
+
+    # Reorders the normalized records by sequence number and hands them over to the recorder.
+    def collect(self):
+        pending = {}
+        expected = 0
+        stopped = 0
+        (checked, missing) = (time.monotonic(), None)
+        while stopped < len(self.workers):
+            try:
+                (seq, records) = self.results.get(timeout=1)
+                if seq is None:
+                    stopped += 1
+                elif seq >= expected:
+                    pending[seq] = records
+            except queue.Empty:
+                pass
+            if time.monotonic() - checked >= 1:
+                self.revive()
+                checked = time.monotonic()
+            if pending and expected not in pending:
+                missing = missing or time.monotonic()
+                if time.monotonic() - missing > self.timeout:
+                    self.lost += min(pending) - expected
+                    expected = min(pending)
+            while expected in pending:
+                self.forward(pending.pop(expected))
+                expected += 1
+                missing = None
+        # Payloads lost by crashed workers leave gaps (nothing is waiting for them anymore)
+        for seq in sorted(pending):
+            self.lost += seq - expected
+            self.forward(pending.pop(seq))
+            expected = seq + 1
+
+    # Normalizes and records all queued payloads and stops the workers.
+    def stop(self):
+        for _ in self.workers:
+            self.raw.put(None)
+        self.collector.join()
+        for w in self.workers:
+            w.join()
+
+    def depth(self):
+        try:
+            return self.raw.qsize()
+        except NotImplementedError:
+            return 0
+
+    # Metrics of the pipeline (see twista.metrics)
+    def metrics(self):
+        return [
+            ("twista_pipeline_queue_depth", "gauge", "Raw payloads waiting for normalization", [({}, self.depth())]),
+            ("twista_pipeline_dropped_total", "counter", "Raw payloads dropped due to backpressure", [({}, self.dropped)]),
+            ("twista_pipeline_lost_total", "counter", "Raw payloads lost by crashed workers", [({}, self.lost)]),
+            ("twista_pipeline_worker_restarts_total", "counter", "Crashed workers replaced", [({}, self.restarts)])
+        ]
@@ -1,14 +1,183 @@
 import datetime
 import time
-import gzip
 import json
 import atexit
 import sys
 import tweepy
 import traceback
 import signal
+import threading
+import queue
+import os
+import collections
+import glob
 from termcolor import colored
-from twista.dm import TweetObject
+from twista.dm import normalize
+from twista import compression
+from twista.compression import PART
+from twista.metrics import Metrics
+from twista.pipeline import Pipeline
+
+class Writer(threading.Thread):
+    """
+    Writes chunks in the background, so that the stream never blocks on compression.
+    Jobs are queued in a bounded queue. If the writer falls more than depth chunks behind,
+    submitting a chunk blocks until the writer catches up.
+    """
+
+    def __init__(self, depth=2):
+        super().__init__(name="twista-writer", daemon=True)
+        self.jobs = queue.Queue(maxsize=depth)
+        self.rollovers = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.duration = 0.0
+        self.seconds = 0.0
+        self.start()
+
+    def submit(self, job):
+        self.jobs.put((time.time(), job))
+
+    def depth(self):
+        return self.jobs.qsize()
+
+    # Counters of the writer (rollover latencies are measured from handover to completed write in seconds)
+    def stats(self):
+        return {
+            'rollovers': self.rollovers,
+            'queue_depth': self.depth(),
+            'rollover_latency': self.latency,
+            'max_rollover_latency': self.max_latency,
+            'write_latency': self.duration,
+            'write_seconds': self.seconds
+        }
+
+    def run(self):
+        while True:
+            (handover, job) = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                started = time.time()
+                job()
+                self.rollovers += 1
+                self.duration = time.time() - started
+                self.seconds += self.duration
+                self.latency = time.time() - handover
+                self.max_latency = max(self.max_latency, self.latency)
+            except Exception:
+                print(colored("Writing chunk failed", "red"))
+                print(colored(traceback.format_exc(), "red"))
+            finally:
+                self.jobs.task_done()
+
+    # Writes all pending chunks and stops the writer.
+    def drain(self):
+        if self.is_alive():
+            self.submit(None)
+            self.join()
+
+
+class Snapshots:
+    """
+    Bounded LRU of user id -> (content hash, time written) across chunks.
+    A user is only recorded again if one of its tracked fields changed or its snapshot is older than refresh seconds.
+    """
+
+    TRACKED = ['name', 'screen_name', 'created_at', 'location', 'description', 'url', 'verified']
+
+    def __init__(self, size=100000, refresh=86400):
+        self.size = size
+        self.refresh = refresh
+        self.users = collections.OrderedDict()
+        self.skipped = 0
+
+    def changed(self, user):
+        h = hash(tuple(user[f] for f in self.TRACKED))
+        now = time.time()
+        known = self.users.get(user['id'])
+        if known and known[0] == h and now - known[1] < self.refresh:
+            self.users.move_to_end(user['id'])
+            self.skipped += 1
+            return False
+        self.users[user['id']] = (h, now)
+        self.users.move_to_end(user['id'])
+        if len(self.users) > self.size:
+            self.users.popitem(last=False)
+        return True
+
+
+class Segment:
+    """
+    Write-ahead segment of the chunk in flight.
+    Recorded entities are appended as JSON lines and synced to disk in batches (every n entities or every ms milliseconds)
+    by a background thread, so that the stream never waits for the disk (and quiet streams are synced in time as well).
+    A crashed recorder loses at most the batch being synced, leftover segments are recovered into chunks on startup (see recover()).
+    The segment is removed once its chunk has been written.
+    """
+
+    def __init__(self, directory, format, codec, level, n=1000, ms=1000):
+        t = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S.%f")
+        self.path = os.path.join(directory, "recording-%s.wal" % t)
+        self.file = open(self.path, 'w')
+        self.n = n
+        self.interval = ms / 1000
+        self.pending = 0
+        # Time the oldest entity not yet synced was appended (None if all are synced)
+        self.oldest = None
+        self.closed = False
+        self.changed = threading.Condition()
+        self.file.write(json.dumps({'wal': format, 'codec': codec, 'level': level}) + "\n")
+        self.syncer = threading.Thread(target=self.syncing, name="twista-wal-sync", daemon=True)
+        self.syncer.start()
+
+    # Appends an entity and only signals the syncer (when the first entity is pending and when a batch is full)
+    def append(self, line):
+        with self.changed:
+            self.file.write(line)
+            self.pending += 1
+            if self.oldest is None:
+                self.oldest = time.time()
+                self.changed.notify()
+            elif self.pending == self.n:
+                self.changed.notify()
+
+    # Names the chunk file this segment is written to (so that recovery can replace a partially written chunk).
+    def mark(self, chunk):
+        with self.changed:
+            self.file.write(json.dumps({'chunk': chunk}) + "\n")
+            self.flush()
+        os.fsync(self.file.fileno())
+
+    # Whether the pending entities are a full batch or pending for interval seconds (call with the lock held)
+    def due(self):
+        return self.oldest is not None and (self.pending >= self.n or time.time() - self.oldest >= self.interval)
+
+    # Syncs due entities (runs in the background until the segment is removed, the disk is synced without the lock)
+    def syncing(self):
+        while True:
+            with self.changed:
+                while not self.closed and not self.due():
+                    self.changed.wait(None if self.oldest is None else self.oldest + self.interval - time.time())
+                if self.closed:
+                    return
+                self.flush()
+            os.fsync(self.file.fileno())
+
+    # Hands the pending entities over to the operating system (call with the lock held)
+    def flush(self):
+        self.file.flush()
+        self.pending = 0
+        self.oldest = None
+
+    def remove(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify()
+        self.syncer.join()
+        self.file.close()
+        os.remove(self.path)
+
 
 class Recorder(tweepy.StreamListener):
 
@@ -16,50 +185,130 @@ class Recorder(tweepy.StreamListener):
     N = 25000
 
     # Constructor 
-    def __init__(self, n):
+    def __init__(self, n, format='json', depth=2, directory='.', snapshots=None, wal=None, codec='gzip', level=None):
         super().__init__()
+        # Chunks are opened by the writer, so an invalid codec or level has to fail here (not on the first rollover)
+        compression.level(codec, level)
         self.N = n
+        self.format = format
+        self.directory = directory
+        self.entities = {}
+        self.seen = set()
+        self.stream = None
+        self.streamed = None
+        self.chunks = []
+        self.statuses = 0
+        self.recorded = 0
+        self.types = collections.defaultdict(int)
+        self.reconnects = 0
+        self.snapshots = snapshots
+        self.wal = wal
+        self.segment = None
+        self.codec = codec
+        self.level = level
+        self.writer = Writer(depth)
+
+    # Entities are deduplicated by id within a chunk. JSON chunks keep the latest snapshot (like the importer,
+    # which merges later snapshots into created nodes), streamed NDJSON chunks cannot rewrite lines and keep the first one.
+    def dropped(self, entity):
+        return self.format == 'ndjson' and (entity['type'], entity['id']) in self.seen
 
-    def record(self, ia):
-        if ia.type() not in self.entities:
-            self.entities[ia.type()] = {}
-        self.entities[ia.type()][ia.id()] = ia.as_dict()
+    def record(self, entity):
+        if self.dropped(entity):
+            return
+        if self.format == 'ndjson':
+            self.append(entity)
+            return
+        if self.wal is not None:
+            self.log(json.dumps(entity, separators=(',', ':')) + "\n")
+        if entity['type'] not in self.entities:
+            self.entities[entity['type']] = {}
+        self.entities[entity['type']][entity['id']] = entity
 
+    # Chunk names are precise to the microsecond, so that fast rollovers never overwrite a chunk.
+    def filename(self, ext):
+        t = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H-%M-%S.%f")
+        filename = os.path.join(self.directory, "recording-%s.%s%s" % (t, ext, compression.extension(self.codec)))
+        self.chunks.append(filename)
+        return filename
+
+    # Streams an entity as one compact JSON line into the open chunk (written as .part file until it is closed).
+    def append(self, entity):
+        line = json.dumps(entity, separators=(',', ':')) + "\n"
+        self.log(line)
+        if not self.stream:
+            filename = self.filename("ndjson")
+            if self.segment:
+                self.segment.mark(filename)
+            self.stream = compression.open(filename + PART, 'wt', self.codec, self.level)
+            self.streamed = filename
+        self.stream.write(line)
+        self.seen.add((entity['type'], entity['id']))
+
+    # Appends an entity (serialized as JSON line) to the write-ahead segment (if enabled).
+    def log(self, line):
+        if self.wal is None:
+            return
+        if not self.segment:
+            self.segment = Segment(self.directory, self.format, self.codec, self.level, *self.wal)
+        self.segment.append(line)
+
+    # Hands the current chunk over to the writer and continues with a fresh buffer.
     def write(self):
-        t = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H-%M")
-        with gzip.open("recording-%s.json.gz" % t, 'wt') as file:
-            file.write(self.as_json())
-        self.entities = {}
+        (segment, self.segment) = (self.segment, None)
+        if self.format == 'ndjson':
+            (stream, self.stream) = (self.stream, None)
+            if stream:
+                filename = self.streamed
+                self.writer.submit(lambda: self.close(stream, filename, segment))
+            self.seen = set()
+            return
+        (entities, self.entities) = (self.entities, {})
+        filename = self.filename("json")
+        if segment:
+            segment.mark(filename)
+        self.writer.submit(lambda: self.dump(filename, entities, segment))
+
+    # Chunks are written as .part files and renamed when complete, so importers never see partial chunks.
+    def dump(self, filename, entities, segment=None):
+        with compression.open(filename + PART, 'wt', self.codec, self.level) as file:
+            file.write(as_json(entities))
+        if segment:
+            fsync(filename + PART)
+        os.replace(filename + PART, filename)
+        if segment:
+            segment.remove()
+
+    def close(self, stream, filename, segment=None):
+        stream.close()
+        if segment:
+            fsync(filename + PART)
+        os.replace(filename + PART, filename)
+        if segment:
+            segment.remove()
 
     def length(self):
-        return sum([len(d.values()) for _, d in self.entities.items()])
+        if self.format == 'ndjson':
+            return len(self.seen)
+        return sum([len(d) for d in list(self.entities.values())])
 
-    def as_json(self):
-        entries = []
-        for _, d in self.entities.items():
-            entries.extend(d.values())
-        return json.dumps(entries, indent=2)
+    def as_json(self, entities=None):
+        return as_json(self.entities if entities is None else entities)
 
     def on_status(self, status):
-        tweet = TweetObject(status._json)
-        print(tweet.status().text())
+        self.statuses += 1
+        self.collect(normalize(status._json))
 
-        self.record(tweet.status())
-        self.record(tweet.user())
-        
-        if tweet.is_retweet():
-            self.record(tweet.retweet())
-            self.record(tweet.retweet().user())
-            
-            if tweet.retweet().is_quote():
-                if tweet.retweet().quote():
-                    self.record(tweet.retweet().quote())
-                    self.record(tweet.retweet().quote().user())
-                
-        if tweet.is_quote():
-            if tweet.quote():
-                self.record(tweet.quote())
-                self.record(tweet.quote().user())
+    def collect(self, records):
+        self.recorded += len(records)
+        for entity in records:
+            self.types[entity['type']] += 1
+            # Snapshots of entities already in the chunk are dropped, so they must not update the user cache either
+            if self.dropped(entity):
+                continue
+            if self.snapshots and entity['type'] == 'user' and not self.snapshots.changed(entity):
+                continue
+            self.record(entity)
 
         if self.length() >= self.N:
             self.write()
@@ -69,28 +318,118 @@ class Recorder(tweepy.StreamListener):
         print(status_code)
         return False
 
+    # Metrics of the recorder (see twista.metrics)
+    def metrics(self):
+        w = self.writer
+        return [
+            ("twista_statuses_total", "counter", "Statuses received from the stream", [({}, self.statuses)]),
+            ("twista_entities_total", "counter", "Entities recorded by type", [({'type': t}, n) for t, n in list(self.types.items())]),
+            ("twista_buffer_entities", "gauge", "Entities in the current chunk", [({}, self.length())]),
+            ("twista_buffer_fill_ratio", "gauge", "Fill ratio of the current chunk", [({}, self.length() / self.N)]),
+            ("twista_chunk_rollovers_total", "counter", "Chunks written", [({}, w.rollovers)]),
+            ("twista_stream_reconnects_total", "counter", "Reconnects after broken streams", [({}, self.reconnects)]),
+            ("twista_users_skipped_total", "counter", "Unchanged user snapshots not recorded again", [({}, self.snapshots.skipped if self.snapshots else 0)]),
+            ("twista_writer_queue_depth", "gauge", "Chunks waiting for the writer", [({}, w.depth())]),
+            ("twista_write_latency_seconds", "gauge", "Duration of the last chunk write", [({}, w.duration)]),
+            ("twista_rollover_latency_seconds", "gauge", "Latency from chunk handover to completed write", [({}, w.latency)])
+        ]
+
+def as_json(entities):
+    entries = []
+    for _, d in entities.items():
+        entries.extend(d.values())
+    return json.dumps(entries, indent=2)
+
+def fsync(filename):
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def recover(directory='.'):
+    """
+    Recovers chunks from write-ahead segments left over by a crashed recorder.
+    A partially written chunk named by the segment is replaced. Returns the recovered chunk files.
+    """
+    recovered = []
+    for path in sorted(glob.glob(os.path.join(directory, "recording-*.wal"))):
+        format = 'json'
+        codec = 'gzip'
+        level = None
+        chunk = None
+        entities = {}
+        with open(path) as segment:
+            for line in segment:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    break # torn write of the last line
+                if 'twista' in data:
+                    if format == 'ndjson':
+                        entities.setdefault((data['type'], data['id']), data)
+                    else:
+                        entities.setdefault(data['type'], {})[data['id']] = data
+                elif 'wal' in data:
+                    format = data['wal']
+                    codec = data.get('codec', codec)
+                    level = data.get('level', level)
+                elif 'chunk' in data:
+                    chunk = data['chunk']
 
-def recording(config, chunksize, languages, tracks):
+        if entities:
+            chunk = chunk or path[:-len(".wal")] + "." + format + compression.extension(codec)
+            tmp = chunk + ".tmp"
+            with compression.open(tmp, 'wt', codec, level) as file:
+                if format == 'ndjson':
+                    for entity in entities.values():
+                        file.write(json.dumps(entity, separators=(',', ':')) + "\n")
+                else:
+                    file.write(as_json(entities))
+            fsync(tmp)
+            os.replace(tmp, chunk)
+            if os.path.exists(chunk + PART):
+                os.remove(chunk + PART)
+            recovered.append(chunk)
+        os.remove(path)
+    return recovered
 
-    recorder = Recorder(chunksize)
+def recording(config, chunksize, languages, tracks, format='json', depth=2, metrics=None, interval=10, status=False, users=0, refresh=86400, wal=None, workers=0, backlog=10000, backpressure='block', codec='gzip', level=None):
+
+    for chunk in recover():
+        print(colored(f"Recovered { chunk } from write-ahead segment", "yellow"))
+
+    recorder = Recorder(chunksize, format, depth, snapshots=Snapshots(users, refresh) if users else None, wal=wal, codec=codec, level=level)
+    pipeline = Pipeline(recorder, workers, backlog, backpressure) if workers else None
+    listener = pipeline or recorder
+    monitor = Metrics(lambda: recorder.metrics() + (pipeline.metrics() if pipeline else []), metrics, interval, status)
+    if metrics or status:
+        monitor.start()
     auth = tweepy.OAuthHandler(config['consumer_key'], config['consumer_secret'])
     auth.set_access_token(config['access_token'], config['access_token_secret'])
     api = tweepy.API(auth)
-    stream = tweepy.Stream(auth = api.auth, listener=recorder)
+    stream = tweepy.Stream(auth = api.auth, listener=listener)
 
     def shutdown():
         print(colored("Stop recording", "green"))
-        recorder.write()
         stream.disconnect()
+        if pipeline:
+            pipeline.stop()
+        recorder.write()
+        recorder.writer.drain()
+        if monitor.is_alive():
+            monitor.stop()
+        print(colored(f"Writer stats: { recorder.writer.stats() }", "green"))
 
     signal.signal(signal.SIGTERM, lambda sig, frame : sys.exit(0))
     atexit.register(shutdown)
 
     while True:
         try:                        
-            stream = tweepy.Stream(auth = api.auth, listener=recorder)
+            stream = tweepy.Stream(auth = api.auth, listener=listener)
             stream.filter(track=tracks, languages=languages)
         except Exception as ex:
+            recorder.reconnects += 1
             print(colored("Stream broken. Retrying ...", "red"))
             print(colored(ex, "red"))
             print(colored(traceback.format_exc(), "red"))
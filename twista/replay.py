@@ -0,0 +1,101 @@
+import json
+import os
+import sys
+import time
+import types
+from termcolor import colored
+from twista.recorder import Recorder, Snapshots
+from twista.pipeline import Pipeline
+from twista import compression
+
+def peak_rss():
+    """Peak resident set size of this process in bytes (or None if not supported by the platform)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def lines(file):
+    """
+    Yields the entries of a replay file, JSON lines as undecoded strings and JSON arrays as decoded objects.
+    Replay files are either raw status JSON lines (as delivered by the Twitter streaming API)
+    or existing recordings (JSON array or NDJSON chunks). Files can be compressed (see twista.compression).
+    """
+    with compression.open(file, 'rt') as f:
+        head = f.read(1)
+        while head.isspace():
+            head = f.read(1)
+        if head == '[':
+            yield from json.loads(head + f.read())
+            return
+        for line in [head + f.readline(), *f] if head else []:
+            if line.strip():
+                yield line
+
+def replay(files, chunksize, format='json', depth=2, directory='.', rate=0, users=0, refresh=86400, wal=None, workers=0, backlog=10000, backpressure='block', codec='gzip', level=None):
+    """
+    Feeds raw statuses or recorded entities through the Recorder pipeline without a Twitter connection.
+    Replays as fast as possible or with rate statuses (or recorded entities) per second.
+    wal is None (in-memory only) or a (n, ms) tuple enabling the write-ahead segment.
+    With workers > 0 raw statuses are normalized by a multi-process pipeline (recorded entities are not).
+    Returns a throughput report.
+    """
+    os.makedirs(directory, exist_ok=True)
+    recorder = Recorder(chunksize, format, depth, directory, Snapshots(users, refresh) if users else None, wal, codec, level)
+    pipeline = Pipeline(recorder, workers, backlog, backpressure) if workers else None
+    fed = 0
+    start = time.time()
+    for file in files:
+        for data in lines(file):
+            if isinstance(data, str) and pipeline and not data.startswith('{"twista"'):
+                pipeline.on_data(data)
+            else:
+                data = json.loads(data) if isinstance(data, str) else data
+                if 'twista' in data:
+                    recorder.collect([data])
+                elif 'in_reply_to_status_id' in data:
+                    recorder.on_status(types.SimpleNamespace(_json=data))
+                else:
+                    continue
+            fed += 1
+            if rate:
+                delay = start + fed / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+    if pipeline:
+        pipeline.stop()
+    recorder.write()
+    recorder.writer.drain()
+    duration = max(time.time() - start, 1e-9)
+
+    chunks = [f for f in recorder.chunks if os.path.exists(f)]
+    return {
+        'statuses': recorder.statuses,
+        'entities': recorder.recorded,
+        'seconds': duration,
+        'statuses_per_second': recorder.statuses / duration,
+        'entities_per_second': recorder.recorded / duration,
+        'chunks': len(chunks),
+        'bytes_written': sum(os.path.getsize(f) for f in chunks),
+        'users_skipped': recorder.snapshots.skipped if recorder.snapshots else 0,
+        'wal': wal,
+        'workers': workers,
+        'dropped': pipeline.dropped if pipeline else 0,
+        'peak_rss': peak_rss(),
+        'writer': recorder.writer.stats()
+    }
+
+def print_report(report):
+    print(colored("Replay finished", "green"))
+    print(f"Statuses:      {report['statuses']} ({report['statuses_per_second']:.1f}/s)")
+    print(f"Entities:      {report['entities']} ({report['entities_per_second']:.1f}/s)")
+    print(f"Duration:      {report['seconds']:.2f}s")
+    print(f"Chunks:        {report['chunks']} ({report['bytes_written']} bytes written)")
+    print(f"Users skipped: {report['users_skipped']}")
+    print(f"Write-ahead:   {'every %d entities or %d ms' % report['wal'] if report['wal'] else 'off'}")
+    print(f"Workers:       {report['workers'] or 'none'} ({report['dropped']} payloads dropped)")
+    if report['peak_rss'] is not None:
+        print(f"Peak RSS:      {report['peak_rss'] / 2**20:.1f} MB")
+    print(f"Writer:        {report['writer']}")
@@ -0,0 +1,91 @@
+import sqlite3
+import uuid
+from pathlib import Path
+
+# Node labels whose ids are tracked
+LABELS = ['Tweet', 'User', 'Tag', 'Url']
+
+# Queries of the nodes of a label (formatted with the label)
+count_nodes = "MATCH (n:{}) RETURN count(n)"
+node_ids = "MATCH (n:{}) RETURN n.id"
+
+# Identity of the graph, set once on the import generation node (a reset database gets a new one)
+graph_identity = """
+    MERGE (g:Generation{id: 'import'})
+    ON CREATE SET g.n = 0
+    SET g.graph = coalesce(g.graph, randomUUID())
+    RETURN g.graph
+    """
+
+class Seen:
+    """
+    Persistent store of the Tweet, User, Tag and Url ids already written to the graph (SQLite, next to imported.json).
+    The store is rebuilt from the graph if it is missing, was built for another graph (identified by graph_identity,
+    e.g. because the database was reset and partially imported or loaded again) or knows more ids than the graph has nodes.
+    The state of the store (see state) changes whenever ids are added or the store is created or rebuilt.
+    """
+
+    def __init__(self, graph, file='imported.db'):
+        self.graph = graph
+        exists = Path(file).exists()
+        self.db = sqlite3.connect(file)
+        self.db.execute("CREATE TABLE IF NOT EXISTS seen (label TEXT, id TEXT, PRIMARY KEY (label, id)) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if not exists or self.meta('store') is None:
+            self.renew()
+        identity = graph.run(graph_identity).single().value()
+        other = self.meta('graph') != identity
+        for label in LABELS:
+            if not exists or other or self.count(label) > graph.run(count_nodes.format(label)).single().value():
+                self.rebuild(label)
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('graph', ?)", [identity])
+        self.db.commit()
+
+    # Value of a meta key (None if missing)
+    def meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", [key]).fetchone()
+        return row[0] if row else None
+
+    # Identifies the store anew (after it was created or rebuilt)
+    def renew(self):
+        self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [('store', uuid.uuid4().hex), ('version', '0')])
+        self.db.commit()
+
+    def state(self):
+        """
+        Fingerprint of the known ids (store identity and number of additions), e.g. to tell whether
+        the split of a chunk into new and known nodes is still the same as when its import was interrupted.
+        """
+        return f"{ self.meta('store') }:{ self.meta('version') }"
+
+    # Number of known ids of a label
+    def count(self, label):
+        return self.db.execute("SELECT count(*) FROM seen WHERE label = ?", [label]).fetchone()[0]
+
+    def rebuild(self, label):
+        """Reloads all ids of a label from the graph."""
+        print(f"Rebuilding seen { label } ids from the graph")
+        self.renew()
+        self.db.execute("DELETE FROM seen WHERE label = ?", [label])
+        ids = (r[0] for r in self.graph.run(node_ids.format(label)))
+        self.db.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?)", ((label, i) for i in ids))
+        self.db.commit()
+
+    def unknown(self, label, ids):
+        """Returns the (distinct) ids not yet written, in order of their first occurrence."""
+        ids = list(dict.fromkeys(ids))
+        known = set()
+        for start in range(0, len(ids), 500):
+            part = ids[start:start + 500]
+            q = f"SELECT id FROM seen WHERE label = ? AND id IN ({ ','.join('?' * len(part)) })"
+            known.update(r[0] for r in self.db.execute(q, [label, *part]))
+        return [i for i in ids if i not in known]
+
+    def add(self, label, ids):
+        """Records ids as written (call after the transaction writing them committed)."""
+        self.db.executemany("INSERT OR IGNORE INTO seen VALUES (?, ?)", ((label, i) for i in ids))
+        self.db.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
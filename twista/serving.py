@@ -0,0 +1,126 @@
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer
+
+# Seconds a worker has to run to count as started, and maximum delay between restarts of failing workers
+GRACE = 5
+MAX_DELAY = 60
+
+class PooledServer(BaseWSGIServer):
+    """
+    WSGI server handling requests by a bounded pool of threads
+    (the threaded development server of werkzeug starts a thread per request, without limit).
+    At most backlog accepted requests (defaults to 4 per thread) wait for a thread, further requests are rejected
+    with 503 at once, so that load is shed instead of queued without limit.
+    """
+
+    multithread = True
+
+    # Response to requests exceeding the backlog
+    OVERLOADED = b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+    def __init__(self, host, port, app, threads=8, backlog=None):
+        super().__init__(host, port, app)
+        self.threads = threads
+        self.backlog = 4 * threads if backlog is None else backlog
+        self.slots = threading.BoundedSemaphore(threads + self.backlog)
+        self.rejected = 0
+        self.pool = None
+
+    def serve_forever(self):
+        # Threads do not survive a fork, so the pool is started by the serving process
+        self.pool = ThreadPoolExecutor(self.threads)
+        try:
+            super().serve_forever()
+        finally:
+            self.pool.shutdown()
+
+    def process_request(self, request, client_address):
+        if not self.slots.acquire(blocking=False):
+            self.rejected += 1
+            try:
+                request.sendall(self.OVERLOADED)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+            return
+        self.pool.submit(self.process, request, client_address)
+
+    # Handles a request in a thread of the pool
+    def process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+def serve(app, host='127.0.0.1', port=5000, workers=1, threads=8, init=None, backlog=None):
+    """
+    Serves a WSGI app by workers processes with threads threads and a backlog of waiting requests each (see PooledServer).
+    Workers are forked and share the listening socket (one process without fork support, e.g. on Windows).
+    init is called by every worker before serving, e.g. to connect to the database (connections must not be shared by processes).
+    SIGINT and SIGTERM stop all workers after their running requests, workers dying otherwise are restarted
+    (with an increasing delay while they die within GRACE seconds, e.g. because init fails).
+    """
+    server = PooledServer(host, port, app, threads, backlog)
+    print(f"Serving on http://{ host }:{ server.port } with { workers } worker(s) of { threads } thread(s)")
+    if workers <= 1 or not hasattr(os, 'fork'):
+        if init:
+            init()
+        server.serve_forever()
+        return
+
+    server.multiprocess = True
+    children = {}
+    stopped = threading.Event()
+    delay = 0
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+            try:
+                if init:
+                    init()
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        stopped.set()
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    while children:
+        try:
+            (pid, status) = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if stopped.is_set() or started is None:
+            continue
+        # Workers dying right after their start (e.g. database down) are restarted with an increasing delay
+        delay = min(max(2 * delay, 1), MAX_DELAY) if time.monotonic() - started < GRACE else 0
+        print(f"Worker { pid } exited with status { status }, restarting it" + (f" in { delay }s" if delay else ""))
+        if not stopped.wait(delay):
+            spawn()
+    server.server_close()
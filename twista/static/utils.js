@@ -1,23 +1,27 @@
 
-function loadJson(url, params, callback) {
+function loadJson(url, params, callback, failed) {
     var xmlhttp = new XMLHttpRequest();
 
     xmlhttp.onreadystatechange = function() {
         if (this.readyState == 4 && this.status == 200) {
             callback(JSON.parse(this.responseText));
+        } else if (this.readyState == 4 && failed) {
+            failed(this.status);
         }
     };
     xmlhttp.open("GET", url + "?" + buildURLQuery(params), true);
     xmlhttp.send();
 }
 
-function loadText(url, params, callback) {
+function loadText(url, params, callback, failed) {
     var xmlhttp = new XMLHttpRequest();
 
     xmlhttp.onreadystatechange = function() {
         if (this.readyState == 4 && this.status == 200) {
             callback(this.responseText);
             refreshFilter();
+        } else if (this.readyState == 4 && failed) {
+            failed(this.status);
         }
     };
     xmlhttp.open("GET", url + "?" + buildURLQuery(params), true);
@@ -39,6 +43,16 @@ function plot(into, data) {
     });
 }
 
+function fill(into, html) {
+    into.innerHTML = html;
+    refreshFilter();
+}
+
+function unavailable(into) {
+    into.querySelectorAll('.mdl-spinner').forEach(spinner => spinner.remove());
+    into.insertAdjacentHTML('afterbegin', '<p>Currently not available (the query took too long), please try again later.</p>');
+}
+
 function observeFilter() {
     document.querySelector("#filter #begin").value = localStorage.getItem("begin") || "";
     document.querySelector("#filter #end").value = localStorage.getItem("end") || "";